@@ -0,0 +1,281 @@
+"""
+Admission control for expensive endpoints.
+
+Views are tagged with a cost class:
+
+    @app.route('/api/summarize-url', methods=['POST'])
+    @admission.limit('whisper')
+    def summarize_url(): ...
+
+Each class has, per worker process:
+- a concurrency cap (ADMISSION_<CLASS>_CONCURRENCY) so minute-long jobs
+  cannot occupy every worker thread; untagged (cheap) endpoints are never
+  queued. Give each worker more threads than the sum of the caps.
+- a bounded priority queue (ADMISSION_<CLASS>_QUEUE) where requests wait at
+  most ADMISSION_<CLASS>_MAX_WAIT seconds; signed-in users (X-User-Id) are
+  admitted before anonymous callers.
+- a global and a per-user token bucket (ADMISSION_<CLASS>_RATE and
+  ADMISSION_<CLASS>_USER_RATE, requests per minute; 0 disables). A new
+  user may burst ADMISSION_<CLASS>_USER_BURST requests (default half a
+  minute's worth, at least 3): anonymous callers are keyed by IP, so a
+  classroom behind one NAT shares a bucket.
+
+A request that is rate limited, finds the queue full or outlives its wait
+is answered immediately with 429 and a Retry-After estimate instead of
+timing out. ADMISSION_ENABLED=false turns all of this off.
+"""
+import functools
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+
+from flask import Response, jsonify, request
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# name -> (concurrency, queue length, max wait seconds, global rate/min, per-user rate/min)
+DEFAULTS = {
+    'whisper': (2, 8, 15.0, 20, 4),
+    'llm': (8, 32, 10.0, 240, 20),
+    'export': (2, 4, 5.0, 60, 12),
+}
+
+ADMISSION_DECISIONS = metrics.registry.counter(
+    'admission_decisions_total', 'Admission outcomes by cost class', ('cost_class', 'outcome'))
+ADMISSION_WAIT = metrics.registry.histogram(
+    'admission_queue_wait_seconds', 'Time spent queued before admission', ('cost_class',),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+ADMISSION_IN_FLIGHT = metrics.registry.gauge(
+    'admission_in_flight', 'Admitted requests running', ('cost_class',))
+ADMISSION_QUEUED = metrics.registry.gauge(
+    'admission_queued', 'Requests waiting for admission', ('cost_class',))
+
+
+class RateLimiter:
+    """Non-blocking token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float, now: float = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, now: float) -> float:
+        """Take one token; returns 0 on success or the seconds until one is available."""
+        # `now` may predate construction when read before the lock was taken
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    @property
+    def idle(self):
+        return self.tokens >= self.capacity
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+    def body(self):
+        return {'error': 'Server is busy, please retry shortly.', 'reason': self.reason,
+                'retryAfter': self.retry_after}
+
+
+class CostClass:
+    MAX_USER_BUCKETS = 10000
+
+    def __init__(self, name, concurrency, max_queue, max_wait, rate_per_minute=0, user_rate_per_minute=0,
+                 user_burst=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.rate = RateLimiter(rate_per_minute / 60.0, max(1, rate_per_minute // 6)) if rate_per_minute else None
+        self.user_rate_per_minute = user_rate_per_minute
+        self.user_burst = user_burst or max(3, user_rate_per_minute // 2)
+        self._users = {}
+        self._active = 0
+        self._waiters = []              # heap of [priority, seq, admitted]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._service_time = 1.0        # EWMA of seconds per admitted request, for Retry-After
+
+    @classmethod
+    def from_env(cls, name):
+        concurrency, queue, wait, rate, user_rate = DEFAULTS[name]
+        prefix = f'ADMISSION_{name.upper()}_'
+        return cls(
+            name,
+            concurrency=int(os.getenv(prefix + 'CONCURRENCY', concurrency)),
+            max_queue=int(os.getenv(prefix + 'QUEUE', queue)),
+            max_wait=float(os.getenv(prefix + 'MAX_WAIT', wait)),
+            rate_per_minute=int(os.getenv(prefix + 'RATE', rate)),
+            user_rate_per_minute=int(os.getenv(prefix + 'USER_RATE', user_rate)),
+            user_burst=int(os.getenv(prefix + 'USER_BURST', 0)) or None,
+        )
+
+    def _gauges(self):
+        ADMISSION_IN_FLIGHT.set(self._active, cost_class=self.name)
+        ADMISSION_QUEUED.set(len(self._waiters), cost_class=self.name)
+
+    def _take_tokens(self, user_key, now):
+        """Returns the buckets that were charged; raises Rejected when one is empty."""
+        charged = []
+        if self.user_rate_per_minute:
+            bucket = self._users.get(user_key)
+            if bucket is None:
+                if len(self._users) >= self.MAX_USER_BUCKETS:
+                    # Full buckets carry no state; drop them to bound memory
+                    self._users = {k: b for k, b in self._users.items() if not b.idle}
+                bucket = self._users[user_key] = RateLimiter(self.user_rate_per_minute / 60.0, self.user_burst, now)
+            wait = bucket.take(now)
+            if wait:
+                raise Rejected('rate_limited_user', wait)
+            charged.append(bucket)
+        if self.rate is not None:
+            wait = self.rate.take(now)
+            if wait:
+                for bucket in charged:
+                    bucket.refund()
+                raise Rejected('rate_limited_global', wait)
+            charged.append(self.rate)
+        return charged
+
+    def charge(self, user_key):
+        """Apply only the token buckets (raises Rejected); the ASGI app bounds concurrency itself."""
+        with self._cond:
+            self._take_tokens(user_key, time.monotonic())
+
+    def _retry_estimate(self):
+        return self._service_time * (len(self._waiters) + 1) / max(1, self.concurrency)
+
+    def admit(self, user_key, priority, charge=True):
+        """Block until a slot is free (or raise Rejected); returns the admission start time.
+
+        With charge=False the token buckets are left alone and only the
+        concurrency cap and queue apply.
+        """
+        started = time.monotonic()
+        with self._cond:
+            charged = self._take_tokens(user_key, started) if charge else []
+            if self._active < self.concurrency and not self._waiters:
+                self._active += 1
+                self._gauges()
+                return started
+            if len(self._waiters) >= self.max_queue:
+                for bucket in charged:
+                    bucket.refund()
+                raise Rejected('queue_full', self._retry_estimate())
+
+            entry = [priority, next(self._seq), False]
+            heapq.heappush(self._waiters, entry)
+            self._gauges()
+            deadline = started + self.max_wait
+            while True:
+                if self._waiters and self._waiters[0] is entry and self._active < self.concurrency:
+                    heapq.heappop(self._waiters)
+                    self._active += 1
+                    self._gauges()
+                    self._cond.notify_all()
+                    ADMISSION_WAIT.observe(time.monotonic() - started, cost_class=self.name)
+                    return time.monotonic()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._gauges()
+                    self._cond.notify_all()
+                    for bucket in charged:
+                        bucket.refund()
+                    raise Rejected('queue_timeout', self._retry_estimate())
+                self._cond.wait(remaining)
+
+    def release(self, admitted_at):
+        with self._cond:
+            self._active -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - admitted_at)
+            self._gauges()
+            self._cond.notify_all()
+
+
+_classes = {}
+_classes_lock = threading.Lock()
+
+
+def get_class(name) -> CostClass:
+    cost_class = _classes.get(name)
+    if cost_class is None:
+        with _classes_lock:
+            cost_class = _classes.get(name)
+            if cost_class is None:
+                cost_class = _classes[name] = CostClass.from_env(name)
+    return cost_class
+
+
+def client_key(headers, remote_addr):
+    return headers.get('X-User-Id') or headers.get('X-Forwarded-For', '').split(',')[0].strip() \
+        or remote_addr or 'anonymous'
+
+
+def _client_key():
+    return client_key(request.headers, request.remote_addr)
+
+
+def _priority():
+    return 0 if request.headers.get('X-User-Id') else 1
+
+
+def limit(cost_class_name, charge=None):
+    """Decorator placing a view in a cost class (see module docstring).
+
+    `charge`, if given, is called per request; when it returns False the
+    request skips the rate limits (e.g. continuations of a paged download).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            if not ENABLED:
+                return view(*args, **kwargs)
+            cost_class = get_class(cost_class_name)
+            try:
+                admitted_at = cost_class.admit(_client_key(), _priority(), charge is None or charge())
+            except Rejected as rejected:
+                ADMISSION_DECISIONS.inc(cost_class=cost_class_name, outcome=rejected.reason)
+                log.info("Shed %s request (%s), retry after %ss", cost_class_name, rejected.reason,
+                         rejected.retry_after)
+                response = jsonify(rejected.body())
+                response.status_code = 429
+                response.headers['Retry-After'] = str(rejected.retry_after)
+                return response
+            ADMISSION_DECISIONS.inc(cost_class=cost_class_name, outcome='admitted')
+
+            release = functools.partial(cost_class.release, admitted_at)
+            try:
+                result = view(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            if isinstance(result, Response) and result.is_streamed:
+                # Keep the slot until the streamed body has been sent
+                result.call_on_close(release)
+            else:
+                release()
+            return result
+        return wrapped
+    return decorator
@@ -0,0 +1,286 @@
+"""
+Quiz analytics counters shared by all worker processes.
+
+Replaces the per-process ANALYTICS dict. Counters live in a small SQLite
+database in WAL mode (ANALYTICS_DB, default <tmp>/sla-analytics.sqlite3) that
+every worker on the host opens:
+
+- `record_quiz()` only merges the deltas into an in-process buffer; a
+  background thread flushes the buffer every ANALYTICS_FLUSH_INTERVAL
+  seconds as one transaction of `INSERT ... ON CONFLICT DO UPDATE SET
+  n = n + excluded.n` upserts, so increments from different workers add up
+  atomically and request threads never wait on SQLite.
+- Reads come from an immutable snapshot that is swapped in at most every
+  ANALYTICS_SNAPSHOT_TTL seconds, plus this process's unflushed deltas.
+- Sessions not updated for ANALYTICS_SESSION_TTL seconds are deleted and the
+  WAL is checkpointed every ANALYTICS_COMPACT_INTERVAL seconds.
+
+Up to one flush interval of increments can be lost if a worker is killed.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS overall (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    quizzes INTEGER NOT NULL DEFAULT 0,
+    questions INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    last_score REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sessions_updated_at ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS session_topics (
+    session_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, topic)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value REAL
+);
+"""
+
+_OVERALL_KEYS = ('quizzesSubmitted', 'questionsAnswered', 'correctAnswers')
+
+
+def _empty_session():
+    return {'quizzesSubmitted': 0, 'questionsAnswered': 0, 'correctAnswers': 0, 'lastScore': 0.0,
+            'topics': {}, 'updatedAt': 0.0}
+
+
+class AnalyticsStore:
+    def __init__(self, path, flush_interval=1.0, snapshot_ttl=1.0, session_ttl=7 * 86400,
+                 compact_interval=600):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_ttl = snapshot_ttl
+        self.session_ttl = session_ttl
+        self.compact_interval = compact_interval
+        self._pending = {}                      # session_id -> delta dict shaped like _empty_session()
+        self._pending_lock = threading.Lock()
+        self._snapshot = ({k: 0 for k in _OVERALL_KEYS}, 0.0)
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._schema_ready = False
+        self._atexit_registered = False
+        if hasattr(os, 'register_at_fork'):
+            # The parent flushes its own buffer; a child must not count those increments again
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv('ANALYTICS_DB') or os.path.join(tempfile.gettempdir(), 'sla-analytics.sqlite3'),
+            flush_interval=float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1')),
+            snapshot_ttl=float(os.getenv('ANALYTICS_SNAPSHOT_TTL', '1')),
+            session_ttl=int(os.getenv('ANALYTICS_SESSION_TTL', str(7 * 86400))),
+            compact_interval=int(os.getenv('ANALYTICS_COMPACT_INTERVAL', '600')),
+        )
+
+    # --- connections -------------------------------------------------------
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # sqlite3 connections must not cross a fork; open one per thread per process
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                self._schema_ready = True
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # --- writes --------------------------------------------------------------
+
+    def record_quiz(self, session_id, questions, correct, score, topics):
+        """Buffer one quiz submission; `topics` is {topic: {'total': n, 'correct': n}}."""
+        now = time.time()
+        with self._pending_lock:
+            delta = self._pending.get(session_id)
+            if delta is None:
+                delta = self._pending[session_id] = _empty_session()
+            delta['quizzesSubmitted'] += 1
+            delta['questionsAnswered'] += questions
+            delta['correctAnswers'] += correct
+            delta['lastScore'] = score
+            delta['updatedAt'] = now
+            for topic, counts in topics.items():
+                t = delta['topics'].setdefault(topic, {'total': 0, 'correct': 0})
+                t['total'] += counts['total']
+                t['correct'] += counts['correct']
+        self.start()
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        totals = {k: sum(d[k] for d in pending.values()) for k in _OVERALL_KEYS}
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO overall (name, value) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                list(totals.items()))
+            conn.executemany(
+                'INSERT INTO sessions (session_id, quizzes, questions, correct, last_score, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (session_id) DO UPDATE SET '
+                'quizzes = quizzes + excluded.quizzes, questions = questions + excluded.questions, '
+                'correct = correct + excluded.correct, '
+                'last_score = CASE WHEN excluded.updated_at >= updated_at THEN excluded.last_score ELSE last_score END, '
+                'updated_at = MAX(updated_at, excluded.updated_at)',
+                [(sid, d['quizzesSubmitted'], d['questionsAnswered'], d['correctAnswers'], d['lastScore'],
+                  d['updatedAt']) for sid, d in pending.items()])
+            conn.executemany(
+                'INSERT INTO session_topics (session_id, topic, total, correct) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (session_id, topic) DO UPDATE SET '
+                'total = total + excluded.total, correct = correct + excluded.correct',
+                [(sid, topic, t['total'], t['correct'])
+                 for sid, d in pending.items() for topic, t in d['topics'].items()])
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self._requeue(pending)
+            raise
+        return len(pending)
+
+    def _requeue(self, pending):
+        with self._pending_lock:
+            for sid, d in pending.items():
+                current = self._pending.get(sid)
+                if current is None:
+                    self._pending[sid] = d
+                    continue
+                for key in _OVERALL_KEYS:
+                    current[key] += d[key]
+                for topic, t in d['topics'].items():
+                    c = current['topics'].setdefault(topic, {'total': 0, 'correct': 0})
+                    c['total'] += t['total']
+                    c['correct'] += t['correct']
+
+    # --- reads ---------------------------------------------------------------
+
+    def overall(self) -> dict:
+        snapshot, taken_at = self._snapshot
+        if time.monotonic() - taken_at > self.snapshot_ttl:
+            rows = self._conn().execute('SELECT name, value FROM overall').fetchall()
+            snapshot = {k: 0 for k in _OVERALL_KEYS}
+            snapshot.update({name: value for name, value in rows if name in snapshot})
+            # Replace the tuple in one assignment; readers never see a partial update
+            self._snapshot = (snapshot, time.monotonic())
+        result = dict(snapshot)
+        for d in list(self._pending.values()):
+            for key in _OVERALL_KEYS:
+                result[key] += d[key]
+        return result
+
+    def session(self, session_id):
+        """Stats for one session in the legacy ANALYTICS['users'][sid] shape, or None."""
+        conn = self._conn()
+        row = conn.execute('SELECT quizzes, questions, correct, last_score, updated_at FROM sessions '
+                           'WHERE session_id = ?', (session_id,)).fetchone()
+        pending = self._pending.get(session_id)
+        if row is None and pending is None:
+            return None
+        stats = _empty_session()
+        if row is not None:
+            stats.update(quizzesSubmitted=row[0], questionsAnswered=row[1], correctAnswers=row[2],
+                         lastScore=row[3], updatedAt=row[4])
+            for topic, total, correct in conn.execute(
+                    'SELECT topic, total, correct FROM session_topics WHERE session_id = ?', (session_id,)):
+                stats['topics'][topic] = {'total': total, 'correct': correct}
+        if pending is not None:
+            for key in _OVERALL_KEYS:
+                stats[key] += pending[key]
+            if pending['updatedAt'] >= stats['updatedAt']:
+                stats['lastScore'] = pending['lastScore']
+            for topic, t in list(pending['topics'].items()):
+                s = stats['topics'].setdefault(topic, {'total': 0, 'correct': 0})
+                s['total'] += t['total']
+                s['correct'] += t['correct']
+        stats.pop('updatedAt')
+        return stats
+
+    # --- maintenance -----------------------------------------------------------
+
+    def compact(self, force=False):
+        """Evict idle sessions and checkpoint the WAL; at most once per compact_interval across workers."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE name = 'compacted_at'").fetchone()
+            if not force and row and now - row[0] < self.compact_interval:
+                conn.execute('COMMIT')
+                return 0
+            cutoff = now - self.session_ttl
+            conn.execute('DELETE FROM session_topics WHERE session_id IN '
+                         '(SELECT session_id FROM sessions WHERE updated_at < ?)', (cutoff,))
+            evicted = conn.execute('DELETE FROM sessions WHERE updated_at < ?', (cutoff,)).rowcount
+            conn.execute("INSERT INTO meta (name, value) VALUES ('compacted_at', ?) "
+                         "ON CONFLICT (name) DO UPDATE SET value = excluded.value", (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        if evicted:
+            log.info("Analytics compaction evicted %d idle sessions", evicted)
+        return evicted
+
+    def start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='analytics-flush', daemon=True)
+            self._thread.start()
+        if not self._atexit_registered:
+            self._atexit_registered = True
+            atexit.register(self._flush_quietly)
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as exc:
+            log.warning("Analytics flush failed: %s", exc)
+
+    def _run(self):
+        next_compact = time.monotonic()
+        while True:
+            time.sleep(self.flush_interval)
+            self._flush_quietly()
+            if time.monotonic() >= next_compact:
+                next_compact = time.monotonic() + self.compact_interval
+                try:
+                    self.compact()
+                except Exception as exc:
+                    log.warning("Analytics compaction failed: %s", exc)
@@ -1,44 +1,67 @@
-from flask import Flask, jsonify, request, send_file, Response
+from flask import Flask, jsonify, request, send_file, Response, stream_with_context
 from flask_cors import CORS
+import click
 import io
 import base64
 import os
 import json
 import uuid
+import hashlib
 import tempfile
 import requests
 from dotenv import load_dotenv
-from openai import OpenAI
-from fpdf import FPDF
-import pdfplumber
-from youtubesearchpython import VideosSearch
-import yt_dlp
-import whisper
-from typing import List
+from typing import List, NamedTuple
 import shutil
 import subprocess
-from gtts import gTTS
 import random
 import re
 from collections import Counter, defaultdict
 import time
 import random
-import smtplib
-from email.message import EmailMessage
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-import feedparser
-from models import db, User, QuizScore, ChatHistory, ChatSession, Document, FocusAreaDismissal, LearningPath, LearningPathStep, FeynmanScore, VideoSummary, CommunityTopic, CommunityComment
-
-# --- Simple in-memory analytics store (for backward compatibility) ---
-ANALYTICS = {
-    'overall': {
-        'quizzesSubmitted': 0,
-        'questionsAnswered': 0,
-        'correctAnswers': 0
-    },
-    'users': {}
-}
+from sqlalchemy.orm import undefer
+from news_feed import news_aggregator
+from mailer import EmailDispatcher, SMTPConfig
+from logging_setup import configure_logging
+import metrics
+import profiling
+import admission
+import llm_providers
+import llm_router
+import llm_steps
+import pdf_render
+import schema
+import chat_search
+import compression
+import data_export
+import question_bank
+import retention
+import spaced_repetition
+from llm_steps import LLMCall
+from singleflight import SingleFlight, normalize_text
+from unit_of_work import unit_of_work, insert_rows, increment, update_if, touch_streak
+from pagination import InvalidCursor, keyset_page, keyset_pages, parse_limit
+from quiz_stream import QuizCollector
+from analytics_store import AnalyticsStore
+from lazy_imports import lazy_import, register_subsystem, preload as preload_subsystems
+from startup_profile import profile_startup, format_report
+from models import db, OutboundEmail, User, QuizScore, ChatHistory, ChatHistoryArchive, ChatSession, Document, FocusAreaDismissal, LearningPath, LearningPathStep, FeynmanScore, VideoSummary, CommunityTopic, CommunityComment
+
+# --- Quiz analytics counters, shared by all workers (see analytics_store.py) ---
+analytics_store = AnalyticsStore.from_env()
+
+# Heavy optional dependencies are imported on first use so workers start fast
+# (see lazy_imports.py and `flask --app app startup-profile`)
+openai = lazy_import('openai')
+pdfplumber = lazy_import('pdfplumber')
+youtubesearchpython = lazy_import('youtubesearchpython')
+yt_dlp = lazy_import('yt_dlp')
+whisper = lazy_import('whisper')
+gtts = lazy_import('gtts')
 
 load_dotenv()
 
@@ -50,19 +73,21 @@ NVIDIA_API_KEY = (
 )
 NVIDIA_API_BASE = os.getenv('NVIDIA_API_BASE', 'https://integrate.api.nvidia.com/v1')
 NVIDIA_MODEL = os.getenv('NVIDIA_MODEL', 'meta/llama-3.1-8b-instruct')
-SMTP_HOST = os.getenv('SMTP_HOST')
 
-client = OpenAI(
-    base_url=NVIDIA_API_BASE,
-    api_key=NVIDIA_API_KEY
-)
-SMTP_PORT = int(os.getenv('SMTP_PORT', '0') or 0)
-SMTP_USER = os.getenv('SMTP_USER')
-SMTP_PASS = os.getenv('SMTP_PASS')
-SMTP_FROM = os.getenv('SMTP_FROM') or SMTP_USER
+_openai_client = None
+
+def _get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai.OpenAI(base_url=NVIDIA_API_BASE, api_key=NVIDIA_API_KEY)
+    return _openai_client
 
 app = Flask(__name__)
 CORS(app)
+configure_logging(app)
+metrics.init_app(app)
+profiling.init_app(app)
+log = logging.getLogger(__name__)
 
 # Database configuration
 DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://localhost/smart_learning')
@@ -76,9 +101,125 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Initialize database
 db.init_app(app)
 
-# Create tables
-with app.app_context():
-    db.create_all()
+# Tables are created on the first request rather than at import, so importing
+# the app (CLI, preload master, tests) does not need a database round-trip
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    """Create missing tables once per process. Needs an app context."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            db.create_all()
+            # Indexes on existing tables, full-text search, compressed column
+            # types (see schema.py). Not optional: serving against a column that
+            # was not converted would bind bytes into text/json, so a failure
+            # propagates and the next request retries it.
+            schema.upgrade()
+            try:
+                # Dictionaries for the compressed columns (see compression.py)
+                compression.load_dictionaries()
+            except Exception as e:
+                log.warning("Loading compression dictionaries failed: %s", e)
+            _schema_ready = True
+
+@app.before_request
+def _ensure_schema_before_request():
+    ensure_schema()
+    compactor.start()
+
+# Verification/reset emails are queued in the DB and sent by a background worker
+email_dispatcher = EmailDispatcher(
+    app,
+    SMTPConfig.from_env(),
+    rate_per_minute=int(os.getenv('SMTP_RATE_PER_MINUTE', '30')),
+    max_attempts=int(os.getenv('EMAIL_MAX_ATTEMPTS', '5')),
+    backoff_seconds=int(os.getenv('EMAIL_RETRY_BACKOFF', '30')),
+    # false: only a separate `flask email-worker` process sends, so the rate limit is global
+    inline=os.getenv('EMAIL_INLINE_WORKER', 'true').lower() in ('1', 'true', 'yes')
+)
+
+def _email_queue_depth():
+    rows = db.session.query(OutboundEmail.status, db.func.count(OutboundEmail.id)).group_by(OutboundEmail.status).all()
+    return [('email_outbox_messages', 'gauge', 'Outbound email rows by status',
+             [({'status': status}, count) for status, count in rows])]
+
+metrics.registry.add_collector(_email_queue_depth)
+
+# Moves chat history and quiz scores past their retention to the archive tables (see retention.py)
+compactor = retention.Compactor(app)
+
+# Identical concurrent LLM / transcription work is done once per key (see singleflight.py)
+summarize_flight = SingleFlight('summarize_url')
+quiz_flight = SingleFlight('generate_quiz')
+pdf_text_flight = SingleFlight('extract_pdf_text')
+transcribe_flight = SingleFlight('transcribe')
+
+# Follow-up calls asking only for the quiz items a completion got wrong (see _generate_quiz_steps)
+QUIZ_TOPUP_ATTEMPTS = int(os.getenv('QUIZ_TOPUP_ATTEMPTS', '2'))
+QUIZ_TOKENS_PER_ITEM = int(os.getenv('QUIZ_TOKENS_PER_ITEM', '260'))
+
+@app.cli.command('email-worker')
+def email_worker_command():
+    """Run the outbound email worker in the foreground."""
+    ensure_schema()
+    email_dispatcher.run_forever()
+
+@app.cli.command('review-recompute')
+@click.option('--batch-size', default=500, help='Users recomputed per transaction.')
+def review_recompute_command(batch_size):
+    """Rebuild every learner's spaced-repetition state from quiz history."""
+    ensure_schema()
+    click.echo(json.dumps(spaced_repetition.recompute(batch_size)))
+
+@app.cli.command('retention-run')
+@click.option('--chat-days', type=int, default=None, help='Archive chat messages older than this (default RETENTION_CHAT_HISTORY_DAYS).')
+@click.option('--quiz-days', type=int, default=None, help='Archive quiz scores older than this (default RETENTION_QUIZ_SCORES_DAYS).')
+@click.option('--archive-days', type=int, default=None, help='Delete archived rows older than this (default RETENTION_ARCHIVE_DAYS).')
+@click.option('--batch-size', default=retention.BATCH_SIZE, help='Rows moved per transaction.')
+def retention_run_command(chat_days, quiz_days, archive_days, batch_size):
+    """Run one retention pass: archive old rows, update the quiz rollups, expire old archive rows."""
+    ensure_schema()
+    click.echo(json.dumps(retention.run_once(chat_days, quiz_days, archive_days, batch_size)))
+
+@app.cli.command('retention-worker')
+def retention_worker_command():
+    """Run retention passes every RETENTION_INTERVAL seconds in the foreground."""
+    ensure_schema()
+    compactor.run_forever()
+
+@app.cli.command('compression-train')
+@click.option('--column', 'name', required=True, help='Dictionary name, e.g. quiz_scores.answers_data.')
+@click.option('--samples', default=2000, help='Values sampled per column.')
+@click.option('--dict-size', default=compression.DICTIONARY_SIZE, help='Dictionary size in bytes.')
+def compression_train_command(name, samples, dict_size):
+    """Train a zstd dictionary for a compressed column on a sample of its values."""
+    ensure_schema()
+    click.echo(json.dumps(compression.train(name, samples, dict_size)))
+
+@app.cli.command('compress-columns')
+@click.option('--batch-size', default=500, help='Rows rewritten per transaction.')
+@click.option('--recompress', is_flag=True, help='Also rewrite values compressed with an older dictionary.')
+@click.option('--vacuum', is_flag=True, help='Reclaim the freed space afterwards (VACUUM; locks the tables).')
+def compress_columns_command(batch_size, recompress, vacuum):
+    """Compress column values written before compression (or with an older dictionary)."""
+    ensure_schema()
+    click.echo(json.dumps(compression.rewrite(batch_size, recompress)))
+    if vacuum:
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('VACUUM')
+
+@app.cli.command('startup-profile')
+@click.option('--top', default=25, help='Number of packages to list.')
+@click.option('--preload', default=None, help='Comma-separated subsystems to preload while profiling.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the report as JSON.')
+def startup_profile_command(top, preload, as_json):
+    """Profile `import app` with -X importtime, grouped by package."""
+    report = profile_startup('app', preload=preload)
+    click.echo(json.dumps(report, indent=2) if as_json else format_report(report, top))
 
 @app.route('/')
 def home():
@@ -86,71 +227,39 @@ def home():
 
 @app.route('/api/test', methods=['POST'])
 def test_endpoint():
-    print("DEBUG: test endpoint hit")
+    log.debug("test endpoint hit")
     return jsonify({'status': 'ok'})
 
+NEWS_COLD_START_WAIT = float(os.getenv('NEWS_COLD_START_WAIT', '3'))
+
 @app.route('/api/news', methods=['GET'])
 def get_news():
     try:
-        # Use a reputable RSS feed (e.g., BBC World News)
-        feed_url = 'http://feeds.bbci.co.uk/news/world/rss.xml'
-        feed = feedparser.parse(feed_url)
-        
-        articles = []
-        # Get random 6 headlines from the available entries
-        entries = feed.entries
-        if entries:
-            # Shuffle to show different news on refresh
-            random.shuffle(entries)
-            selected_entries = entries[:6]
-        else:
-            selected_entries = []
-
-        for entry in selected_entries:
-            articles.append({
-                'title': entry.title,
-                'link': entry.link,
-                'summary': entry.summary,
-                'published': entry.published if hasattr(entry, 'published') else ''
-            })
-            
+        # Feeds are refreshed in the background; requests only read the snapshot
+        news_aggregator.start()
+        articles = news_aggregator.sample(6)
+        if not articles and news_aggregator.wait_ready(NEWS_COLD_START_WAIT):
+            # First request after startup: the initial fetch has just landed
+            articles = news_aggregator.sample(6)
+        if not articles and any(f['error'] for f in news_aggregator.status()):
+            return jsonify({'error': 'Failed to fetch news'}), 500
+
         return jsonify({'articles': articles})
     except Exception as e:
-        print(f"Error fetching news: {e}")
+        log.error("Error fetching news: %s", e)
         return jsonify({'error': 'Failed to fetch news'}), 500
 
 def _generate_verification_code() -> str:
     return f"{random.randint(100000, 999999)}"
 
 def _send_verification_email(recipient: str, code: str) -> bool:
-    if not SMTP_HOST or not SMTP_PORT or not SMTP_USER or not SMTP_PASS:
-        print("SMTP is not fully configured; skipping email send.")
-        return False
-
-    msg = EmailMessage()
-    msg['Subject'] = 'Your Smart Learning Assistant verification code'
-    msg['From'] = SMTP_FROM or SMTP_USER
-    msg['To'] = recipient
-    msg.set_content(
+    return email_dispatcher.enqueue(
+        recipient,
+        'Your Smart Learning Assistant verification code',
         f"Hi,\n\nUse the code {code} to verify your Smart Learning Assistant account. "
         "This code expires in 15 minutes.\n\nIf you did not request this, please ignore this email."
     )
 
-    try:
-        if SMTP_PORT == 465:
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as server:
-                server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-                server.starttls()
-                server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        return True
-    except Exception as exc:
-        print(f"Failed to send verification email: {exc}")
-        return False
-
 def _queue_verification(email: str) -> bool:
     code = _generate_verification_code()
     user = User.query.filter_by(email=email).first()
@@ -161,7 +270,7 @@ def _queue_verification(email: str) -> bool:
         db.session.commit()
     sent = _send_verification_email(email, code)
     # ALWAYS print the code for debugging purposes
-    print(f"DEBUG: Verification code for {email}: {code}")
+    log.debug("Verification code for %s: %s", email, code)
     return sent
 
 def _issue_token(email: str) -> str:
@@ -347,34 +456,13 @@ def auth_resend_code():
     })
 
 def _send_reset_email(recipient: str, code: str) -> bool:
-    if not SMTP_HOST or not SMTP_PORT or not SMTP_USER or not SMTP_PASS:
-        print("SMTP is not fully configured; skipping email send.")
-        return False
-
-    msg = EmailMessage()
-    msg['Subject'] = 'Reset your Smart Learning Assistant password'
-    msg['From'] = SMTP_FROM or SMTP_USER
-    msg['To'] = recipient
-    msg.set_content(
+    return email_dispatcher.enqueue(
+        recipient,
+        'Reset your Smart Learning Assistant password',
         f"Hi,\n\nUse the code {code} to reset your password. "
         "This code expires in 15 minutes.\n\nIf you did not request this, please ignore this email."
     )
 
-    try:
-        if SMTP_PORT == 465:
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as server:
-                server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-                server.starttls()
-                server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        return True
-    except Exception as exc:
-        print(f"Failed to send reset email: {exc}")
-        return False
-
 def _queue_reset_code(email: str) -> bool:
     code = _generate_verification_code()
     user = User.query.filter_by(email=email).first()
@@ -386,7 +474,8 @@ def _queue_reset_code(email: str) -> bool:
     
     sent = _send_reset_email(email, code)
     if not sent:
-        print(f"Reset code for {email}: {code}")
+        log.warning("Reset email not sent for %s", email)
+        log.debug("Reset code for %s: %s", email, code)
     return sent
 
 @app.route('/api/auth/forgot-password', methods=['POST'])
@@ -495,10 +584,11 @@ def extract_text_from_pdf_stream(file_stream) -> str:
     collected: List[str] = []
     with pdfplumber.open(file_stream) as pdf:
         for page in pdf.pages[:10]:
-            txt = page.extract_text(x_tolerance=2, y_tolerance=3) or ''
-            if not txt or _looks_mangled(txt):
-                words = page.extract_words(x_tolerance=2, y_tolerance=3, keep_blank_chars=False)
-                txt = _reconstruct_text_from_words(words)
+            with metrics.stage_timer('pdf_extract_page'):
+                txt = page.extract_text(x_tolerance=2, y_tolerance=3) or ''
+                if not txt or _looks_mangled(txt):
+                    words = page.extract_words(x_tolerance=2, y_tolerance=3, keep_blank_chars=False)
+                    txt = _reconstruct_text_from_words(words)
             if txt and len(txt.strip()) > 30:
                 collected.append(txt.strip())
     import re
@@ -553,17 +643,18 @@ INSTRUCTIONS:
 3. {limit_instruction}
 4. Format with clear headings and bullet points using Markdown.
 """
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that summarizes videos."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+        with profiling.span('llm', '_summarize_text_with_llm gpt-3.5-turbo'):
+            response = _get_openai_client().chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that summarizes videos."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7
+            )
         return {'summary': response.choices[0].message.content}
     except Exception as e:
-        print(f"LLM Summarization failed: {e}")
+        log.error("LLM summarization failed: %s", e)
         return {'summary': "Failed to generate summary.", 'error': str(e)}
 
     # Meta-summarize
@@ -574,10 +665,10 @@ INSTRUCTIONS:
     )
     meta_format = ""
     try:
-        final_text = _nvidia_chat([
+        final_text = _llm_chat([
             {"role": "system", "content": meta_prompt + ' ' + meta_format},
             {"role": "user", "content": combined}
-        ], temperature=0.3, max_tokens=700)
+        ], temperature=0.3, max_tokens=700, caller='_summarize_text_with_llm')
     except Exception:
         final_text = combined[:min(len(combined), max_words*6)]
 
@@ -772,50 +863,35 @@ def _safe_remove(path: str) -> None:
 def _extract_audio_wav(video_path: str) -> str:
     """Extract mono 16k wav from video using ffmpeg-python. Returns wav path."""
     # Try to use imageio-ffmpeg bundled binary first
-    print("=== FFmpeg Detection Debug ===")
-    print(f"Current PATH: {os.environ.get('PATH', 'Not set')}")
     # Also check if FFmpeg is in the specific directory you mentioned
     ffmpeg_custom_path = r"C:\Users\Lakshmi Makkena\Downloads\ffmpeg-7.1.1-essentials_build\ffmpeg-7.1.1-essentials_build\bin\ffmpeg.exe"
     if os.path.exists(ffmpeg_custom_path):
-        print(f"Custom FFmpeg found at: {ffmpeg_custom_path}")
+        log.debug("Using custom FFmpeg at %s", ffmpeg_custom_path)
         os.environ['FFMPEG_BINARY'] = ffmpeg_custom_path
-        print("Using custom FFmpeg path")
         # Do not return here; proceed to use ffmpeg below
-    else:
-        print(f"Custom FFmpeg not found at: {ffmpeg_custom_path}")
-    
+
     try:
         import imageio_ffmpeg  # type: ignore
-        print("imageio-ffmpeg imported successfully")
         ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
-        print(f"imageio-ffmpeg.get_ffmpeg_exe() returned: {ffmpeg_exe}")
         
         if ffmpeg_exe and os.path.exists(ffmpeg_exe):
-            print(f"Bundled FFmpeg exists at: {ffmpeg_exe}")
             # Handle paths with spaces by wrapping in quotes for environment variable
             ffmpeg_exe_quoted = f'"{ffmpeg_exe}"' if ' ' in ffmpeg_exe else ffmpeg_exe
             os.environ['FFMPEG_BINARY'] = ffmpeg_exe_quoted
-            print(f"Using bundled FFmpeg: {ffmpeg_exe}")
-            print(f"FFMPEG_BINARY env var set to: {ffmpeg_exe_quoted}")
+            log.debug("Using bundled FFmpeg: %s", ffmpeg_exe)
         else:
-            print(f"Bundled FFmpeg path invalid or file doesn't exist: {ffmpeg_exe}")
             raise RuntimeError('imageio-ffmpeg did not provide a valid ffmpeg binary path')
     except Exception as e:
-        print(f"imageio-ffmpeg fallback failed: {e}")
-        print(f"Exception type: {type(e).__name__}")
-        import traceback
-        traceback.print_exc()
+        log.warning("imageio-ffmpeg unavailable (%s: %s); trying system FFmpeg", type(e).__name__, e)
         
         # Fall back to system ffmpeg if available
-        print("Trying system FFmpeg...")
         ffmpeg_path = shutil.which('ffmpeg')
-        print(f"shutil.which('ffmpeg') returned: {ffmpeg_path}")
         
         if ffmpeg_path:
             os.environ['FFMPEG_BINARY'] = ffmpeg_path
-            print(f"Using system FFmpeg: {ffmpeg_path}")
+            log.debug("Using system FFmpeg: %s", ffmpeg_path)
         else:
-            print("System FFmpeg not found in PATH")
+            log.error("FFmpeg not found in PATH")
             raise RuntimeError(
                 'FFmpeg not available. Install FFmpeg (https://www.gyan.dev/ffmpeg/builds/) and add to PATH, '
                 'or ensure imageio-ffmpeg fallback can download the binary.'
@@ -825,24 +901,47 @@ def _extract_audio_wav(video_path: str) -> str:
     wav_fd, wav_path = tempfile.mkstemp(suffix='.wav')
     os.close(wav_fd)
     try:
-        (
-            ffmpeg
-            .input(video_path)
-            .output(wav_path, acodec='pcm_s16le', ac=1, ar='16000', vn=None)
-            .overwrite_output()
-            .run(quiet=True)
-        )
+        with metrics.stage_timer('ffmpeg_decode'):
+            (
+                ffmpeg
+                .input(video_path)
+                .output(wav_path, acodec='pcm_s16le', ac=1, ar='16000', vn=None)
+                .overwrite_output()
+                .run(quiet=True)
+            )
         return wav_path
     except Exception as e:
         _safe_remove(wav_path)
         raise
 
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base')
+_whisper_model = None
+_whisper_lock = threading.Lock()
+
+def _get_whisper_model():
+    """Load the Whisper model once per process (use 'base' for speed/accuracy balance)."""
+    global _whisper_model
+    if _whisper_model is None:
+        with _whisper_lock:
+            if _whisper_model is None:
+                with metrics.stage_timer('whisper_load'):
+                    _whisper_model = whisper.load_model(WHISPER_MODEL)
+    return _whisper_model
+
+# transcribe() installs kv-cache hooks on the shared model, so concurrent
+# calls would read each other's cache; run them one at a time
+_whisper_transcribe_lock = threading.Lock()
+
+def _whisper_transcribe(audio_path: str, **options) -> dict:
+    model = _get_whisper_model()
+    with _whisper_transcribe_lock:
+        with metrics.stage_timer('whisper_transcribe'):
+            return model.transcribe(audio_path, **options)
+
 def _transcribe_wav(wav_path: str) -> str:
     """Try local Whisper if available; otherwise return placeholder text."""
     try:
-        import whisper  # type: ignore
-        model = whisper.load_model("base")
-        result = model.transcribe(wav_path, language=None)
+        result = _whisper_transcribe(wav_path, language=None)
         text = (result.get('text') or '').strip()
         if text:
             return text
@@ -875,14 +974,15 @@ def save_video_summary():
             summary_text=summary_text,
             video_url=video_url
         )
-        db.session.add(new_summary)
-        if user:
-            _update_user_streak(user)
-        db.session.commit()
+        user = _get_current_user()
+        with unit_of_work():
+            db.session.add(new_summary)
+            if user:
+                touch_streak(user)
 
         return jsonify({'message': 'Summary saved successfully', 'id': new_summary.id})
     except Exception as e:
-        print(f"Error saving summary: {e}")
+        log.error("Error saving summary: %s", e)
         return jsonify({'error': 'Failed to save summary'}), 500
 
 @app.route('/api/video/saved', methods=['GET'])
@@ -892,12 +992,29 @@ def get_saved_summaries():
         return jsonify({'error': 'Unauthorized'}), 401
         
     try:
+        # Titles only; the text is fetched per summary when opened
         summaries = VideoSummary.query.filter_by(user_id=user_id).order_by(VideoSummary.created_at.desc()).all()
-        return jsonify({'summaries': [s.to_dict() for s in summaries]})
+        return jsonify({'summaries': [s.to_dict(include_text=False) for s in summaries]})
     except Exception as e:
-        print(f"Error fetching saved summaries: {e}")
+        log.error("Error fetching saved summaries: %s", e)
         return jsonify({'error': 'Failed to fetch summaries'}), 500
 
+@app.route('/api/video/saved/<int:summary_id>', methods=['GET'])
+def get_saved_summary(summary_id):
+    user_id = request.headers.get('X-User-Id')
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        summary = VideoSummary.query.filter_by(id=summary_id, user_id=user_id)\
+            .options(undefer(VideoSummary.summary_text)).first()
+        if not summary:
+            return jsonify({'error': 'Summary not found'}), 404
+        return jsonify(summary.to_dict())
+    except Exception as e:
+        log.error("Error fetching saved summary: %s", e)
+        return jsonify({'error': 'Failed to fetch summary'}), 500
+
 @app.route('/api/tts', methods=['POST'])
 def generate_tts():
     try:
@@ -910,7 +1027,7 @@ def generate_tts():
         if len(text) > 5000:
             text = text[:5000]
 
-        tts = gTTS(text=text, lang='en')
+        tts = gtts.gTTS(text=text, lang='en')
         
         # Save to memory buffer
         mp3_fp = io.BytesIO()
@@ -924,13 +1041,29 @@ def generate_tts():
             download_name="summary_audio.mp3"
         )
     except Exception as e:
-        print(f"Error generating TTS: {e}")
+        log.error("Error generating TTS: %s", e)
         return jsonify({'error': 'Failed to generate audio'}), 500
 
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _transcribe_video(video_path: str) -> str:
+    wav_path = _extract_audio_wav(video_path)
+    log.debug("Audio extracted to %s", wav_path)
+    try:
+        return _transcribe_wav(wav_path)
+    finally:
+        _safe_remove(wav_path)
+
 @app.route('/api/summarize-video', methods=['POST'])
+@admission.limit('whisper')
 def summarize_video():
     try:
-        print("=== Video Summarization Started ===")
+        log.info("Video summarization started")
 
         if not (request.content_type and 'multipart/form-data' in request.content_type):
             return jsonify({'error': 'Use multipart/form-data with field "video"'}), 400
@@ -939,51 +1072,66 @@ def summarize_video():
 
         max_words = int(request.form.get('maxWords', 250))
         video_file = request.files['video']
-        print(f"Received video file: {video_file.filename}, size: {len(video_file.read())} bytes")
-        video_file.seek(0)  # Reset file pointer after reading
+        log.debug("Received video file: %s", video_file.filename)
 
         tmp_fd, tmp_video = tempfile.mkstemp(suffix='.mp4')
         os.close(tmp_fd)
-        print(f"Created temp video file: {tmp_video}")
         video_file.save(tmp_video)
-        print(f"Video saved to temp file, size: {os.path.getsize(tmp_video)} bytes")
+        log.debug("Video saved to %s (%d bytes)", tmp_video, os.path.getsize(tmp_video))
 
-        wav_path = None
         try:
-            print("Extracting audio from video...")
-            wav_path = _extract_audio_wav(tmp_video)
-            print(f"Audio extracted to: {wav_path}")
+            # Re-uploads of the same file while it is being transcribed wait for that run
+            transcript = transcribe_flight.do(_file_sha256(tmp_video), lambda: _transcribe_video(tmp_video))
+            log.debug("Transcript length: %d characters", len(transcript))
             
-            print("Transcribing audio...")
-            transcript = _transcribe_wav(wav_path)
-            print(f"Transcript length: {len(transcript)} characters")
-            
-            print("Generating summary with LLM...")
             result = _summarize_text_with_llm(transcript, max_words=max_words)
             result.update({'status': 'success', 'warnings': ['placeholder_transcript']})
-            print("Video summarization completed successfully")
+            log.info("Video summarization completed")
             return jsonify(result)
         finally:
-            print(f"Cleaning up temp files...")
             _safe_remove(tmp_video)
-            if wav_path:
-                _safe_remove(wav_path)
     except Exception as e:
-        print(f"Video summarization error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Video summarization error: %s", e)
         return jsonify({'error': str(e)}), 500
 
+# Optional stand-in for yt-dlp metadata lookups (used by the bench/ harness)
+YTDLP_INFO_URL = os.getenv('YTDLP_INFO_URL')
+
+def _extract_video_info(url: str, ydl_opts: dict) -> dict:
+    if YTDLP_INFO_URL:
+        res = requests.get(YTDLP_INFO_URL, params={'url': url}, timeout=ydl_opts.get('socket_timeout', 10))
+        res.raise_for_status()
+        return res.json()
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
 @app.route('/api/summarize-url', methods=['POST'])
+@admission.limit('whisper')
 def summarize_url():
     try:
-        # print("DEBUG: summarize_url endpoint hit", flush=True)
         data = request.get_json() or {}
         url = (data.get('url') or '').strip()
         max_words = int(data.get('maxWords', 250))
         if not url:
             return jsonify({'error': 'No url provided'}), 400
 
+        # Identical URLs requested at once share one caption fetch / transcription / LLM call
+        body, status = summarize_flight.do(
+            (_video_key(url), str(max_words)),
+            lambda: _summarize_url_result(url, max_words),
+            publish_if=lambda r: r[1] < 500
+        )
+        return jsonify(body), status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _video_key(url: str) -> str:
+    match = re.search(r'(?:[?&]v=|youtu\.be/)([\w-]+)', url)
+    return match.group(1) if match else url.strip()
+
+def _summarize_url_result(url: str, max_words):
+    """Summarize a video URL. Returns (body, status) so the result can be shared by coalesced callers."""
+    try:
         # Check if it's a YouTube URL
         if 'youtube.com' in url or 'youtu.be' in url:
             try:
@@ -1005,8 +1153,7 @@ def summarize_url():
                             'skip_download': True,
                             'socket_timeout': 10,
                         }
-                        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                            info = ydl.extract_info(url, download=False)
+                        info = _extract_video_info(url, ydl_opts)
                         
                         captions_text = ''
                         # Prefer human subtitles; fallback to automatic captions
@@ -1061,16 +1208,16 @@ def summarize_url():
                             # Summarize captions
                             result = _summarize_text_with_llm(captions_text, max_words=max_words)
                             result.update({'video_id': video_id, 'url': url})
-                            return jsonify({'status': 'success', **result})
+                            return {'status': 'success', **result}, 200
                             
                     except Exception as e:
-                        print(f"YouTube caption fetch failed: {e}")
+                        log.warning("YouTube caption fetch failed: %s", e)
                         # Fall through to normal processing (or error)
                         pass
         
                 # Fallback: attempt audio download and local transcription using Whisper
                 try:
-                    print("DEBUG: Captions unavailable, attempting audio download...", flush=True)
+                    log.info("Captions unavailable, attempting audio download")
                     with tempfile.TemporaryDirectory() as temp_dir:
                         # Configure yt-dlp to download audio
                         ydl_opts_audio = {
@@ -1095,14 +1242,11 @@ def summarize_url():
                                     break
                         
                         if audio_path and os.path.exists(audio_path):
-                            print(f"DEBUG: Audio downloaded to {audio_path}, starting transcription...", flush=True)
-                            # Load Whisper model (use 'base' for speed/accuracy balance)
-                            model = whisper.load_model("base")
-                            transcription_result = model.transcribe(audio_path)
+                            log.debug("Audio downloaded to %s, starting transcription", audio_path)
+                            transcription_result = _whisper_transcribe(audio_path)
                             transcript_text = transcription_result["text"]
                             
                             if transcript_text:
-                                print("DEBUG: Transcription successful", flush=True)
                                 result = _summarize_text_with_llm(transcript_text, max_words=max_words)
                                 result.update({
                                     'status': 'success', 
@@ -1110,10 +1254,10 @@ def summarize_url():
                                     'video_id': video_id,
                                     'url': url
                                 })
-                                return jsonify(result)
+                                return result, 200
                                 
                 except Exception as e:
-                    print(f"Audio fallback failed: {e}", flush=True)
+                    log.warning("Audio fallback failed: %s", e)
                     # If fallback fails, return the guidance message
                     pass
 
@@ -1136,10 +1280,10 @@ def summarize_url():
                     'video_id': video_id,
                     'url': url
                 })
-                return jsonify(result)
+                return result, 200
 
             except Exception as e:
-                return jsonify({'error': f'Error processing YouTube URL: {str(e)}'}), 500
+                return {'error': f'Error processing YouTube URL: {str(e)}'}, 500
         else:
             # For non-YouTube URLs, provide guidance
             transcript = (
@@ -1160,40 +1304,23 @@ def summarize_url():
                 'status': 'success', 
                 'warnings': ['non_youtube_url', 'use_upload_or_transcript_tabs']
             })
-            return jsonify(result)
+            return result, 200
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-def _nvidia_chat(messages, temperature=0.7, max_tokens=1500):
-    if not NVIDIA_API_KEY:
-        raise RuntimeError('Missing NVIDIA_API_KEY environment variable')
-
-    headers = {
-        'Authorization': f'Bearer {NVIDIA_API_KEY}',
-        'Content-Type': 'application/json'
-    }
+        return {'error': str(e)}, 500
 
-    payload = {
-        'model': NVIDIA_MODEL,
-        'messages': messages,
-        'temperature': float(temperature),
-        'max_tokens': int(max_tokens),
-        'stream': False
-    }
-
-    response = requests.post(
-        f"{NVIDIA_API_BASE}/chat/completions",
-        headers=headers,
-        json=payload,
-        timeout=60
-    )
+def _llm_chat(messages, temperature=0.7, max_tokens=1500, *, caller):
+    """One chat completion from the fastest healthy provider/model (see llm_router.py)."""
+    # `caller` names the handler or helper for metrics and is the routing/hedging class (LLM_HEDGE_CALLERS)
+    return llm_router.get().chat(caller, messages, temperature, max_tokens)
 
-    if response.status_code != 200:
-        raise RuntimeError(f"NVIDIA API error: {response.status_code} - {response.text}")
+def _llm_chat_stream(messages, temperature=0.7, max_tokens=1500, *, caller):
+    """_llm_chat yielding the completion text piece by piece as the provider produces it."""
+    return llm_router.get().stream(caller, messages, temperature, max_tokens)
 
-    result = response.json()
-    return result['choices'][0]['message']['content']
+async def _llm_chat_async(messages, temperature=0.7, max_tokens=1500, caller='async'):
+    """_llm_chat awaiting the provider instead of blocking a thread (ASGI mode, see asgi.py)."""
+    return await llm_router.get().chat_async(caller, messages, temperature, max_tokens)
 
 
 def _format_paragraphs(text: str) -> str:
@@ -1220,6 +1347,33 @@ def _format_paragraphs(text: str) -> str:
         return text
 
 
+CHAT_PREVIEW_CHARS = 160
+
+def _chat_preview(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= CHAT_PREVIEW_CHARS else text[:CHAT_PREVIEW_CHARS - 1].rstrip() + '…'
+
+def _add_chat_message(session_id, user_id, user_message, ai_response, context):
+    """Add a ChatHistory row and update its session's message_count / last_message_at / last_preview (no commit)."""
+    now = datetime.utcnow()
+    entry = ChatHistory(
+        session_id=session_id,
+        user_id=user_id,
+        user_message=user_message,
+        ai_response=ai_response,
+        context=context,
+        created_at=now
+    )
+    db.session.add(entry)
+    if session_id:
+        # One UPDATE with `message_count + 1`, so concurrent messages are all counted
+        increment(ChatSession, session_id, message_count=1, values={
+            'last_message_at': now,
+            'last_preview': _chat_preview(ai_response or user_message),
+            'updated_at': now,
+        })
+    return entry
+
 @app.route('/api/chat/sessions', methods=['GET'])
 def get_chat_sessions():
     user = _get_current_user()
@@ -1227,9 +1381,15 @@ def get_chat_sessions():
         # For anonymous users, we might want to support local storage based sessions or just return empty
         # But for now, let's require auth for history or handle anonymous differently
         return jsonify({'sessions': []})
-    
-    sessions = ChatSession.query.filter_by(user_id=user.id).order_by(ChatSession.updated_at.desc()).all()
-    return jsonify({'sessions': [s.to_dict() for s in sessions]})
+
+    # Most recently active first; pass next_cursor back as `cursor` for older sessions
+    try:
+        sessions, next_cursor = keyset_page(
+            ChatSession.query.filter_by(user_id=user.id), ChatSession.updated_at, ChatSession.id,
+            request.args.get('cursor'), parse_limit(request.args.get('limit')))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'sessions': [s.to_dict() for s in sessions], 'next_cursor': next_cursor})
 
 @app.route('/api/chat/sessions/<session_id>', methods=['GET'])
 def get_chat_session(session_id):
@@ -1247,11 +1407,20 @@ def get_chat_session(session_id):
         
     if not session:
         return jsonify({'error': 'Session not found'}), 404
-        
-    messages = ChatHistory.query.filter_by(session_id=session_id).order_by(ChatHistory.created_at.asc()).all()
+
+    # Newest page first; `cursor` (the previous next_cursor) pages back to older messages, then into the archive
+    try:
+        messages, next_cursor = keyset_pages([
+            (ChatHistory.query.filter_by(session_id=session_id), ChatHistory.created_at, ChatHistory.id),
+            (ChatHistoryArchive.query.filter_by(session_id=session_id),
+             ChatHistoryArchive.created_at, ChatHistoryArchive.id),
+        ], request.args.get('cursor'), parse_limit(request.args.get('limit')))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify({
         'session': session.to_dict(),
-        'messages': [m.to_dict() for m in messages]
+        'messages': [m.to_dict() for m in reversed(messages)],
+        'next_cursor': next_cursor
     })
 
 @app.route('/api/chat/sessions', methods=['POST'])
@@ -1283,6 +1452,7 @@ def delete_chat_session(session_id):
         return jsonify({'error': 'Session not found'}), 404
         
     db.session.delete(session)
+    ChatHistoryArchive.query.filter_by(session_id=session_id).delete(synchronize_session=False)
     db.session.commit()
     return jsonify({'message': 'Session deleted'})
 
@@ -1318,7 +1488,8 @@ def upload_document():
         text = ""
         with pdfplumber.open(file) as pdf:
             for page in pdf.pages:
-                text += page.extract_text() + "\n"
+                with metrics.stage_timer('pdf_extract_page'):
+                    text += (page.extract_text() or '') + "\n"
         
         if not text.strip():
             return jsonify({'error': 'Could not extract text from PDF'}), 400
@@ -1336,7 +1507,7 @@ def upload_document():
         return jsonify(doc.to_dict())
         
     except Exception as e:
-        print(f"PDF upload error: {e}")
+        log.error("PDF upload error: %s", e)
         return jsonify({'error': 'Failed to process PDF'}), 500
 
 @app.route('/api/documents/<doc_id>', methods=['DELETE'])
@@ -1361,10 +1532,12 @@ def get_analytics_dashboard():
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
         
-    # Fetch all quiz scores for the user
+    # Fetch all quiz scores for the user, plus the totals of those already archived (see retention.py)
     scores = QuizScore.query.filter_by(user_id=user.id).order_by(QuizScore.created_at.asc()).all()
+    archived = retention.rollups(user.id)
+    archived_all = archived['all'].get('')
     
-    total_quizzes = len(scores)
+    total_quizzes = len(scores) + (archived_all.quizzes if archived_all else 0)
     if total_quizzes == 0:
         return jsonify({
             'total_quizzes': 0,
@@ -1374,7 +1547,7 @@ def get_analytics_dashboard():
         })
         
     # Calculate Average Score
-    total_score = sum(s.score_percentage for s in scores)
+    total_score = sum(s.score_percentage for s in scores) + (archived_all.score_sum if archived_all else 0)
     average_score = round(total_score / total_quizzes, 1)
     
     # Prepare Recent Activity (Last 10)
@@ -1408,18 +1581,20 @@ def get_analytics_dashboard():
 
     # 3. Subject Mastery (Bar Chart Data)
     # Group scores by topic (using crude string matching or stored topic)
-    topic_scores = defaultdict(list)
+    topic_scores = defaultdict(lambda: [0.0, 0])  # subject -> [score sum, count]
     for s in scores:
-        t = (s.quiz_title or 'General').lower()
-        # Clean up topic name a bit (remove "quiz on ", etc)
-        t = t.replace('quiz on ', '').replace(' quiz', '').strip().title()
-        topic_scores[t].append(s.score_percentage)
+        totals = topic_scores[retention.quiz_subject(s.quiz_title)]
+        totals[0] += s.score_percentage
+        totals[1] += 1
+    for t, rollup in archived['subject'].items():
+        totals = topic_scores[t]
+        totals[0] += rollup.score_sum
+        totals[1] += rollup.quizzes
     
     mastery_distribution = []
-    for t, vals in topic_scores.items():
-        if len(vals) > 0:
-            avg = sum(vals) / len(vals)
-            mastery_distribution.append({'subject': t, 'score': round(avg, 1), 'count': len(vals)})
+    for t, (total, count) in topic_scores.items():
+        if count > 0:
+            mastery_distribution.append({'subject': t, 'score': round(total / count, 1), 'count': count})
     
     # Sort by score desc and take top 5
     mastery_distribution.sort(key=lambda x: x['score'], reverse=True)
@@ -1457,6 +1632,7 @@ def get_analytics_dashboard():
 
 
 @app.route('/api/voice-qa-stream', methods=['GET'])
+@admission.limit('llm')
 def voice_qa_stream():
     try:
         question = (request.args.get('question') or '').strip()
@@ -1465,14 +1641,13 @@ def voice_qa_stream():
 
         def event_stream():
             try:
-                print(f"Starting streaming for question: {question[:50]}...")
-                answer = _nvidia_chat([
+                log.debug("Starting streaming for question: %.50s", question)
+                answer = _llm_chat([
                     {"role": "user", "content": question}
-                ], temperature=0.6, max_tokens=1500)
+                ], temperature=0.6, max_tokens=1500, caller='voice_qa_stream')
                 answer = _format_paragraphs(answer)
-                print(f"Got answer, length: {len(answer)}")
             except Exception as ai_error:
-                print(f"AI error in streaming: {ai_error}")
+                log.warning("AI error in streaming: %s", ai_error)
                 answer = (
                     "I'm unable to reach the AI service right now. Please try again, "
                     "or check your API configuration."
@@ -1484,11 +1659,10 @@ def voice_qa_stream():
                 buffer.append(w)
                 if len(buffer) >= 4 or i == len(words) - 1:
                     chunk = ' '.join(buffer)
-                    print(f"Yielding chunk: {chunk[:30]}...")
+                    log.debug("Yielding chunk: %.30s", chunk, extra={'sample_rate': 0.01})
                     yield f"data: {chunk}\n\n"
                     buffer = []
                     time.sleep(0.03)
-            print("Streaming complete, sending [DONE]")
             yield "data: [DONE]\n\n"
 
         response = Response(event_stream(), mimetype='text/event-stream')
@@ -1498,12 +1672,17 @@ def voice_qa_stream():
         response.headers['Access-Control-Allow-Headers'] = 'Cache-Control'
         return response
     except Exception as e:
-        print(f"Streaming endpoint error: {e}")
+        log.error("Streaming endpoint error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/voice-qa', methods=['POST'])
+@admission.limit('llm')
 def voice_qa():
+    return llm_steps.run(_voice_qa_steps(), _llm_chat)
+
+def _voice_qa_steps():
+    """Body of /api/voice-qa (see llm_steps)."""
     try:
         user = _get_current_user()
         
@@ -1535,7 +1714,7 @@ def voice_qa():
                 # transcript = _transcribe_wav(temp_file_path)
                 # if transcript: question = transcript
                 
-                print("Speech-to-text not implemented yet - using fallback")
+                log.info("Speech-to-text not implemented yet - using fallback")
                 
                 # Clean up temporary file
                 os.unlink(temp_file_path)
@@ -1543,7 +1722,7 @@ def voice_qa():
             except Exception as whisper_error:
                 # Fallback if speech-to-text fails
                 question = "What is artificial intelligence and how does it work?"
-                print(f"Speech-to-text error: {whisper_error}")
+                log.warning("Speech-to-text error: %s", whisper_error)
             
         else:
             # Text question
@@ -1558,8 +1737,6 @@ def voice_qa():
         
         # Use NVIDIA API for AI responses
         try:
-            print(f"Attempting NVIDIA chat. Base={NVIDIA_API_BASE}, Model={NVIDIA_MODEL}")
-            
             messages = []
             mode = request.form.get('mode') if request.content_type and 'multipart/form-data' in request.content_type else (data.get('mode') if 'data' in locals() else None)
 
@@ -1577,7 +1754,7 @@ def voice_qa():
             
             # Inject Document Context if provided (can be combined with interview)
             if document_id and user:
-                doc = Document.query.filter_by(id=document_id, user_id=user.id).first()
+                doc = Document.query.filter_by(id=document_id, user_id=user.id).options(undefer(Document.content)).first()
                 if doc:
                     # Truncate content to avoid token limits (simple approach)
                     context_text = doc.content[:10000] 
@@ -1591,16 +1768,16 @@ def voice_qa():
                             "role": "system", 
                             "content": f"You are a helpful assistant. Use the following document content to answer the user's question. If the answer is not in the document, say so.\n\nDocument Content:\n{context_text}"
                         })
-                    print(f"Using document context: {doc.filename}")
+                    log.debug("Using document context: %s", doc.filename)
             
             messages.append({"role": "user", "content": question})
             
-            answer = _nvidia_chat(messages, max_tokens=1500)
-            provider = 'nvidia'
-            print("Successfully got response from NVIDIA API")
+            answer = yield LLMCall(messages, max_tokens=1500)
+            # The router may have sent it (or a hedge) to any of LLM_CANDIDATES
+            provider = llm_router.answered_by()
         except Exception as ai_error:
-            # Fallback to hardcoded responses if NVIDIA API fails
-            print(f"NVIDIA API error: {ai_error}")
+            # Fallback to hardcoded responses if the LLM provider fails
+            log.warning("LLM provider error: %s", ai_error)
             provider = 'fallback'
             if 'artificial intelligence' in question.lower() or 'ai' in question.lower():
                 answer = "Artificial Intelligence (AI) is a branch of computer science that aims to create systems capable of performing tasks that typically require human intelligence. These tasks include learning, reasoning, problem-solving, perception, and language understanding. AI works through various techniques including machine learning, deep learning, natural language processing, and computer vision."
@@ -1641,31 +1818,22 @@ def voice_qa():
                     )
                     db.session.add(session)
                     session_id = session.id
-                else:
-                    session.updated_at = datetime.utcnow()
             
-            # Save message
-            history = ChatHistory(
-                user_id=user.id,
-                session_id=session_id,
-                user_message=question,
-                ai_response=answer,
-                context='voice_qa'
-            )
-            db.session.add(history)
+            # Save message (also bumps the session's count, preview and updated_at)
+            _add_chat_message(session_id, user.id, question, answer, 'voice_qa')
             db.session.commit()
 
         # Optionally synthesize answer to audio (MP3) when requested
         audio_b64 = None
         if want_tts and answer:
             try:
-                tts = gTTS(text=answer, lang='en', slow=False)
+                tts = gtts.gTTS(text=answer, lang='en', slow=False)
                 buf = io.BytesIO()
                 tts.write_to_fp(buf)
                 buf.seek(0)
                 audio_b64 = base64.b64encode(buf.read()).decode('utf-8')
             except Exception as tts_err:
-                print(f"TTS synthesis failed: {tts_err}")
+                log.warning("TTS synthesis failed: %s", tts_err)
 
         resp = {
             'question': question,
@@ -1698,37 +1866,9 @@ def generate_pdf():
             if not q or not a:
                 return jsonify({'error': 'Provide either items[] or question+answer'}), 400
             items = [{'question': q, 'answer': a}]
-        # Build PDF
-        pdf = FPDF()
-        pdf.set_auto_page_break(True, margin=15)
-        pdf.add_page()
-        pdf.set_title(title)
-        pdf.set_font('Arial', 'B', 16)
-        pdf.cell(0, 10, title, ln=True)
-        pdf.ln(4)
-        for idx, item in enumerate(items, start=1):
-            question_text = str(item.get('question', ''))
-            options = item.get('options', [])
-            correct_answer = item.get('correctAnswer', 0)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.multi_cell(0, 8, f"Q{idx}: {question_text}")
-            pdf.set_font('Arial', '', 12)
-            
-            if options and len(options) == 4:
-                for i, option in enumerate(options):
-                    pdf.multi_cell(0, 8, f"   {chr(65+i)}. {option}")
-            else:
-                # Fallback for old format
-                answer_text = str(item.get('answer', ''))
-                pdf.multi_cell(0, 8, f"A{idx}: {answer_text}")
-            
-            pdf.ln(2)
-        # Output to bytes
-        pdf_bytes = pdf.output(dest='S').encode('latin-1')
-        buffer = io.BytesIO(pdf_bytes)
-        buffer.seek(0)
-        return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name='qa.pdf')
+        # Rendered once per content (see pdf_render.py) and streamed from the cached file
+        return send_file(pdf_render.open_pdf('qa', title, items), mimetype='application/pdf',
+                         as_attachment=True, download_name='qa.pdf')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1740,332 +1880,390 @@ def generate_answer_key():
         title = data.get('title', 'Quiz Answer Key')
         if not items:
             return jsonify({'error': 'No items provided'}), 400
-        
-        # Build PDF with answers
-        pdf = FPDF()
-        pdf.set_auto_page_break(True, margin=15)
-        pdf.add_page()
-        pdf.set_title(title)
-        pdf.set_font('Arial', 'B', 16)
-        pdf.cell(0, 10, title, ln=True)
-        pdf.ln(4)
-        
-        for idx, item in enumerate(items, start=1):
-            question_text = str(item.get('question', ''))
-            options = item.get('options', [])
-            correct_answer = item.get('correctAnswer', 0)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.multi_cell(0, 8, f"Q{idx}: {question_text}")
-            pdf.set_font('Arial', '', 12)
-            
-            if options and len(options) == 4:
-                for i, option in enumerate(options):
-                    marker = "✓" if i == correct_answer else "○"
-                    pdf.multi_cell(0, 8, f"   {chr(65+i)}. {option} {marker}")
-            else:
-                # Fallback for old format
-                answer_text = str(item.get('answer', ''))
-                pdf.multi_cell(0, 8, f"A{idx}: {answer_text}")
-            
-            pdf.ln(2)
-        
-        # Output to bytes
-        pdf_bytes = pdf.output(dest='S').encode('latin-1')
-        buffer = io.BytesIO(pdf_bytes)
-        buffer.seek(0)
-        return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name='answer_key.pdf')
+        return send_file(pdf_render.open_pdf('answer_key', title, items), mimetype='application/pdf',
+                         as_attachment=True, download_name='answer_key.pdf')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
+    provider = llm_providers.get()
     return jsonify({'status': 'healthy', 'service': 'Smart Learning Assistant Backend (NVIDIA API)', 'nvidia': {
         'base': NVIDIA_API_BASE,
         'model': NVIDIA_MODEL,
         'key_present': bool(NVIDIA_API_KEY)
+    }, 'llm': {
+        'provider': provider.name,
+        'model': provider.model,
+        'candidates': [f'{c.name}:{c.model}' for c in llm_router.get().candidates],
+        'routes': llm_router.get().snapshot()
     }})
 
 
 @app.route('/api/generate-quiz', methods=['POST'])
+@admission.limit('llm')
 def generate_quiz():
     try:
-        num_questions = 5
-        source_text = None
-        # Accept either multipart/form-data with a PDF, or JSON with text
-        if request.content_type and 'multipart/form-data' in request.content_type:
-            num_questions = int(request.form.get('numQuestions', 5))
-            if 'pdf' not in request.files:
-                return jsonify({'error': 'No PDF file provided'}), 400
-            pdf_file = request.files['pdf']
-            # Extract text from PDF (robust)
-            source_text = extract_text_from_pdf_stream(pdf_file.stream)
+        plan, error = _quiz_request()
+        if error is not None:
+            return error
+
+        if plan.key is None:
+            generated = llm_steps.run(plan.make_steps(), _llm_chat)
         else:
-            data = request.get_json() or {}
-            num_questions = int(data.get('numQuestions', 5))
-            source_text = (data.get('text') or '').strip()
+            # A class uploading the same handout at once shares one generation
+            generated = quiz_flight.do(plan.key, lambda: llm_steps.run(plan.make_steps(), _llm_chat),
+                                       publish_if=lambda r: r[1] < 500)
+        body, status = plan.finish(*generated)
+        return jsonify(body), status
+    except Exception as e:
+        log.exception("generate_quiz failed: %s", e)
+        return jsonify({'error': str(e)}), 500
 
-        if not source_text:
-            return jsonify({'error': 'No text found to generate quiz from'}), 400
-        
-        # Debug: log the first 500 characters of extracted text
-        print(f"Extracted text preview: {source_text[:500]}...", flush=True)
-        print(f"Total text length: {len(source_text)} characters", flush=True)
-        print("DEBUG: Starting content analysis...", flush=True)
+@app.route('/api/generate-quiz-stream', methods=['POST'])
+@admission.limit('llm')
+def generate_quiz_stream():
+    """/api/generate-quiz as server-sent events: `title`, one `item` per question as soon as it is valid, then `done`."""
+    try:
+        plan, error = _quiz_request()
+        if error is not None:
+            return error
 
-        # Enhanced content analysis for better question generation
-        content_analysis = _analyze_content_for_quiz(source_text)
-        
-        system_prompt = (
-            "You are an expert assessment designer creating HIGHLY DIVERSE, content-specific multiple-choice questions.\n"
-            "OUTPUT STRICT JSON ONLY: {\"title\": \"Short Descriptive Topic Title\", \"items\":[{\"id\":\"uuid\",\"topic\":\"Specific Concept\",\"question\":\"...\",\"options\":[\"...\",\"...\",\"...\",\"...\"],\"correctAnswer\":0}]}\n"
-            "\n"
-            "MAXIMUM DIVERSITY REQUIREMENTS:\n"
-            "- Create EXTREMELY DIVERSE questions that test different cognitive levels\n"
-            "- Each question must be COMPLETELY UNIQUE in structure, approach, and content focus\n"
-            "- Vary question complexity: basic recall, comprehension, application, analysis, synthesis, evaluation\n"
-            "- Use CREATIVE question formats and phrasings\n"
-            "- Test different aspects: facts, concepts, processes, relationships, implications\n"
-            "\n"
-            "QUESTION TYPE VARIETY (use different types for each question):\n"
-            "1. DEFINITION: 'What is the precise definition of [specific term] according to the text?'\n"
-            "2. APPLICATION: 'In which scenario would [specific concept] be most effective?'\n"
-            "3. CAUSE-EFFECT: 'What is the primary cause of [specific phenomenon] mentioned?'\n"
-            "4. COMPARISON: 'How does [concept A] differ fundamentally from [concept B]?'\n"
-            "5. ANALYSIS: 'What does the author suggest about [specific topic]?'\n"
-            "6. SYNTHESIS: 'Based on the evidence presented, what conclusion can be drawn?'\n"
-            "7. EVALUATION: 'Which statement best evaluates the effectiveness of [specific method]?'\n"
-            "8. SCENARIO: 'If [specific situation] occurred, what would be the expected outcome?'\n"
-            "9. SEQUENCE: 'What is the correct order of [specific process] steps?'\n"
-            "10. IMPLICATION: 'What would happen if [specific condition] were changed?'\n"
-            "\n"
-            "CREATIVE QUESTION STRUCTURES:\n"
-            "- Use varied sentence structures and question beginnings\n"
-            "- Include scenario-based questions with specific contexts\n"
-            "- Create 'best answer' vs 'correct answer' variations\n"
-            "- Use 'according to the text' vs 'based on the information' variations\n"
-            "- Include numerical, chronological, and categorical questions\n"
-            "- Mix concrete facts with abstract concepts\n"
-            "\n"
-            "CONTENT-SPECIFIC REQUIREMENTS:\n"
-            "- Reference SPECIFIC names, dates, numbers, percentages, or unique details\n"
-            "- Use EXACT terminology and phrases from the source material\n"
-            "- Create SMART distractors that are contextually plausible but factually incorrect\n"
-            "- Ensure correct answers are DIRECTLY supported by the provided text\n"
-            "- Test comprehension of DIFFERENT sections, concepts, and details\n"
-            "- Include questions about specific examples, case studies, or data points\n"
-            "- Assign a specific 'topic' tag to each question (e.g., 'History', 'Biology', 'Python')\n"
-            "- GENERATE A SHORT, DESCRIPTIVE TITLE for the quiz based on the content (e.g., 'Introduction to Quantum Mechanics')\n"
-            "\n"
-            "TECHNICAL REQUIREMENTS:\n"
-            "- Exactly 4 options, 1 correct answer\n"
-            "- Options under 100 characters each for clarity\n"
-            "- Questions 12-35 words long\n"
-            "- NO repetitive question patterns or similar structures\n"
-            "- NO generic or template-based questions\n"
-            "- Each question must test a DIFFERENT aspect of the content\n"
-            f"- Generate exactly {num_questions} HIGHLY DIVERSE items\n"
-            "\n"
-            f"CONTENT ANALYSIS SUMMARY:\n{content_analysis}\n"
-            "\n"
-            "Create questions that test comprehensive mastery through varied cognitive approaches and content focus."
-        )
+        def sse(event, data):
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+        def generate(emit):
+            collector = QuizCollector()
+            return _stream_quiz_steps(plan.make_steps(collector), collector, emit)
 
+        def event_stream():
+            sent = set()
+
+            def unsent(items):
+                # Bank questions and fallback items never pass through collector.feed()
+                for item in items:
+                    if item['id'] not in sent:
+                        sent.add(item['id'])
+                        yield sse('item', item)
+
+            yield from unsent(plan.reused)
+            if plan.key is None:
+                generated = llm_steps.run(plan.make_steps(), _llm_chat)
+            else:
+                # Same flight as /api/generate-quiz; later requests replay the leader's items from the first
+                replay = quiz_flight.stream(plan.key, generate, publish_if=lambda r: r[1] < 500,
+                                            context=app.app_context)
+                for event, data in replay:
+                    if event == 'item':
+                        sent.add(data['id'])
+                    yield sse(event, data)
+                if replay.error is not None:
+                    log.warning("Shared quiz generation failed: %s", replay.error)
+                    yield sse('error', {'error': str(replay.error), 'status': 500})
+                    return
+                generated = replay.result
+
+            body, status = plan.finish(*generated)
+            if status >= 400:
+                yield sse('error', {'error': body.get('error'), 'status': status})
+                return
+            yield from unsent(body['items'])
+            yield sse('done', {'status': body['status'], 'title': body.get('title'), 'count': len(body['items'])})
+
+        # finish() records what the learner was served after the view has returned
+        response = Response(stream_with_context(event_stream()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except Exception as e:
+        log.exception("generate_quiz_stream failed: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+def _stream_quiz_steps(steps, collector: QuizCollector, emit):
+    """Drive quiz steps with streamed completions, emitting ('title', str) / ('item', dict) as the collector accepts them."""
+    caller = llm_steps.caller_name(steps)
+    value = error = None
+    while True:
+        done, result = llm_steps.advance(steps, value, error)
+        if done:
+            return result
+        value = error = None
+        pieces = []
         try:
-            print("DEBUG: Calling _nvidia_chat...", flush=True)
-            ai_text = _nvidia_chat([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": source_text[:6000]}  # limit payload
-            ], temperature=0.8, max_tokens=1500)  # Higher temperature for maximum diversity
-            print("DEBUG: _nvidia_chat returned successfully.", flush=True)
-
-            # Try to locate JSON in the response
-            start = ai_text.find('{')
-            end = ai_text.rfind('}')
-            items = []
-            generated_title = None
-            
-            if start != -1 and end != -1 and end > start:
-                snippet = ai_text[start:end+1]
-                try:
-                    parsed = json.loads(snippet)
-                    if isinstance(parsed, dict):
-                        items = parsed.get('items')
-                        generated_title = parsed.get('title')
-                    else:
-                        items = parsed
-                except Exception:
-                    items = []
-
-            if not items or not isinstance(items, list):
-                raise RuntimeError('Model did not return valid JSON items')
-
-            # STRICTLY enforce the requested number of questions
-            if len(items) > num_questions:
-                print(f"DEBUG: Trimming generated items from {len(items)} to {num_questions}")
-                items = items[:num_questions]
-
-            # Normalize and ensure IDs exist; enforce exactly 4 options and 1 correct
-            normalized = []
-            for it in items:
-                q = str(it.get('question', '')).strip()
-                options = it.get('options', [])
-                correct_answer = it.get('correctAnswer', 0)
-                topic = str(it.get('topic') or 'General').strip()
-                
-                # Validate options
-                if not q or not isinstance(options, list) or len(options) != 4:
-                    continue
-                
-                # Ensure all options are strings
-                options = [str(opt).strip() for opt in options if str(opt).strip()]
-                if len(options) != 4:
-                    continue
-                
-                # Validate correct answer index
-                if not isinstance(correct_answer, int) or not (0 <= correct_answer <= 3):
-                    continue
-                # Extra guard: ensure uniqueness of correct option value
-                if len(set(options)) != 4:
-                    continue
-                
-                item_id = it.get('id') or str(uuid.uuid4())
-                normalized.append({
-                    'id': item_id, 
-                    'question': q, 
-                    'options': options,
-                    'correctAnswer': correct_answer,
-                    'topic': topic
-                })
+            for piece in _llm_chat_stream(result.messages, result.temperature, result.max_tokens, caller=caller):
+                pieces.append(piece)
+                for event in collector.feed(piece):
+                    emit(event)
+            value = ''.join(pieces)
+        except Exception as exc:
+            error = exc
+
+class QuizPlan(NamedTuple):
+    """A parsed generate-quiz request (see _quiz_request)."""
+    key: tuple          # flight key of the shared generation; None when the bank covers the whole quiz
+    reused: list        # this learner's bank questions
+    make_steps: object  # (collector=None) -> steps generating the missing questions for every learner
+    finish: object      # (body, status) of the generation -> this learner's (body, status)
+
+def _quiz_request():
+    """Parse a generate-quiz request into (QuizPlan, None), or (None, error response)."""
+    user = _get_current_user()
+    user_id = user.id if user else None
+
+    # Accept either multipart/form-data with a PDF, or JSON with text
+    if request.content_type and 'multipart/form-data' in request.content_type:
+        num_questions = int(request.form.get('numQuestions', 5))
+        if 'pdf' not in request.files:
+            return None, (jsonify({'error': 'No PDF file provided'}), 400)
+        pdf_bytes = request.files['pdf'].read()
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        # Extract text from PDF (robust); identical uploads extract once
+        source_text = pdf_text_flight.do(digest, lambda: extract_text_from_pdf_stream(io.BytesIO(pdf_bytes)))
+        source = ('pdf', digest)
+    else:
+        data = request.get_json() or {}
+        num_questions = int(data.get('numQuestions', 5))
+        source_text = (data.get('text') or '').strip()
+        source = ('text', normalize_text(source_text))
+    if not source_text:
+        return None, (jsonify({'error': 'No text found to generate quiz from'}), 400)
+
+    # Questions this learner has not seen yet come from the bank; the LLM only writes the shortfall
+    bank_key = question_bank.source_hash(source_text) if question_bank.ENABLED else None
+    reused = [row.to_item() for row in question_bank.take(bank_key, user_id, num_questions)] if bank_key else []
+    missing = num_questions - len(reused)
+
+    def finish(body, status):
+        if status >= 400:
+            return body, status
+        items = reused + body['items'][:missing]
+        if bank_key and body['status'] == 'success':
+            question_bank.serve(user_id, [item['id'] for item in items])
+        title = body.get('title') or Counter(it.get('topic') or 'General' for it in items).most_common(1)[0][0]
+        return {**body, 'items': items, 'title': title, 'reused': len(reused)}, status
+
+    # The generation depends only on the source and the shortfall, so learners on the same handout share it
+    return QuizPlan(
+        key=(*source, missing) if missing else None,
+        reused=reused,
+        make_steps=lambda collector=None: _generate_quiz_steps(source_text, missing, bank_key, collector),
+        finish=finish,
+    ), None
+
+def _quiz_system_prompt(num_questions: int, content_analysis: str, asked=()):
+    """Quiz generation prompt for num_questions items; `asked` lists questions already generated, not to repeat."""
+    return (
+        "You are an expert assessment designer creating HIGHLY DIVERSE, content-specific multiple-choice questions.\n"
+        "OUTPUT STRICT JSON ONLY: {\"title\": \"Short Descriptive Topic Title\", \"items\":[{\"id\":\"uuid\",\"topic\":\"Specific Concept\",\"question\":\"...\",\"options\":[\"...\",\"...\",\"...\",\"...\"],\"correctAnswer\":0}]}\n"
+        "\n"
+        "MAXIMUM DIVERSITY REQUIREMENTS:\n"
+        "- Create EXTREMELY DIVERSE questions that test different cognitive levels\n"
+        "- Each question must be COMPLETELY UNIQUE in structure, approach, and content focus\n"
+        "- Vary question complexity: basic recall, comprehension, application, analysis, synthesis, evaluation\n"
+        "- Use CREATIVE question formats and phrasings\n"
+        "- Test different aspects: facts, concepts, processes, relationships, implications\n"
+        "\n"
+        "QUESTION TYPE VARIETY (use different types for each question):\n"
+        "1. DEFINITION: 'What is the precise definition of [specific term] according to the text?'\n"
+        "2. APPLICATION: 'In which scenario would [specific concept] be most effective?'\n"
+        "3. CAUSE-EFFECT: 'What is the primary cause of [specific phenomenon] mentioned?'\n"
+        "4. COMPARISON: 'How does [concept A] differ fundamentally from [concept B]?'\n"
+        "5. ANALYSIS: 'What does the author suggest about [specific topic]?'\n"
+        "6. SYNTHESIS: 'Based on the evidence presented, what conclusion can be drawn?'\n"
+        "7. EVALUATION: 'Which statement best evaluates the effectiveness of [specific method]?'\n"
+        "8. SCENARIO: 'If [specific situation] occurred, what would be the expected outcome?'\n"
+        "9. SEQUENCE: 'What is the correct order of [specific process] steps?'\n"
+        "10. IMPLICATION: 'What would happen if [specific condition] were changed?'\n"
+        "\n"
+        "CREATIVE QUESTION STRUCTURES:\n"
+        "- Use varied sentence structures and question beginnings\n"
+        "- Include scenario-based questions with specific contexts\n"
+        "- Create 'best answer' vs 'correct answer' variations\n"
+        "- Use 'according to the text' vs 'based on the information' variations\n"
+        "- Include numerical, chronological, and categorical questions\n"
+        "- Mix concrete facts with abstract concepts\n"
+        "\n"
+        "CONTENT-SPECIFIC REQUIREMENTS:\n"
+        "- Reference SPECIFIC names, dates, numbers, percentages, or unique details\n"
+        "- Use EXACT terminology and phrases from the source material\n"
+        "- Create SMART distractors that are contextually plausible but factually incorrect\n"
+        "- Ensure correct answers are DIRECTLY supported by the provided text\n"
+        "- Test comprehension of DIFFERENT sections, concepts, and details\n"
+        "- Include questions about specific examples, case studies, or data points\n"
+        "- Assign a specific 'topic' tag to each question (e.g., 'History', 'Biology', 'Python')\n"
+        "- GENERATE A SHORT, DESCRIPTIVE TITLE for the quiz based on the content (e.g., 'Introduction to Quantum Mechanics')\n"
+        "\n"
+        "TECHNICAL REQUIREMENTS:\n"
+        "- Exactly 4 options, 1 correct answer\n"
+        "- Options under 100 characters each for clarity\n"
+        "- Questions 12-35 words long\n"
+        "- NO repetitive question patterns or similar structures\n"
+        "- NO generic or template-based questions\n"
+        "- Each question must test a DIFFERENT aspect of the content\n"
+        f"- Generate exactly {num_questions} HIGHLY DIVERSE items\n"
+        "\n"
+        f"CONTENT ANALYSIS SUMMARY:\n{content_analysis}\n"
+        "\n"
+        "Create questions that test comprehensive mastery through varied cognitive approaches and content focus."
+        + _quiz_asked_section(asked)
+    )
 
-            if not normalized:
-                raise RuntimeError('No valid items after normalization')
+def _quiz_asked_section(asked):
+    if not asked:
+        return ''
+    listed = '\n'.join(f"- {q}" for q in asked)
+    return (
+        "\n\nTHESE QUESTIONS ARE ALREADY IN THE QUIZ. Do NOT repeat or paraphrase them; "
+        f"cover other parts of the content:\n{listed}"
+    )
 
-            return jsonify({
-                'status': 'success', 
-                'items': normalized, 
-                'title': generated_title,
-                'provider': 'nvidia'
-            })
+def _generate_quiz_steps(source_text: str, num_questions: int, bank_key=None, collector: QuizCollector = None):
+    """Generate num_questions new quiz items for source_text (see llm_steps) and add them to the bank.
 
-        except Exception as e:
-            # 1) LLM JSON repair retry with stricter instruction
+    Returns (body, status) so coalesced callers can share it; _quiz_request's finish() adds each learner's bank questions.
+    """
+    try:
+        log.debug("Quiz source text length: %d characters", len(source_text))
+
+        # The streaming view passes its own collector to see items as they arrive
+        collector = collector or QuizCollector()
+        collector.wanted = num_questions
+        if not num_questions:
+            return {'status': 'success', 'items': [], 'title': None, 'provider': None}, 200
+
+        # New questions must not repeat any question already in the bank for this source
+        if bank_key:
+            collector.preload(question_bank.fingerprints(bank_key))
+
+        # Enhanced content analysis for better question generation
+        content_analysis = _analyze_content_for_quiz(source_text)
+
+        # The first call asks for every missing item; each follow-up only for the ones still missing
+        provider = None
+        for attempt in range(1 + QUIZ_TOPUP_ATTEMPTS):
+            if not collector.missing:
+                break
+            asked = [it['question'] for it in collector.items]
+            if asked:
+                log.info("Quiz has %d/%d valid items, requesting %d more",
+                         len(asked), num_questions, collector.missing)
+                max_tokens = min(1500, 200 + QUIZ_TOKENS_PER_ITEM * collector.missing)
+            else:
+                max_tokens = 1500
+            system_prompt = _quiz_system_prompt(collector.missing, content_analysis, asked)
+            collector.start()
             try:
-                repair_prompt = (
-                    "CRITICAL: Return ONLY valid JSON in this exact format: "
-                    "{\"title\": \"Topic Title\", \"items\":[{\"id\":\"uuid\",\"topic\":\"Topic\",\"question\":\"content question\",\"options\":[\"opt1\",\"opt2\",\"opt3\",\"opt4\"],\"correctAnswer\":0}]}\n"
-                    "Each question must be UNIQUE and test different aspects of the content. "
-                    "Use specific details, names, numbers, or concepts from the text. "
-                    "No explanations, no extra text, just the JSON."
-                )
-                ai_text2 = _nvidia_chat([
-                    {"role": "system", "content": system_prompt + "\n" + repair_prompt},
-                    {"role": "user", "content": source_text[:6000]}
-                ], temperature=0.5, max_tokens=1000)
-                start2 = ai_text2.find('{')
-                end2 = ai_text2.rfind('}')
-                if start2 != -1 and end2 != -1 and end2 > start2:
-                    snippet2 = ai_text2[start2:end2+1]
-                    parsed2 = json.loads(snippet2)
-                    items2 = parsed2.get('items') if isinstance(parsed2, dict) else parsed2
-                    if isinstance(items2, list) and items2:
-                        return jsonify({'status': 'success', 'items': items2, 'provider': 'nvidia'})
-            except Exception:
-                pass
+                ai_text = yield LLMCall([
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": source_text[:6000]}  # limit payload
+                ], temperature=0.8, max_tokens=max_tokens)  # Higher temperature for maximum diversity
+            except Exception as e:
+                log.warning("Quiz generation call failed: %s", e)
+                continue
+            provider = llm_router.answered_by()
+            collector.finish(ai_text)
+
+        if collector.items:
+            if bank_key:
+                question_bank.add(bank_key, collector.items)
+            return {
+                'status': 'success',
+                'items': collector.items,
+                'title': collector.title,
+                'provider': provider
+            }, 200
+
+        # Nothing usable from the model: fallback MCQ generation from key terms and context, plus variety types
+        cleaned_text = re.sub(r'\s+', ' ', source_text).strip()
+        sentences = _split_sentences(cleaned_text)
+        terms = _key_terms(cleaned_text, top_k=20)
+        picked_terms = []
+        used_questions = set()
+        fallback_items = []
+        for term in terms:
+            if len(fallback_items) >= num_questions:
+                break
+            ctx = _best_sentence_for_term(term, sentences)
+            # Alternate between MCQ, Fill-in-the-blank, and Short-answer-as-MCQ
+            kind = len(fallback_items) % 3
+            if kind == 0:
+                mcq = _make_mcq(term, ctx, terms)
+            elif kind == 1:
+                # Fill-in-the-blank style turned into MCQ options
+                base = ctx or f"{term.title()} is an important concept in the text."
+                blanked = re.sub(rf"\b{re.escape(term)}\b", "____", base, flags=re.IGNORECASE)
+                if blanked == base or len(blanked) < 30:
+                    blanked = f"____ relates to a key concept discussed in the material."
+                correct = term.title()
+                distractors = []
+                for t in terms:
+                    if t == term:
+                        continue
+                    distractors.append(t.title())
+                    if len(distractors) >= 3:
+                        break
+                while len(distractors) < 3:
+                    distractors.append('Context')
+                opts = [correct] + distractors
+                import random
+                random.shuffle(opts)
+                mcq = {
+                    'id': str(uuid.uuid4()),
+                    'question': f"Fill in the blank: {blanked}",
+                    'options': opts,
+                    'correctAnswer': opts.index(correct)
+                }
+            else:
+                # Short-answer styled but still MCQ for grading
+                stem = f"Briefly, what is {term}? Choose the best answer."
+                correct = ctx if ctx else f"{term.title()} is a core concept described in the text."
+                if len(correct) > 100:
+                    correct = correct[:97] + '...'
+                distractors = [
+                    f"A tangential note about {terms[1] if len(terms)>1 else 'another topic'}",
+                    "A general background statement with no definition",
+                    "An example unrelated to the definition"
+                ]
+                opts = [correct] + distractors
+                import random
+                random.shuffle(opts)
+                mcq = {
+                    'id': str(uuid.uuid4()),
+                    'question': stem,
+                    'options': opts,
+                    'correctAnswer': opts.index(correct)
+                }
+            # de-duplicate by question stem
+            key = mcq['question'].lower()
+            if key in used_questions:
+                continue
+            # enforce 4 unique options and valid correct index
+            if not isinstance(mcq.get('options'), list) or len(mcq['options']) != 4 or len(set(mcq['options'])) != 4:
+                continue
+            if not isinstance(mcq.get('correctAnswer'), int) or not (0 <= mcq['correctAnswer'] <= 3):
+                continue
+            used_questions.add(key)
+            fallback_items.append(mcq)
+
+        if not fallback_items:
+            # last resort: generic questions from diverse sentences
+            for s in sentences[:num_questions]:
+                correct = s if len(s) <= 120 else s[:117] + '...'
+                opts = [correct, 'Paraphrase unrelated to topic', 'Irrelevant detail', 'Contradictory statement']
+                import random
+                random.shuffle(opts)
+                fallback_items.append({
+                    'id': str(uuid.uuid4()),
+                    'question': 'Which option best captures a main idea from the text?',
+                    'options': opts,
+                    'correctAnswer': opts.index(correct)
+                })
 
-            # 2) Smarter fallback MCQ generation from key terms and context, plus variety types
-            cleaned_text = re.sub(r'\s+', ' ', source_text).strip()
-            sentences = _split_sentences(cleaned_text)
-            terms = _key_terms(cleaned_text, top_k=20)
-            picked_terms = []
-            used_questions = set()
-            fallback_items = []
-            for term in terms:
-                if len(fallback_items) >= num_questions:
-                    break
-                ctx = _best_sentence_for_term(term, sentences)
-                # Alternate between MCQ, Fill-in-the-blank, and Short-answer-as-MCQ
-                kind = len(fallback_items) % 3
-                if kind == 0:
-                    mcq = _make_mcq(term, ctx, terms)
-                elif kind == 1:
-                    # Fill-in-the-blank style turned into MCQ options
-                    base = ctx or f"{term.title()} is an important concept in the text."
-                    blanked = re.sub(rf"\b{re.escape(term)}\b", "____", base, flags=re.IGNORECASE)
-                    if blanked == base or len(blanked) < 30:
-                        blanked = f"____ relates to a key concept discussed in the material."
-                    correct = term.title()
-                    distractors = []
-                    for t in terms:
-                        if t == term:
-                            continue
-                        distractors.append(t.title())
-                        if len(distractors) >= 3:
-                            break
-                    while len(distractors) < 3:
-                        distractors.append('Context')
-                    opts = [correct] + distractors
-                    import random
-                    random.shuffle(opts)
-                    mcq = {
-                        'id': str(uuid.uuid4()),
-                        'question': f"Fill in the blank: {blanked}",
-                        'options': opts,
-                        'correctAnswer': opts.index(correct)
-                    }
-                else:
-                    # Short-answer styled but still MCQ for grading
-                    stem = f"Briefly, what is {term}? Choose the best answer."
-                    correct = ctx if ctx else f"{term.title()} is a core concept described in the text."
-                    if len(correct) > 100:
-                        correct = correct[:97] + '...'
-                    distractors = [
-                        f"A tangential note about {terms[1] if len(terms)>1 else 'another topic'}",
-                        "A general background statement with no definition",
-                        "An example unrelated to the definition"
-                    ]
-                    opts = [correct] + distractors
-                    import random
-                    random.shuffle(opts)
-                    mcq = {
-                        'id': str(uuid.uuid4()),
-                        'question': stem,
-                        'options': opts,
-                        'correctAnswer': opts.index(correct)
-                    }
-                # de-duplicate by question stem
-                key = mcq['question'].lower()
-                if key in used_questions:
-                    continue
-                # enforce 4 unique options and valid correct index
-                if not isinstance(mcq.get('options'), list) or len(mcq['options']) != 4 or len(set(mcq['options'])) != 4:
-                    continue
-                if not isinstance(mcq.get('correctAnswer'), int) or not (0 <= mcq['correctAnswer'] <= 3):
-                    continue
-                used_questions.add(key)
-                fallback_items.append(mcq)
-
-            if not fallback_items:
-                # last resort: generic questions from diverse sentences
-                for s in sentences[:num_questions]:
-                    correct = s if len(s) <= 120 else s[:117] + '...'
-                    opts = [correct, 'Paraphrase unrelated to topic', 'Irrelevant detail', 'Contradictory statement']
-                    import random
-                    random.shuffle(opts)
-                    fallback_items.append({
-                        'id': str(uuid.uuid4()),
-                        'question': 'Which option best captures a main idea from the text?',
-                        'options': opts,
-                        'correctAnswer': opts.index(correct)
-                    })
-
-            return jsonify({'status': 'fallback', 'items': fallback_items})
+        return {'status': 'fallback', 'items': fallback_items}, 200
 
     except Exception as e:
-        print(f"DEBUG: generate_quiz failed with error: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        log.exception("generate_quiz failed: %s", e)
+        return {'error': str(e)}, 500
 
 @app.route('/api/submit-quiz', methods=['POST'])
 def submit_quiz():
@@ -2125,14 +2323,13 @@ def submit_quiz():
         # Save to database
         user = _get_current_user()
         user_id_to_save = user.id if user else data.get('user_id')
-        
-        print(f"DEBUG: submit_quiz user={user}, user_id_to_save={user_id_to_save}, headers={request.headers}")
-        
+
         quiz_score_id = None
         # Allow saving if we have a user_id OR if we want to support anonymous sessions (if model allows)
         # Assuming we want to save if we have a user_id (even from body)
         if user_id_to_save:
             try:
+                submitted_at = datetime.utcnow()
                 quiz_score = QuizScore(
                     user_id=user_id_to_save,
                     session_id=session_id,
@@ -2140,17 +2337,20 @@ def submit_quiz():
                     total_questions=total_questions,
                     correct_answers=correct_count,
                     score_percentage=round(score_percentage, 1),
-                    answers_data=results
+                    answers_data=results,
+                    created_at=submitted_at
                 )
-                db.session.add(quiz_score)
-                if user:
-                    _update_user_streak(user)
-                db.session.commit()
+                # Score, streak and review schedule land in one transaction
+                with unit_of_work():
+                    db.session.add(quiz_score)
+                    if user:
+                        touch_streak(user)
+                        spaced_repetition.record_quiz(user.id, per_topic_counts, submitted_at)
                 quiz_score_id = quiz_score.id
-                print(f"DEBUG: Saved QuizScore id={quiz_score_id} for user_id={user_id_to_save}")
+                log.debug("Saved QuizScore id=%s for user_id=%s", quiz_score_id, user_id_to_save)
             except Exception as db_error:
                 db.session.rollback()
-                print(f"Database error saving quiz score: {db_error}")
+                log.error("Database error saving quiz score: %s", db_error)
         else:
              # Fallback: Try to save with just session_id if user_id is missing (for anonymous users)
              # This depends on whether user_id is nullable in QuizScore. 
@@ -2169,35 +2369,17 @@ def submit_quiz():
                 db.session.add(quiz_score)
                 db.session.commit()
                 quiz_score_id = quiz_score.id
-                print(f"DEBUG: Saved anonymous QuizScore id={quiz_score_id} with session_id={session_id}")
+                log.debug("Saved anonymous QuizScore id=%s with session_id=%s", quiz_score_id, session_id)
              except Exception as db_error:
                 db.session.rollback()
-                print(f"Database error saving anonymous quiz score (likely user_id required): {db_error}")
+                log.warning("Database error saving anonymous quiz score (likely user_id required): %s", db_error)
 
-        # Update analytics (in-memory for backward compatibility)
+        # Update shared analytics counters (buffered; flushed in the background)
         try:
-            ANALYTICS['overall']['quizzesSubmitted'] += 1
-            ANALYTICS['overall']['questionsAnswered'] += total_questions
-            ANALYTICS['overall']['correctAnswers'] += correct_count
-            user_stats = ANALYTICS['users'].setdefault(session_id, {
-                'quizzesSubmitted': 0,
-                'questionsAnswered': 0,
-                'correctAnswers': 0,
-                'lastScore': 0.0,
-                'topics': {}
-            })
-            user_stats['quizzesSubmitted'] += 1
-            user_stats['questionsAnswered'] += total_questions
-            user_stats['correctAnswers'] += correct_count
-            user_stats['lastScore'] = round(score_percentage, 1)
-
-            # Merge per-topic counts into user_stats
-            for topic, cnts in per_topic_counts.items():
-                tstats = user_stats['topics'].setdefault(topic, {'total': 0, 'correct': 0})
-                tstats['total'] += cnts['total']
-                tstats['correct'] += cnts['correct']
-        except Exception:
-            pass
+            analytics_store.record_quiz(session_id, total_questions, correct_count,
+                                        round(score_percentage, 1), per_topic_counts)
+        except Exception as e:
+            log.warning("Analytics update failed: %s", e)
         
         return jsonify({
             'status': 'success',
@@ -2215,6 +2397,7 @@ def submit_quiz():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/summarize-transcript', methods=['POST'])
+@admission.limit('llm')
 def summarize_transcript():
     try:
         data = request.get_json() or {}
@@ -2231,7 +2414,7 @@ def summarize_transcript():
 @app.route('/api/analytics/overall', methods=['GET'])
 def analytics_overall():
     try:
-        return jsonify({'status': 'success', **ANALYTICS['overall']})
+        return jsonify({'status': 'success', **analytics_store.overall()})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2239,21 +2422,25 @@ def _get_analytics_for_session(session_id):
     # 1. Try to fetch from DB if session_id looks like a user_id
     try:
         user_id = int(session_id)
-        scores = QuizScore.query.filter_by(user_id=user_id).all()
-        if scores:
+        scores = QuizScore.query.filter_by(user_id=user_id).options(undefer(QuizScore.answers_data)).all()
+        # Archived scores only survive as totals (see retention.py); dismissed ones are already left out
+        archived = retention.rollups(user_id)
+        if scores or archived['all']:
             # Filter out dismissed scores
             dismissed = FocusAreaDismissal.query.filter_by(user_id=user_id).all()
             dismissed_ids = {d.quiz_score_id for d in dismissed}
             
             filtered_scores = [s for s in scores if s.id not in dismissed_ids]
+            active = archived['active'].get('')
             
             # Aggregate stats
             stats = {
-                'quizzesSubmitted': len(filtered_scores),
-                'questionsAnswered': sum(s.total_questions for s in filtered_scores),
-                'correctAnswers': sum(s.correct_answers for s in filtered_scores),
-                'lastScore': filtered_scores[-1].score_percentage if filtered_scores else 0,
-                'topics': {}
+                'quizzesSubmitted': len(filtered_scores) + (active.quizzes if active else 0),
+                'questionsAnswered': sum(s.total_questions for s in filtered_scores) + (active.questions if active else 0),
+                'correctAnswers': sum(s.correct_answers for s in filtered_scores) + (active.correct if active else 0),
+                'lastScore': filtered_scores[-1].score_percentage if filtered_scores else (
+                    active.last_score if active and active.last_score is not None else 0),
+                'topics': {topic: {'total': r.questions, 'correct': r.correct} for topic, r in archived['topic'].items()}
             }
             # Reconstruct topic stats
             for s in filtered_scores:
@@ -2268,33 +2455,147 @@ def _get_analytics_for_session(session_id):
     except ValueError:
         pass
     
-    # 2. Fallback to in-memory
-    return ANALYTICS['users'].get(session_id)
-
-
-
+    # 2. Fallback to the shared analytics counters (anonymous sessions)
+    return analytics_store.session(session_id)
+
+
+
+
+# --- YouTube search enrichment for learning-path plans ---
+YOUTUBE_SEARCH_WORKERS = int(os.getenv('YOUTUBE_SEARCH_WORKERS', '6'))
+YOUTUBE_SEARCH_TIMEOUT = float(os.getenv('YOUTUBE_SEARCH_TIMEOUT', '8'))
+YOUTUBE_CACHE_TTL = int(os.getenv('YOUTUBE_CACHE_TTL', str(6 * 3600)))
+YOUTUBE_CACHE_MISS_TTL = int(os.getenv('YOUTUBE_CACHE_MISS_TTL', '300'))
+YOUTUBE_CACHE_MAX = int(os.getenv('YOUTUBE_CACHE_MAX', '2000'))
+
+# normalized query -> (expires_at, video dict or None)
+_youtube_cache = {}
+# normalized query -> Future, so identical queries share one search
+_youtube_inflight = {}
+_youtube_lock = threading.Lock()
+# Threads are only spawned on first submit, so this is safe to create before a fork
+_youtube_executor = ThreadPoolExecutor(max_workers=YOUTUBE_SEARCH_WORKERS, thread_name_prefix='yt-search')
+metrics.registry.gauge('youtube_search_queue_depth', 'YouTube searches waiting for a pool thread',
+                       function=lambda: _youtube_executor._work_queue.qsize())
+
+def _normalize_video_query(query) -> str:
+    return ' '.join(str(query or '').lower().split())
+
+def _youtube_cache_get(key):
+    """Return (hit, value) for a normalized query."""
+    with _youtube_lock:
+        entry = _youtube_cache.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < time.time():
+            del _youtube_cache[key]
+            return False, None
+        return True, entry[1]
+
+def _youtube_cache_put(key, value, ttl):
+    now = time.time()
+    with _youtube_lock:
+        if len(_youtube_cache) >= YOUTUBE_CACHE_MAX:
+            # Drop expired entries first, then the ones closest to expiry
+            for k in [k for k, (exp, _) in _youtube_cache.items() if exp < now]:
+                del _youtube_cache[k]
+            if len(_youtube_cache) >= YOUTUBE_CACHE_MAX:
+                oldest = sorted(_youtube_cache.items(), key=lambda kv: kv[1][0])
+                for k, _ in oldest[:max(1, YOUTUBE_CACHE_MAX // 10)]:
+                    del _youtube_cache[k]
+        _youtube_cache[key] = (now + ttl, value)
+
+def _search_youtube(query):
+    """
+    Search YouTube for the query and return the top result's details.
+    Raises on network/search errors so failures are not cached.
+    """
+    videos_search = youtubesearchpython.VideosSearch(query, limit=1)
+    results = videos_search.result()
+    if results and results.get('result'):
+        video = results['result'][0]
+        return {
+            'link': video.get('link'),
+            'title': video.get('title'),
+            'thumbnail': video.get('thumbnails')[0]['url'] if video.get('thumbnails') else None,
+            'views': (video.get('viewCount') or {}).get('short')
+        }
+    return None
 
 def _get_youtube_video(query):
     """
-    Search YouTube for the query and return the top result's details.
+    Return the top YouTube result for the query, served from the TTL cache when possible.
     """
+    key = _normalize_video_query(query)
+    if not key:
+        return None
+    hit, cached = _youtube_cache_get(key)
+    metrics.cache_lookup('youtube_search', hit)
+    if hit:
+        return cached
+    return _fetch_youtube_video(query, key)
+
+def _fetch_youtube_video(query, key):
+    """Search YouTube and cache the result (or its absence) under `key`; callers count the cache lookup."""
     try:
-        print(f"DEBUG: Searching YouTube for: {query}", flush=True)
-        videos_search = VideosSearch(query, limit=1)
-        results = videos_search.result()
-        print(f"DEBUG: YouTube results: {results}", flush=True)
-        
-        if results and results.get('result'):
-            video = results['result'][0]
-            return {
-                'link': video.get('link'),
-                'title': video.get('title'),
-                'thumbnail': video.get('thumbnails')[0]['url'] if video.get('thumbnails') else None,
-                'views': video.get('viewCount', {}).get('short')
-            }
+        video = _search_youtube(query)
     except Exception as e:
-        print(f"Error searching YouTube for '{query}': {e}")
-    return None
+        log.warning("Error searching YouTube for %r: %s", query, e)
+        return None
+    _youtube_cache_put(key, video, YOUTUBE_CACHE_TTL if video else YOUTUBE_CACHE_MISS_TTL)
+    return video
+
+def _get_youtube_videos(queries, timeout=None):
+    """
+    Resolve many queries concurrently on the bounded search pool.
+
+    Returns {query: video dict} for every query that resolved within `timeout`
+    seconds. Slower searches keep running in the background and fill the cache
+    for the next request instead of holding this one up.
+    """
+    timeout = YOUTUBE_SEARCH_TIMEOUT if timeout is None else timeout
+    found = {}
+    pending = {}
+    for query in queries:
+        key = _normalize_video_query(query)
+        if not key:
+            continue
+        hit, cached = _youtube_cache_get(key)
+        metrics.cache_lookup('youtube_search', hit)
+        if hit:
+            if cached:
+                found[query] = cached
+            continue
+        with _youtube_lock:
+            future = _youtube_inflight.get(key)
+            if future is None:
+                future = _youtube_executor.submit(_fetch_youtube_video, query, key)
+                _youtube_inflight[key] = future
+                future.add_done_callback(lambda _f, _k=key: _youtube_inflight.pop(_k, None))
+        pending[query] = future
+
+    if pending:
+        done, not_done = wait(set(pending.values()), timeout=timeout)
+        if not_done:
+            log.info("YouTube enrichment: %d of %d searches timed out after %ss", len(not_done), len(pending), timeout)
+        for query, future in pending.items():
+            if future in done and not future.exception() and future.result():
+                found[query] = future.result()
+    return found
+
+def _enrich_steps_with_videos(steps):
+    """Attach the top YouTube result to each plan step that has a videoQuery."""
+    # The plan is model output: a videoQuery may be a list or object, which is skipped
+    queries = [(s, s['videoQuery'].strip()) for s in steps
+               if isinstance(s, dict) and isinstance(s.get('videoQuery'), str) and s['videoQuery'].strip()]
+    videos = _get_youtube_videos({query for _, query in queries})
+    for step, query in queries:
+        video_info = videos.get(query)
+        if video_info:
+            step['videoLink'] = video_info.get('link')
+            step['videoTitle'] = video_info.get('title')
+            step['videoThumbnail'] = video_info.get('thumbnail')
+            step['videoViews'] = video_info.get('views')
 
 def _get_coding_link(title, details):
     """
@@ -2311,7 +2612,12 @@ def _get_coding_link(title, details):
     return None
 
 @app.route('/api/learning-path-plan', methods=['POST'])
+@admission.limit('llm')
 def learning_path_plan():
+    return llm_steps.run(_learning_path_plan_steps(), _llm_chat)
+
+def _learning_path_plan_steps():
+    """Body of /api/learning-path-plan (see llm_steps)."""
     try:
         data = request.get_json() or {}
         topic = (data.get('topic') or '').strip()
@@ -2330,7 +2636,7 @@ def learning_path_plan():
             f"Topic: {topic}\nLevel: {level}\nDurationWeeks: {duration_weeks}\n"
             "Constraints: Focus on core concepts, practice, and assessment."
         )
-        text = _nvidia_chat([
+        text = yield LLMCall([
             {"role": "system", "content": prompt},
             {"role": "user", "content": user}
         ], temperature=0.4, max_tokens=1500)
@@ -2349,21 +2655,13 @@ def learning_path_plan():
             plan_data = json.loads(cleaned_text)
         except json.JSONDecodeError:
             # Fallback if JSON fails
-            print(f"JSON Decode Error. Raw text: {text}")
+            log.warning("Learning plan JSON decode error (%d chars of model output)", len(text))
             plan_data = [{"step": 1, "title": "Plan Generation Failed", "details": "Could not generate a structured plan. Please try again.", "videoQuery": topic}]
         
-        # Enrich plan with YouTube links
+        # Enrich plan with YouTube links (concurrent, cached, bounded by timeout)
         if isinstance(plan_data, list):
+            _enrich_steps_with_videos(plan_data)
             for step in plan_data:
-                query = step.get('videoQuery')
-                if query:
-                    video_info = _get_youtube_video(query)
-                    if video_info:
-                        step['videoLink'] = video_info['link']
-                        step['videoTitle'] = video_info['title']
-                        step['videoThumbnail'] = video_info['thumbnail']
-                        step['videoViews'] = video_info['views']
-                
                 # Add coding link if applicable
                 step['codingLink'] = _get_coding_link(step.get('title', ''), step.get('details', ''))
 
@@ -2432,36 +2730,33 @@ def _aggregate_skill_stats(user, session_id: str):
 
     This turns stored quiz answers into a stable backend source of truth
     for the adaptive learning path / skill map, instead of relying only
-    on the in-memory ANALYTICS structure.
+    on the anonymous-session analytics counters.
     """
     query = QuizScore.query
+    rollup_user_id = None
     if user:
         query = query.filter_by(user_id=user.id)
+        rollup_user_id = user.id
     else:
         # Try to interpret session_id as user_id if it's an integer
         try:
             possible_user_id = int(session_id)
             query = query.filter_by(user_id=possible_user_id)
+            rollup_user_id = possible_user_id
         except ValueError:
             # fall back to anonymous session-based tracking
             query = query.filter_by(session_id=session_id)
 
     # Order by created_at so "lastPracticedAt" is meaningful
-    scores = query.order_by(QuizScore.created_at.asc()).all()
+    scores = query.order_by(QuizScore.created_at.asc()).options(undefer(QuizScore.answers_data)).all()
 
     # Filter out dismissed topics
     dismissed_ids = set()
     if user:
         dismissed = FocusAreaDismissal.query.filter_by(user_id=user.id).all()
         dismissed_ids = {d.quiz_score_id for d in dismissed}
-        print(f"DEBUG: _aggregate_skill_stats user={user.id}, dismissed_ids={dismissed_ids}", flush=True)
-    else:
-        print(f"DEBUG: _aggregate_skill_stats user=None, session_id={session_id}", flush=True)
 
-    # The scores were already fetched by the 'query' object.
-    # We will now iterate and filter them.
-    
-    print(f"DEBUG: Found {len(scores)} scores. Filtering...", flush=True)
+    log.debug("_aggregate_skill_stats: %d scores, %d dismissed", len(scores), len(dismissed_ids))
 
     topics = {}
     overall_questions = 0
@@ -2469,7 +2764,6 @@ def _aggregate_skill_stats(user, session_id: str):
 
     for score in scores:
         if score.id in dismissed_ids:
-            print(f"DEBUG: Skipping dismissed score {score.id}", flush=True)
             continue
         
         answers = score.answers_data or []
@@ -2504,6 +2798,23 @@ def _aggregate_skill_stats(user, session_id: str):
             # naive quiz-count heuristic
             t['quizCount'] += 1
 
+    # Scores moved to the archive count through their per-topic totals (see retention.py)
+    if rollup_user_id is not None:
+        for topic, rollup in retention.rollups(rollup_user_id)['topic'].items():
+            t = topics.setdefault(topic, {
+                'questionsAnswered': 0,
+                'questionsCorrect': 0,
+                'quizCount': 0,
+                'lastPracticedAt': None,
+            })
+            t['questionsAnswered'] += rollup.questions
+            t['questionsCorrect'] += rollup.correct
+            t['quizCount'] += rollup.questions
+            if rollup.last_at is not None and (t['lastPracticedAt'] is None or rollup.last_at > t['lastPracticedAt']):
+                t['lastPracticedAt'] = rollup.last_at
+            overall_questions += rollup.questions
+            overall_correct += rollup.correct
+
     # Convert to skill objects
     skills = []
     for topic, data in topics.items():
@@ -2589,9 +2900,8 @@ def dismiss_topic():
         return jsonify({'error': 'Topic required'}), 400
         
     # Find all scores for this topic and dismiss them
-    scores = QuizScore.query.filter_by(user_id=user.id).all()
+    scores = QuizScore.query.filter_by(user_id=user.id).options(undefer(QuizScore.answers_data)).all()
     count = 0
-    print(f"DEBUG: dismiss_topic request for '{topic}' by user {user.id}. Found {len(scores)} total scores.", flush=True)
     
     for score in scores:
         answers = score.answers_data or []
@@ -2601,19 +2911,16 @@ def dismiss_topic():
         if answers:
             # simple heuristic: take first answer's topic
             score_topic = str((answers[0].get('topic') or 'general')).strip().lower()
-        
-        print(f"DEBUG: Checking score {score.id} with topic '{score_topic}' against target '{topic.strip().lower()}'", flush=True)
-            
+
         if score_topic == topic.strip().lower():
             # Check if already dismissed
             existing = FocusAreaDismissal.query.filter_by(user_id=user.id, quiz_score_id=score.id).first()
             if not existing:
                 db.session.add(FocusAreaDismissal(user_id=user.id, quiz_score_id=score.id))
                 count += 1
-                print(f"DEBUG: Dismissing score {score.id}", flush=True)
                 
     db.session.commit()
-    print(f"DEBUG: Dismissed {count} scores.", flush=True)
+    log.info("Dismissed %d of %d scores for topic %r (user %s)", count, len(scores), topic, user.id)
     return jsonify({'message': f'Dismissed {count} scores for topic {topic}'})
 
 @app.route('/api/learning-path/reset', methods=['POST'])
@@ -2624,8 +2931,9 @@ def reset_progress():
         
     # Delete all QuizScores for this user
     try:
-        QuizScore.query.filter_by(user_id=user.id).delete()
         FocusAreaDismissal.query.filter_by(user_id=user.id).delete()
+        QuizScore.query.filter_by(user_id=user.id).delete()
+        retention.delete_quiz_history(user.id)
         db.session.commit()
         return jsonify({'message': 'Progress reset successfully'})
     except Exception as e:
@@ -2655,7 +2963,7 @@ def tts_generate():
             return jsonify({'error': 'No text provided'}), 400
 
         # Generate MP3 to memory buffer
-        tts = gTTS(text=text, lang=lang, slow=slow)
+        tts = gtts.gTTS(text=text, lang=lang, slow=slow)
         buffer = io.BytesIO()
         tts.write_to_fp(buffer)
         buffer.seek(0)
@@ -2683,16 +2991,9 @@ def save_chat_history():
         user = _get_current_user()
         user_id = user.id if user else None
         
-        chat_entry = ChatHistory(
-            user_id=user_id,
-            session_id=session_id if not user_id else None,
-            user_message=user_message,
-            ai_response=ai_response,
-            context=context
-        )
-        
         try:
-            db.session.add(chat_entry)
+            chat_entry = _add_chat_message(session_id if not user_id else None, user_id,
+                                           user_message, ai_response, context)
             db.session.commit()
             return jsonify({
                 'status': 'success',
@@ -2713,28 +3014,59 @@ def get_chat_history():
         user = _get_current_user()
         session_id = request.args.get('session_id')
         context = request.args.get('context')  # Optional filter by context
-        limit = int(request.args.get('limit', 50))
-        
-        query = ChatHistory.query
+        limit = parse_limit(request.args.get('limit'))
         
         if user:
-            query = query.filter_by(user_id=user.id)
+            filters = {'user_id': user.id}
         elif session_id:
-            query = query.filter_by(session_id=session_id)
+            filters = {'session_id': session_id}
         else:
             return jsonify({'error': 'User authentication or session_id required'}), 401
         
         if context:
-            query = query.filter_by(context=context)
+            filters['context'] = context
         
-        chat_history = query.order_by(ChatHistory.created_at.desc()).limit(limit).all()
+        # Newest first; pass next_cursor back as `cursor` for the next (older) page, which may be archived
+        chat_history, next_cursor = keyset_pages([
+            (ChatHistory.query.filter_by(**filters), ChatHistory.created_at, ChatHistory.id),
+            (ChatHistoryArchive.query.filter_by(**filters), ChatHistoryArchive.created_at, ChatHistoryArchive.id),
+        ], request.args.get('cursor'), limit)
         
         return jsonify({
             'status': 'success',
             'count': len(chat_history),
-            'history': [entry.to_dict() for entry in chat_history]
+            'history': [entry.to_dict() for entry in chat_history],
+            'next_cursor': next_cursor
         })
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chat/search', methods=['GET'])
+def search_chat_history():
+    """Full-text search over the user's (or session's) chat history, best matches first"""
+    try:
+        user = _get_current_user()
+        session_id = request.args.get('session_id')
+        if not user and not session_id:
+            return jsonify({'error': 'User authentication or session_id required'}), 401
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({'error': 'q is required'}), 400
+
+        started = time.perf_counter()
+        results = chat_search.search(
+            query, user_id=user.id if user else None, session_id=None if user else session_id,
+            context=request.args.get('context'), limit=parse_limit(request.args.get('limit'), default=20))
+        return jsonify({
+            'status': 'success',
+            'query': query,
+            'count': len(results),
+            'results': results,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2745,8 +3077,12 @@ def get_quiz_scores():
         user = _get_current_user()
         session_id = request.args.get('session_id')
         limit = int(request.args.get('limit', 50))
+        # Answers are the bulk of a row; only sent with ?include=answers
+        include_answers = request.args.get('include') == 'answers'
         
         query = QuizScore.query
+        if include_answers:
+            query = query.options(undefer(QuizScore.answers_data))
         
         if user:
             query = query.filter_by(user_id=user.id)
@@ -2760,12 +3096,44 @@ def get_quiz_scores():
         return jsonify({
             'status': 'success',
             'count': len(scores),
-            'scores': [score.to_dict() for score in scores]
+            'scores': [score.to_dict(include_answers=include_answers) for score in scores]
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export', methods=['GET'])
+@admission.limit('export', charge=lambda: not data_export.issued(request.args.get('cursor')))
+def export_learning_data():
+    """Stream the user's quizzes, chats, Feynman scores, summaries and paths as NDJSON or CSV (see data_export.py)."""
+    user = _get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    fmt = request.args.get('format', 'ndjson')
+    cursor = request.args.get('cursor')
+    try:
+        types = data_export.parse_types(fmt, request.args.get('type'))
+        limit = (parse_limit(request.args['limit'], data_export.MAX_LIMIT, data_export.MAX_LIMIT)
+                 if request.args.get('limit') else None)
+        items = data_export.records(user.id, types, cursor, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    body = data_export.encode(fmt, types, items, header=not cursor)
+    gzip = request.accept_encodings.quality('gzip') > 0 and request.args.get('gzip') != '0'
+    if gzip:
+        body = data_export.gzipped(body)
+    filename = f"learning-data-{user.id}.ndjson" if fmt == 'ndjson' else f"{types[0]}-{user.id}.csv"
+    # The rows are read while the body is sent, inside the request's session
+    response = Response(stream_with_context(body),
+                        mimetype='application/x-ndjson' if fmt == 'ndjson' else 'text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 # --- Analytics Endpoints ---
 
 @app.route('/api/analytics/dashboard', methods=['GET'])
@@ -2847,31 +3215,6 @@ def analytics_dashboard():
         }
     })
 
-def _update_user_streak(user):
-    """
-    Updates the user's streak based on activity (called when they do something significant).
-    """
-    now = datetime.utcnow().date()
-    # last_activity_date is db.Date, so it's already a date object (or None)
-    last = user.last_activity_date 
-    
-    if last == now:
-        return # Already counted for today
-        
-    if last == now - timedelta(days=1):
-        # Consecutive day
-        user.current_streak = (user.current_streak or 0) + 1
-    else:
-        # Broken streak or first time
-        user.current_streak = 1
-        
-    # Update max
-    if (user.current_streak or 0) > (user.max_streak or 0):
-        user.max_streak = user.current_streak
-        
-    user.last_activity_date = now # Assign date object, not datetime
-    db.session.commit()
-
 @app.route('/api/analytics/focus-area/<int:id>', methods=['DELETE'])
 def delete_focus_area(id):
     user = _get_current_user()
@@ -2913,34 +3256,31 @@ def save_learning_path():
         if not topic or not plan:
             return jsonify({'error': 'Missing data'}), 400
             
-        # Create LearningPath
-        lp = LearningPath(
-            user_id=user.id,
-            topic=topic,
-            level=level,
-            total_steps=len(plan),
-            completed_steps=0
-        )
-        db.session.add(lp)
-        db.session.flush() # Get ID
-        
-        # Create Steps
-        for step in plan:
-            s = LearningPathStep(
-                learning_path_id=lp.id,
-                step_number=step.get('step'),
-                title=step.get('title'),
-                details=step.get('details'),
-                video_query=step.get('videoQuery'),
-                video_link=step.get('videoLink'),
-                video_title=step.get('videoTitle'),
-                video_thumbnail=step.get('videoThumbnail'),
-                video_views=step.get('videoViews'),
-                coding_link=step.get('codingLink')
+        with unit_of_work():
+            # Create LearningPath
+            lp = LearningPath(
+                user_id=user.id,
+                topic=topic,
+                level=level,
+                total_steps=len(plan),
+                completed_steps=0
             )
-            db.session.add(s)
-            
-        db.session.commit()
+            db.session.add(lp)
+            db.session.flush() # Get ID
+
+            # Create Steps (one executemany INSERT)
+            insert_rows(LearningPathStep, [{
+                'learning_path_id': lp.id,
+                'step_number': step.get('step'),
+                'title': step.get('title'),
+                'details': step.get('details'),
+                'video_query': step.get('videoQuery'),
+                'video_link': step.get('videoLink'),
+                'video_title': step.get('videoTitle'),
+                'video_thumbnail': step.get('videoThumbnail'),
+                'video_views': step.get('videoViews'),
+                'coding_link': step.get('codingLink'),
+            } for step in plan])
         return jsonify({'status': 'success', 'id': lp.id, 'message': 'Learning path saved'})
     except Exception as e:
         db.session.rollback()
@@ -2996,14 +3336,12 @@ def toggle_step_progress(step_id):
         if not step:
             return jsonify({'error': 'Not found'}), 404
             
-        step.is_completed = not step.is_completed
-        
-        # Update parent progress
         lp = step.learning_path
-        completed_count = LearningPathStep.query.filter_by(learning_path_id=lp.id, is_completed=True).count()
-        lp.completed_steps = completed_count
-        
-        db.session.commit()
+        completed = not step.is_completed
+        with unit_of_work():
+            # A concurrent toggle (double click) that flipped it first makes this a no-op
+            if update_if(LearningPathStep, step.id, {'is_completed': step.is_completed}, {'is_completed': completed}):
+                increment(LearningPath, lp.id, completed_steps=1 if completed else -1)
         
         return jsonify({
             'status': 'success', 
@@ -3039,27 +3377,22 @@ def delete_learning_path(path_id):
 
 @app.route('/api/feynman/start', methods=['POST'])
 def start_feynman_session():
-    print("DEBUG: start_feynman_session hit", flush=True)
     try:
         user = _get_current_user()
-        print(f"DEBUG: User retrieved: {user}", flush=True)
         if not user:
-            print("DEBUG: No user found, returning 401", flush=True)
             return jsonify({'error': 'Unauthorized'}), 401
 
         data = request.get_json()
-        print(f"DEBUG: Request data: {data}", flush=True)
         topic = data.get('topic')
         persona = data.get('persona', 'Curious 5-Year-Old')
 
         if not topic:
-            print("DEBUG: No topic provided", flush=True)
             return jsonify({'error': 'Topic is required'}), 400
 
         session_id = str(uuid.uuid4())
         title = f"Teaching: {topic} ({persona})"
         
-        print(f"DEBUG: Creating session {session_id}", flush=True)
+        log.debug("Creating Feynman session %s", session_id)
         session = ChatSession(
             id=session_id,
             user_id=user.id,
@@ -3067,24 +3400,14 @@ def start_feynman_session():
             mode='feynman'
         )
         db.session.add(session)
-        print("DEBUG: Session added to db session", flush=True)
         
         db.session.commit()
-        print("DEBUG: Database commit successful", flush=True)
         
         greeting = f"I'm ready to learn about {topic}! I'm a {persona}, so please explain it simply."
         
         # Save greeting to history
-        init_msg = ChatHistory(
-            session_id=session_id,
-            user_id=user.id,
-            user_message=f"I want to teach you about {topic}.",
-            ai_response=greeting,
-            context='feynman'
-        )
-        db.session.add(init_msg)
+        _add_chat_message(session_id, user.id, f"I want to teach you about {topic}.", greeting, 'feynman')
         db.session.commit()
-        print("DEBUG: Greeting saved to history", flush=True)
         
         return jsonify({
             'session_id': session_id,
@@ -3092,18 +3415,19 @@ def start_feynman_session():
             'greeting': greeting
         })
     except Exception as e:
-        print(f"ERROR in start_feynman_session: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in start_feynman_session: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/feynman/chat', methods=['POST'])
+@admission.limit('llm')
 def feynman_chat():
-    print("DEBUG: feynman_chat hit", flush=True)
+    return llm_steps.run(_feynman_chat_steps(), _llm_chat)
+
+def _feynman_chat_steps():
+    """Body of /api/feynman/chat (see llm_steps)."""
     try:
         user = _get_current_user()
         if not user:
-            print("DEBUG: Unauthorized in chat", flush=True)
             return jsonify({'error': 'Unauthorized'}), 401
 
         data = request.get_json()
@@ -3112,14 +3436,13 @@ def feynman_chat():
         topic = data.get('topic')
         persona = data.get('persona')
         
-        print(f"DEBUG: Chat request for session {session_id}", flush=True)
+        log.debug("Feynman chat request for session %s", session_id)
 
         if not session_id or not user_message:
             return jsonify({'error': 'Missing session_id or message'}), 400
 
         # Fetch chat history
         # Ensure ChatHistory is imported or available
-        print("DEBUG: Fetching history", flush=True)
         history = ChatHistory.query.filter_by(session_id=session_id).order_by(ChatHistory.created_at.asc()).all()
         
         messages = []
@@ -3139,30 +3462,25 @@ def feynman_chat():
         
         messages.append({"role": "user", "content": user_message})
 
-        print("DEBUG: Calling LLM", flush=True)
-        ai_text = _nvidia_chat(messages, temperature=0.7, max_tokens=300)
-        print("DEBUG: LLM response received", flush=True)
+        ai_text = yield LLMCall(messages, temperature=0.7, max_tokens=300)
 
         # Save to history
-        chat_entry = ChatHistory(
-            session_id=session_id,
-            user_id=user.id,
-            user_message=user_message,
-            ai_response=ai_text,
-            context='feynman'
-        )
-        db.session.add(chat_entry)
+        _add_chat_message(session_id, user.id, user_message, ai_text, 'feynman')
         db.session.commit()
-        print("DEBUG: Chat saved", flush=True)
 
         return jsonify({'response': ai_text})
 
     except Exception as e:
-        print(f"Error in feynman chat: {e}")
+        log.error("Error in feynman chat: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/feynman/evaluate', methods=['POST'])
+@admission.limit('llm')
 def evaluate_feynman_session():
+    return llm_steps.run(_evaluate_feynman_steps(), _llm_chat)
+
+def _evaluate_feynman_steps():
+    """Body of /api/feynman/evaluate (see llm_steps)."""
     user = _get_current_user()
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -3208,13 +3526,12 @@ def evaluate_feynman_session():
     """
 
     try:
-        print("DEBUG: Calling LLM for evaluation", flush=True)
-        eval_text = _nvidia_chat(
+        eval_text = yield LLMCall(
             [{"role": "user", "content": evaluation_prompt}],
             temperature=0.2,
             max_tokens=500
         )
-        print(f"DEBUG: Eval response: {eval_text}", flush=True)
+        log.debug("Feynman evaluation response: %d chars", len(eval_text))
         
         # Parse JSON from response
         import json
@@ -3233,7 +3550,7 @@ def evaluate_feynman_session():
                 # If no braces found, try loading the whole string
                 eval_data = json.loads(clean_text)
         except Exception as parse_err:
-            print(f"ERROR parsing eval JSON: {parse_err}", flush=True)
+            log.warning("Error parsing evaluation JSON: %s", parse_err)
             # Fallback: try to extract numbers using regex if JSON fails
             clarity = re.search(r'clarity_score"?\s*:\s*(\d+)', eval_text)
             depth = re.search(r'depth_score"?\s*:\s*(\d+)', eval_text)
@@ -3263,7 +3580,7 @@ def evaluate_feynman_session():
         return jsonify(score_entry.to_dict())
 
     except Exception as e:
-        print(f"Error evaluating session: {e}")
+        log.error("Error evaluating session: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -3278,6 +3595,28 @@ def analytics_user(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/review-queue', methods=['GET'])
+def review_queue():
+    """Topics due for review for the current user, most overdue first (see spaced_repetition.py)."""
+    user = _get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        now = datetime.utcnow()
+        states, upcoming = spaced_repetition.due(user.id, now, parse_limit(request.args.get('limit'), default=20))
+        items = []
+        for state in states:
+            item = state.to_dict()
+            item['overdueDays'] = (now - state.due_at).days
+            items.append(item)
+        return jsonify({
+            'status': 'success',
+            'items': items,
+            'nextDueAt': upcoming.isoformat() if upcoming else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/recommendations/<user_id>', methods=['GET'])
 def recommendations_user(user_id):
     try:
@@ -3318,8 +3657,8 @@ def recommendations_user(user_id):
 
 
 @app.route('/api/learning-path-plan', methods=['POST'])
+@admission.limit('llm')
 def generate_learning_path_plan():
-    print("DEBUG: generate_learning_path_plan hit", flush=True)
     try:
         data = request.get_json()
         topic = data.get('topic')
@@ -3336,7 +3675,8 @@ def generate_learning_path_plan():
             "Do not include any markdown formatting, just raw JSON."
         )
         
-        response_text = _nvidia_chat([{"role": "user", "content": prompt}], temperature=0.7, max_tokens=2000)
+        response_text = _llm_chat([{"role": "user", "content": prompt}], temperature=0.7, max_tokens=2000,
+                                  caller='generate_learning_path_plan')
         
         # Clean up response if it contains markdown code blocks
         if "```json" in response_text:
@@ -3350,15 +3690,8 @@ def generate_learning_path_plan():
         for step in plan_data.get('plan', []):
             if 'videoQuery' not in step:
                 step['videoQuery'] = f"{topic} {step['title']} tutorial"
-            
-            # Fetch video details
-            video_details = _get_youtube_video(step['videoQuery'])
-            if video_details:
-                step['videoLink'] = video_details.get('link')
-                step['videoTitle'] = video_details.get('title')
-                step['videoThumbnail'] = video_details.get('thumbnail')
-                step['videoViews'] = video_details.get('views')
-                
+        _enrich_steps_with_videos(plan_data.get('plan', []))
+
         return jsonify({
             'topic': topic,
             'level': level,
@@ -3367,7 +3700,7 @@ def generate_learning_path_plan():
         })
         
     except Exception as e:
-        print(f"Error generating plan: {e}")
+        log.error("Error generating plan: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -3409,9 +3742,9 @@ def create_community_topic():
             title=title,
             content=content
         )
-        db.session.add(topic)
-        _update_user_streak(user)
-        db.session.commit()
+        with unit_of_work():
+            db.session.add(topic)
+            touch_streak(user)
         return jsonify({'status': 'success', 'topic': topic.to_dict()})
     except Exception as e:
         db.session.rollback()
@@ -3523,39 +3856,42 @@ def toggle_step_action(step_id):
         path = LearningPath.query.get(step.learning_path_id)
         if path.user_id != user.id:
             return jsonify({'error': 'Unauthorized'}), 403
-            
+
+        # Work on a copy: the step is written with a compare-and-set below
+        old = {'is_completed': step.is_completed, 'video_watched': step.video_watched,
+               'code_practiced': step.code_practiced}
+        new = dict(old)
         if action == 'video':
-            step.video_watched = not step.video_watched
+            new['video_watched'] = not new['video_watched']
         elif action == 'code':
-            step.code_practiced = not step.code_practiced
+            new['code_practiced'] = not new['code_practiced']
         elif action == 'complete':
-             step.is_completed = not step.is_completed
-             if step.is_completed:
-                 step.video_watched = True
+             new['is_completed'] = not new['is_completed']
+             if new['is_completed']:
+                 new['video_watched'] = True
                  if step.coding_link:
-                     step.code_practiced = True
+                     new['code_practiced'] = True
         
         # Check auto-complete
         has_video = bool(step.video_link)
         has_code = bool(step.coding_link)
         
-        is_video_done = not has_video or step.video_watched
-        is_code_done = not has_code or step.code_practiced
+        is_video_done = not has_video or new['video_watched']
+        is_code_done = not has_code or new['code_practiced']
         
         if is_video_done and is_code_done:
-             step.is_completed = True
+             new['is_completed'] = True
         elif action != 'complete':
              # If we toggled a subtask off and it wasn't a 'complete' action, we might need to uncomplete
-             if step.is_completed:
-                 step.is_completed = False
+             if new['is_completed']:
+                 new['is_completed'] = False
 
-        db.session.commit()
-        
-        # Update path progress
-        total = len(path.steps)
-        completed = sum(1 for s in path.steps if s.is_completed)
-        path.completed_steps = completed
-        db.session.commit()
+        # Update path progress with the step, in one commit; a request that
+        # read the step before a concurrent one changed it applies nothing
+        with unit_of_work():
+            if update_if(LearningPathStep, step.id, old, new):
+                increment(LearningPath, path.id,
+                          completed_steps=int(bool(new['is_completed'])) - int(bool(old['is_completed'])))
         
         return jsonify({
             'status': 'success', 
@@ -3567,6 +3903,22 @@ def toggle_step_action(step_id):
         return jsonify({'error': str(e)}), 500
 
 
+# --- Optional preload -------------------------------------------------------
+# With PRELOAD_SUBSYSTEMS=whisper,pdf,... (and gunicorn --preload) the master
+# process warms these once so every forked worker shares them copy-on-write.
+register_subsystem('llm', _get_openai_client)
+register_subsystem('llm-local', lambda: llm_providers.get('llama_cpp').load())
+register_subsystem('pdf', lambda: (pdfplumber.open, pdf_render.warm()))
+register_subsystem('tts', lambda: gtts.gTTS)
+register_subsystem('youtube', lambda: (youtubesearchpython.VideosSearch, yt_dlp.YoutubeDL))
+register_subsystem('feeds', lambda: __import__('feedparser'))
+register_subsystem('whisper', lambda: whisper.load_model)
+register_subsystem('whisper-model', _get_whisper_model)
+
+if os.getenv('PRELOAD_SUBSYSTEMS'):
+    preload_subsystems(os.getenv('PRELOAD_SUBSYSTEMS').split(','))
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
 
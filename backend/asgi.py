@@ -0,0 +1,239 @@
+"""
+ASGI entry point that serves the LLM-backed endpoints asynchronously.
+
+    cd backend
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+POST /api/voice-qa, /api/feynman/chat, /api/feynman/evaluate,
+/api/learning-path-plan and /api/generate-quiz run the same handler code as
+the Flask views (the step generators in app.py, see llm_steps.py), but the
+model call is awaited (a pooled httpx.AsyncClient for the nvidia provider,
+the scheduler's future for llama_cpp; see llm_providers.py). Only the code between
+model calls (request parsing, DB reads and writes, TTS) runs in the worker
+thread pool, so thousands of requests can wait on the LLM in one process.
+Every other request goes to the Flask app through a2wsgi unchanged.
+
+Admission in this mode: the `llm` class token buckets still apply, and at
+most ASGI_LLM_CONCURRENCY (default 1000) model-bound requests run per
+process; the rest wait up to ADMISSION_LLM_MAX_WAIT seconds before a 429.
+ASGI_ASYNC_LLM=false sends these routes through the WSGI bridge as well
+(thread-per-request, for comparison). ASGI_THREADS (default 40) sizes the
+thread pool for the synchronous parts, ASGI_WSGI_THREADS (default 32) the
+pool for plain Flask requests. Keep the SQLAlchemy pool at least as large
+as ASGI_THREADS.
+"""
+import asyncio
+import io
+import logging
+import os
+import time
+import uuid
+
+import anyio
+import anyio.to_thread
+from a2wsgi import WSGIMiddleware
+from flask import g
+from werkzeug.datastructures import EnvironHeaders
+from werkzeug.test import EnvironBuilder
+
+import admission
+import app as flask_module
+import llm_providers
+import llm_steps
+import metrics
+
+log = logging.getLogger(__name__)
+
+ASYNC_LLM = os.getenv('ASGI_ASYNC_LLM', 'true').lower() in ('1', 'true', 'yes')
+LLM_CONCURRENCY = int(os.getenv('ASGI_LLM_CONCURRENCY', '1000'))
+THREADS = int(os.getenv('ASGI_THREADS', '40'))
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '32'))
+
+flask_app = flask_module.app
+
+# path -> step generator factory; the response is built from its return value
+ASYNC_ROUTES = {
+    '/api/voice-qa': flask_module._voice_qa_steps,
+    '/api/feynman/chat': flask_module._feynman_chat_steps,
+    '/api/feynman/evaluate': flask_module._evaluate_feynman_steps,
+    '/api/learning-path-plan': flask_module._learning_path_plan_steps,
+    '/api/generate-quiz': None,     # coalesced; see _generate_quiz
+}
+
+
+class _Exchange:
+    """One async-served request: the raw body plus a WSGI environ to rebuild Flask contexts from."""
+
+    def __init__(self, scope, body):
+        headers = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']]
+        if not any(k.lower() == 'x-request-id' for k, _ in headers):
+            headers.append(('X-Request-Id', uuid.uuid4().hex[:16]))
+        builder = EnvironBuilder(
+            path=scope['path'], method=scope['method'], headers=headers, data=body,
+            query_string=scope.get('query_string', b'').decode('latin-1'),
+            environ_base={'REMOTE_ADDR': (scope.get('client') or ('', 0))[0]})
+        try:
+            self.environ = builder.get_environ()
+        finally:
+            builder.close()
+        self.body = body
+        self.headers = EnvironHeaders(self.environ)
+
+    def in_flask(self, fn, *args):
+        """Run fn inside a fresh request context for this request (called from a worker thread)."""
+        environ = dict(self.environ, **{'wsgi.input': io.BytesIO(self.body)})
+        with flask_app.request_context(environ):
+            g.request_id = self.headers['X-Request-Id']
+            return fn(*args)
+
+
+def _finish(rv):
+    """Flask view return value -> (status, headers, body), with after_request hooks (CORS, request id)."""
+    response = flask_app.process_response(flask_app.make_response(rv))
+    return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+async def _drive(exchange, make_steps, respond=True):
+    """Run a step generator: code between yields in a thread, LLM calls awaited on the event loop."""
+    state = {}
+
+    def segment(value, error):
+        steps = state.get('steps')
+        if steps is None:
+            steps = state['steps'] = make_steps()
+        done, result = llm_steps.advance(steps, value, error)
+        if done and respond:
+            result = _finish(result)
+        return done, result
+
+    value = error = None
+    while True:
+        done, result = await anyio.to_thread.run_sync(exchange.in_flask, segment, value, error)
+        if done:
+            return result
+        value = error = None
+        try:
+            value = await flask_module._llm_chat_async(
+                result.messages, result.temperature, result.max_tokens,
+                caller=llm_steps.caller_name(state['steps']))
+        except Exception as exc:
+            error = exc
+
+
+async def _generate_quiz(exchange):
+    def parse():
+        try:
+            plan, error = flask_module._quiz_request()
+        except Exception as e:
+            log.exception("generate_quiz failed: %s", e)
+            return None, _finish(({'error': str(e)}, 500))
+        return plan, (_finish(error) if error is not None else None)
+
+    plan, response = await anyio.to_thread.run_sync(exchange.in_flask, parse)
+    if plan is None:
+        return response
+    if plan.key is None:
+        generated = await _drive(exchange, plan.make_steps, respond=False)
+    else:
+        # Same flight as the sync view; coalesces identical requests on this event loop
+        generated = await flask_module.quiz_flight.do_async(
+            plan.key, lambda: _drive(exchange, plan.make_steps, respond=False))
+    return await anyio.to_thread.run_sync(exchange.in_flask, lambda: _finish(plan.finish(*generated)))
+
+
+_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+def _reject(rejected):
+    admission.ADMISSION_DECISIONS.inc(cost_class='llm', outcome=rejected.reason)
+    return _finish_json(429, rejected.body(), [('Retry-After', str(rejected.retry_after))])
+
+
+def _finish_json(status, payload, headers=()):
+    with flask_app.app_context():
+        response = flask_app.json.response(payload)
+    return status, list(headers) + [('Content-Type', response.mimetype)], response.get_data()
+
+
+async def _serve_llm(scope, receive, send):
+    started = time.perf_counter()
+    exchange = _Exchange(scope, await _read_body(receive))
+    path = scope['path']
+    result = None
+    if admission.ENABLED:
+        cost_class = admission.get_class('llm')
+        try:
+            cost_class.charge(admission.client_key(exchange.headers, exchange.environ['REMOTE_ADDR']))
+        except admission.Rejected as rejected:
+            result = _reject(rejected)
+        if result is None:
+            try:
+                await asyncio.wait_for(_slots.acquire(), timeout=cost_class.max_wait)
+            except asyncio.TimeoutError:
+                result = _reject(admission.Rejected('queue_timeout', cost_class.max_wait))
+    if result is None:
+        try:
+            admission.ADMISSION_DECISIONS.inc(cost_class='llm', outcome='admitted')
+            if ASYNC_ROUTES[path] is None:
+                result = await _generate_quiz(exchange)
+            else:
+                result = await _drive(exchange, ASYNC_ROUTES[path])
+        except Exception as e:
+            log.exception("Async %s failed: %s", path, e)
+            result = _finish_json(500, {'error': str(e)})
+        finally:
+            if admission.ENABLED:
+                _slots.release()
+
+    status, headers, body = result
+    metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, route=path, method='POST', status=status)
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('client disconnected before sending the body')
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _startup():
+    with flask_app.app_context():
+        flask_module.ensure_schema()
+    metrics.registry.start_flusher()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            anyio.to_thread.current_default_thread_limiter().total_tokens = THREADS
+            try:
+                await anyio.to_thread.run_sync(_startup)
+            except Exception as exc:
+                # e.g. a failed schema upgrade: the server exits instead of serving
+                log.exception("Startup failed")
+                await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await llm_providers.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+_wsgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if ASYNC_LLM and scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] in ASYNC_ROUTES:
+        return await _serve_llm(scope, receive, send)
+    return await _wsgi(scope, receive, send)
@@ -0,0 +1,8 @@
+"""
+Load-testing harness for the backend.
+
+`python -m bench.run` starts local stand-ins for the external services the
+app talks to (see stubs.py), launches the app against them, drives a mix of
+requests at a target rate (loadgen.py, mixes.py) and writes per-route
+latency percentiles and error counts as JSON.
+"""
@@ -0,0 +1,73 @@
+"""
+Compare the sync and async serving modes on LLM-bound traffic.
+
+    cd backend
+    python -m bench.async_modes --rps 100 --duration 30 --llm-latency 5 --threads 16
+
+Runs bench.run twice with identical load and the same uvicorn process
+layout: `asgi-sync` serves every request from a --threads pool per worker
+(like a threaded WSGI worker), `asgi` awaits the LLM routes (asgi.py).
+Admission control is disabled in both so the serving model is the only
+limit. The report holds both runs plus the headline numbers side by side.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from bench import run as bench_run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default='voice_qa=3,generate_quiz=1')
+    parser.add_argument('--rps', type=float, default=50.0)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--llm-latency', type=float, default=5.0, help='seconds to first token')
+    parser.add_argument('--llm-token-rate', type=float, default=0.0, help='tokens/second (0 = instant)')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--max-in-flight', type=int, default=2000, help='client-side concurrency limit')
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    runs = {}
+    for server in ('asgi-sync', 'asgi'):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as fh:
+            path = fh.name
+        try:
+            bench_run.main([
+                '--server', server, '--no-admission', '--mix', args.mix, '--rps', str(args.rps),
+                '--duration', str(args.duration), '--warmup', str(args.warmup),
+                '--llm-latency', str(args.llm_latency), '--llm-token-rate', str(args.llm_token_rate),
+                '--workers', str(args.workers), '--threads', str(args.threads),
+                '--max-in-flight', str(args.max_in_flight), '--out', path,
+            ])
+            with open(path) as fh:
+                runs[server] = json.load(fh)
+        finally:
+            os.unlink(path)
+
+    summary = {}
+    for server, report in runs.items():
+        latencies = [r['p99_ms'] for r in report['routes'].values() if r['p99_ms'] is not None]
+        summary[server] = {
+            'achieved_rps': report['achieved_rps'],
+            'requests': report['requests'],
+            'errors': report['errors'],
+            'dropped_client_side': report['dropped_client_side'],
+            'worst_route_p99_ms': max(latencies) if latencies else None,
+        }
+    output = json.dumps({'summary': summary, 'runs': runs}, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
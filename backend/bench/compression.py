@@ -0,0 +1,184 @@
+"""
+Storage size and read latency of the compressed columns (compression.py).
+
+    cd backend
+    python -m bench.compression --out compression.json
+    python -m bench.compression --users 500 --corpus notes1.txt --corpus notes2.txt
+
+The same synthetic data set goes into one SQLite database per storage
+mode. For each of --users learners it contains documents, video summaries
+and quiz scores with answers_data:
+
+  plain      TEXT / JSON columns as before, whole rows loaded
+  zstd       CompressedText / CompressedJSON without a dictionary, bodies
+             deferred
+  zstd_dict  the same with a dictionary per column trained on --train-samples
+             values
+
+Per mode it reports the database size after VACUUM, and per table the
+median time to:
+
+  list    load a user's newest 20 rows the way the listing endpoints do
+          (plain: whole rows; compressed: without the deferred body)
+  detail  load one row and its decompressed body
+
+The generated prose has a small vocabulary and compresses better than real
+notes. Pass real text files with --corpus and the documents are cut from
+them instead.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('plain', 'zstd', 'zstd_dict')
+
+
+def _answers(rng, n=10):
+    from bench.text_helpers import VOCABULARY, _sentence
+    answers = []
+    for i in range(n):
+        options = [_sentence(rng)[:60] for _ in range(4)]
+        correct, chosen = rng.randrange(4), rng.randrange(4)
+        answers.append({'questionId': f'q{i}', 'question': _sentence(rng), 'userAnswer': chosen,
+                        'correctAnswer': correct, 'isCorrect': chosen == correct, 'options': options,
+                        'topic': rng.choice(VOCABULARY).title()})
+    return answers
+
+
+def dataset(users, seed=7, corpus_files=()):
+    """{table: [(user_id, title, body)]}, the same for every mode."""
+    from bench.text_helpers import short_notes, textbook
+    rng = random.Random(seed)
+    corpus = [open(path, encoding='utf-8', errors='replace').read() for path in corpus_files]
+    data = {'documents': [], 'video_summaries': [], 'quiz_scores': []}
+    for user_id in range(1, users + 1):
+        for i in range(rng.randint(1, 4)):
+            size = rng.randint(5_000, 60_000)
+            if corpus:
+                text = rng.choice(corpus)
+                start = rng.randrange(max(1, len(text) - size))
+                body = text[start:start + size]
+            else:
+                body = textbook(rng, size)
+            data['documents'].append((user_id, f'notes-{user_id}-{i}.pdf', body))
+        for i in range(rng.randint(1, 6)):
+            data['video_summaries'].append((user_id, f'Lecture {i}', short_notes(rng, rng.randint(800, 4_000))))
+        for i in range(rng.randint(5, 30)):
+            data['quiz_scores'].append((user_id, f'Quiz {i}', _answers(rng)))
+    return data
+
+
+def _tables(metadata, mode):
+    from sqlalchemy import JSON, Column, Integer, String, Table, Text
+    from compression import CompressedJSON, CompressedText
+    tables = {}
+    for name, text_type in (('documents', Text), ('video_summaries', Text), ('quiz_scores', JSON)):
+        if mode == 'plain':
+            body_type = text_type()
+        else:
+            body_type = (CompressedJSON if text_type is JSON else CompressedText)(f'bench.{name}')
+        tables[name] = Table(name, metadata,
+                             Column('id', Integer, primary_key=True),
+                             Column('user_id', Integer, nullable=False, index=True),
+                             Column('title', String(255), nullable=False),
+                             Column('body', body_type))
+    return tables
+
+
+def _median_ms(call, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return round(times[len(times) // 2] * 1000, 3)
+
+
+def run_mode(mode, data, directory, train_samples=500, repeat=200, seed=7):
+    from sqlalchemy import MetaData, create_engine, insert, select
+    import compression
+
+    metadata = MetaData()
+    tables = _tables(metadata, mode)
+    if mode == 'zstd_dict':
+        for name, table in tables.items():
+            sample = [table.c.body.type.serialize(body) for _, _, body in data[name][:train_samples]]
+            compression.register(f'bench.{name}', compression.zstd.train_dictionary(
+                compression.DICTIONARY_SIZE, sample, level=compression.LEVEL))
+
+    path = os.path.join(directory, f'{mode}.db')
+    engine = create_engine(f'sqlite:///{path}')
+    metadata.create_all(engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for name, rows in data.items():
+            conn.execute(insert(tables[name]), [{'user_id': u, 'title': t, 'body': b} for u, t, b in rows])
+    write_s = time.perf_counter() - started
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('VACUUM')
+
+    rng = random.Random(seed)
+    result = {'mode': mode, 'bytes': os.path.getsize(path), 'write_s': round(write_s, 3), 'tables': {}}
+    with engine.connect() as conn:
+        for name, table in tables.items():
+            users = max(u for u, _, _ in data[name])
+            ids = conn.execute(select(table.c.id)).scalars().all()
+            columns = list(table.c) if mode == 'plain' else [table.c.id, table.c.user_id, table.c.title]
+
+            def listing():
+                conn.execute(select(*columns).where(table.c.user_id == rng.randint(1, users))
+                             .order_by(table.c.id.desc()).limit(20)).all()
+
+            def detail():
+                conn.execute(select(table).where(table.c.id == rng.choice(ids))).one()
+
+            result['tables'][name] = {'rows': len(ids), 'list_ms': _median_ms(listing, repeat),
+                                      'detail_ms': _median_ms(detail, repeat)}
+    engine.dispose()
+    return result
+
+
+def run(users=200, seed=7, corpus_files=(), train_samples=500, repeat=200, modes=MODES):
+    data = dataset(users, seed, corpus_files)
+    raw = {name: sum(len((b if isinstance(b, str) else json.dumps(b)).encode('utf-8')) for _, _, b in rows)
+           for name, rows in data.items()}
+    with tempfile.TemporaryDirectory() as directory:
+        results = [run_mode(mode, data, directory, train_samples, repeat, seed) for mode in modes]
+    plain = next((r['bytes'] for r in results if r['mode'] == 'plain'), None)
+    for r in results:
+        r['ratio_vs_plain'] = round(plain / r['bytes'], 2) if plain else None
+    return {'users': users, 'body_bytes': raw, 'results': results,
+            'python': platform.python_version(), 'platform': platform.platform()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated storage modes')
+    parser.add_argument('--corpus', action='append', default=[], help='real text file to cut documents from (repeatable)')
+    parser.add_argument('--train-samples', type=int, default=500, help='values per column to train dictionaries on')
+    parser.add_argument('--repeat', type=int, default=200, help='timed reads per table and query')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, BACKEND_DIR)
+    report = run(args.users, args.seed, args.corpus, args.train_samples, args.repeat,
+                 [m for m in args.modes.split(',') if m])
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
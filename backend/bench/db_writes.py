@@ -0,0 +1,245 @@
+"""
+Write throughput of the persistence paths, per-object ORM vs unit of work.
+
+    cd backend
+    python -m bench.db_writes --out db_writes.json
+    python -m bench.db_writes --database-url sqlite:////tmp/w.db \\
+        --database-url postgresql://localhost/sla_bench --steps 12 --duration 5
+
+For each database (default: a throwaway SQLite file) and scenario it runs
+the write sequentially for --duration seconds in both styles and reports
+operations/s, SQL statements and commits per operation:
+
+  save_path    a learning path with --steps steps: one add() per step vs
+               insert_rows() (executemany)
+  submit_quiz  quiz score + streak: the streak committing by itself and the
+               handler committing again vs one unit_of_work() with the
+               touch_streak() UPDATE
+  toggle_step  step progress: commit, reload path.steps to recount, commit
+               vs increment() in the same transaction
+
+Each database runs in its own subprocess because the app binds DATABASE_URL
+at import. Tables are created if missing; rows are written under a fresh
+bench user and left in place, so point PostgreSQL runs at a scratch database.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('save_path', 'submit_quiz', 'toggle_step')
+
+
+def _plan(steps):
+    return [{'step': i, 'title': f'Step {i}', 'details': 'Read the chapter and take notes. ' * 4,
+             'videoQuery': f'topic part {i}', 'videoLink': f'https://youtu.be/{i:011d}' if i % 2 else None,
+             'codingLink': None} for i in range(1, steps + 1)]
+
+
+def _step_row(path_id, step):
+    return {'learning_path_id': path_id, 'step_number': step['step'], 'title': step['title'],
+            'details': step['details'], 'video_query': step['videoQuery'], 'video_link': step['videoLink'],
+            'coding_link': step['codingLink']}
+
+
+class Scenarios:
+    """Both versions of each write path, against the models directly."""
+
+    def __init__(self, steps):
+        from models import db, LearningPath, LearningPathStep, QuizScore, User
+        import unit_of_work as uow
+        self.db, self.uow = db, uow
+        self.LearningPath, self.LearningPathStep, self.QuizScore = LearningPath, LearningPathStep, QuizScore
+        self.plan = _plan(steps)
+        self.user = User(email=f'bench-{uuid.uuid4().hex[:12]}@example.com', name='Bench', password_hash='x')
+        db.session.add(self.user)
+        db.session.commit()
+        self.path_id = self.save_path_unit()
+        self.step_ids = [s.id for s in LearningPathStep.query.filter_by(learning_path_id=self.path_id)]
+        self._toggle = 0
+
+    def _age_streak(self):
+        # Every submission lands on a "new day" so the streak write is never skipped
+        self.user.last_activity_date = date.today() - timedelta(days=1)
+        self.db.session.commit()
+
+    # --- save_path ---------------------------------------------------------
+
+    def save_path_legacy(self):
+        db = self.db
+        lp = self.LearningPath(user_id=self.user.id, topic='Bench', level='beginner',
+                               total_steps=len(self.plan), completed_steps=0)
+        db.session.add(lp)
+        db.session.flush()
+        for step in self.plan:
+            db.session.add(self.LearningPathStep(**_step_row(lp.id, step)))
+        db.session.commit()
+        return lp.id
+
+    def save_path_unit(self):
+        with self.uow.unit_of_work():
+            lp = self.LearningPath(user_id=self.user.id, topic='Bench', level='beginner',
+                                   total_steps=len(self.plan), completed_steps=0)
+            self.db.session.add(lp)
+            self.db.session.flush()
+            self.uow.insert_rows(self.LearningPathStep, [_step_row(lp.id, step) for step in self.plan])
+        return lp.id
+
+    # --- submit_quiz -------------------------------------------------------
+
+    def _score(self):
+        return self.QuizScore(user_id=self.user.id, session_id='bench', quiz_title='Bench', total_questions=10,
+                              correct_answers=7, score_percentage=70.0,
+                              answers_data=[{'questionId': i, 'isCorrect': i % 3 != 0} for i in range(10)])
+
+    def submit_quiz_legacy(self):
+        user, db = self.user, self.db
+        db.session.add(self._score())
+        now = datetime.utcnow().date()
+        if user.last_activity_date != now:
+            if user.last_activity_date == now - timedelta(days=1):
+                user.current_streak = (user.current_streak or 0) + 1
+            else:
+                user.current_streak = 1
+            if (user.current_streak or 0) > (user.max_streak or 0):
+                user.max_streak = user.current_streak
+            user.last_activity_date = now
+            db.session.commit()
+        db.session.commit()
+
+    def submit_quiz_unit(self):
+        with self.uow.unit_of_work():
+            self.db.session.add(self._score())
+            self.uow.touch_streak(self.user)
+
+    # --- toggle_step -------------------------------------------------------
+
+    def _next_step(self):
+        self._toggle += 1
+        return self.db.session.get(self.LearningPathStep, self.step_ids[self._toggle % len(self.step_ids)])
+
+    def toggle_step_legacy(self):
+        db = self.db
+        step = self._next_step()
+        path = db.session.get(self.LearningPath, step.learning_path_id)
+        step.is_completed = not step.is_completed
+        db.session.commit()
+        path.completed_steps = sum(1 for s in path.steps if s.is_completed)
+        db.session.commit()
+
+    def toggle_step_unit(self):
+        step = self._next_step()
+        path = self.db.session.get(self.LearningPath, step.learning_path_id)
+        with self.uow.unit_of_work():
+            step.is_completed = not step.is_completed
+            self.uow.increment(self.LearningPath, path.id, completed_steps=1 if step.is_completed else -1)
+
+
+def _measure(db, fn, setup, duration):
+    from sqlalchemy import event
+
+    counts = {'statements': 0, 'commits': 0}
+
+    def on_execute(*_):
+        counts['statements'] += 1
+
+    def on_commit(*_):
+        counts['commits'] += 1
+
+    ops, elapsed = 0, 0.0
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    event.listen(db.engine, 'commit', on_commit)
+    try:
+        while elapsed < duration:
+            if setup:
+                event.remove(db.engine, 'before_cursor_execute', on_execute)
+                event.remove(db.engine, 'commit', on_commit)
+                setup()
+                event.listen(db.engine, 'before_cursor_execute', on_execute)
+                event.listen(db.engine, 'commit', on_commit)
+            started = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - started
+            ops += 1
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+        event.remove(db.engine, 'commit', on_commit)
+    return {'ops_per_sec': round(ops / elapsed, 1), 'ops': ops,
+            'statements_per_op': round(counts['statements'] / ops, 2),
+            'commits_per_op': round(counts['commits'] / ops, 2)}
+
+
+def run_one(database_url, steps, duration, scenarios=SCENARIOS):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import app
+
+    results = {}
+    with app.app.app_context():
+        app.ensure_schema()
+        bench = Scenarios(steps)
+        for name in scenarios:
+            setup = bench._age_streak if name == 'submit_quiz' else None
+            results[name] = {style: _measure(bench.db, getattr(bench, f'{name}_{style}'), setup, duration)
+                             for style in ('legacy', 'unit')}
+            results[name]['speedup'] = round(results[name]['unit']['ops_per_sec']
+                                             / results[name]['legacy']['ops_per_sec'], 2)
+        dialect = app.db.engine.dialect.name
+    return {'dialect': dialect, 'scenarios': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', action='append', default=[],
+                        help='database to write to (repeatable; default: a temporary SQLite file)')
+    parser.add_argument('--steps', type=int, default=12, help='steps per saved learning path')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds of writes per scenario and style')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+    scenarios = tuple(s.strip() for s in args.scenarios.split(','))
+
+    if args.child:
+        print(json.dumps(run_one(args.database_url[0], args.steps, args.duration, scenarios)))
+        return 0
+
+    scratch = None
+    urls = args.database_url
+    if not urls:
+        scratch = tempfile.mkdtemp(prefix='sla-db-writes-')
+        urls = [f"sqlite:///{os.path.join(scratch, 'bench.db')}"]
+
+    report = {'python': platform.python_version(), 'steps': args.steps, 'duration': args.duration, 'databases': {}}
+    for url in urls:
+        child = subprocess.run(
+            [sys.executable, '-m', 'bench.db_writes', '--child', '--database-url', url, '--steps', str(args.steps),
+             '--duration', str(args.duration), '--scenarios', ','.join(scenarios)],
+            cwd=BACKEND_DIR, capture_output=True, text=True)
+        if child.returncode != 0:
+            report['databases'][url] = {'error': child.stderr.strip().splitlines()[-1:] or ['failed']}
+            continue
+        report['databases'][url] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    if scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
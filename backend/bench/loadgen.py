@@ -0,0 +1,147 @@
+"""
+Open-loop load generator.
+
+Requests are scheduled at a fixed target rate regardless of how fast earlier
+ones complete, and latency is measured from the scheduled start time, so a
+slow server shows up as higher percentiles instead of a lower request rate
+(no coordinated omission).
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Scenario:
+    """One request type in a mix: `build(ctx, rng)` returns kwargs for requests.Session.request."""
+
+    def __init__(self, name, weight, build, ok_statuses=(200,)):
+        self.name = name
+        self.weight = weight
+        self.build = build
+        self.ok_statuses = set(ok_statuses)
+
+
+class LoadGenerator:
+    def __init__(self, base_url, scenarios, context=None, rps=10.0, duration=30.0, warmup=0.0,
+                 max_in_flight=64, timeout=120.0, seed=1, poisson=True):
+        self.base_url = base_url.rstrip('/')
+        self.scenarios = scenarios
+        self.context = context or {}
+        self.rps = rps
+        self.duration = duration
+        self.warmup = warmup
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.poisson = poisson
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)       # name -> [latency seconds]
+        self._statuses = defaultdict(lambda: defaultdict(int))
+        self._errors = defaultdict(int)
+        self._dropped = 0
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _pick(self):
+        total = sum(s.weight for s in self.scenarios)
+        point = self.rng.uniform(0, total)
+        for scenario in self.scenarios:
+            point -= scenario.weight
+            if point <= 0:
+                return scenario
+        return self.scenarios[-1]
+
+    def _fire(self, scenario, kwargs, scheduled, record):
+        status = 'exception'
+        try:
+            kwargs.setdefault('timeout', self.timeout)
+            path = kwargs.pop('path')
+            response = self._session().request(url=self.base_url + path, **kwargs)
+            response.content
+            status = response.status_code
+        except requests.RequestException:
+            pass
+        latency = time.perf_counter() - scheduled
+        if not record:
+            return
+        with self._lock:
+            self._samples[scenario.name].append(latency)
+            self._statuses[scenario.name][str(status)] += 1
+            if status not in scenario.ok_statuses:
+                self._errors[scenario.name] += 1
+
+    def run(self) -> dict:
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        started = time.perf_counter()
+        end = started + self.warmup + self.duration
+        next_at = started
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            while next_at < end:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                scenario = self._pick()
+                kwargs = scenario.build(self.context, self.rng)
+                record = next_at >= started + self.warmup
+                if not in_flight.acquire(blocking=False):
+                    # Client-side saturation: count it rather than silently slowing the schedule
+                    if record:
+                        with self._lock:
+                            self._dropped += 1
+                else:
+                    def task(sc=scenario, kw=kwargs, at=next_at, rec=record):
+                        try:
+                            self._fire(sc, kw, at, rec)
+                        finally:
+                            in_flight.release()
+                    pool.submit(task)
+                gap = self.rng.expovariate(self.rps) if self.poisson else 1.0 / self.rps
+                next_at += gap
+        elapsed = time.perf_counter() - started - self.warmup
+        return self.report(elapsed)
+
+    def report(self, elapsed) -> dict:
+        routes = {}
+        total = errors = 0
+        for name, samples in sorted(self._samples.items()):
+            samples.sort()
+            count = len(samples)
+            total += count
+            errors += self._errors[name]
+            routes[name] = {
+                'requests': count,
+                'errors': self._errors[name],
+                'error_rate': round(self._errors[name] / count, 4) if count else 0.0,
+                'statuses': dict(self._statuses[name]),
+                'mean_ms': round(1000 * sum(samples) / count, 2) if count else None,
+                'p50_ms': round(1000 * percentile(samples, 50), 2) if count else None,
+                'p95_ms': round(1000 * percentile(samples, 95), 2) if count else None,
+                'p99_ms': round(1000 * percentile(samples, 99), 2) if count else None,
+                'max_ms': round(1000 * samples[-1], 2) if count else None,
+            }
+        return {
+            'target_rps': self.rps,
+            'achieved_rps': round(total / elapsed, 2) if elapsed > 0 else 0.0,
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'errors': errors,
+            'dropped_client_side': self._dropped,
+            'routes': routes,
+        }
@@ -0,0 +1,135 @@
+"""
+Request mixes and the data they need.
+
+`seed_data()` creates verified users through the real signup flow (codes
+are read back from the SMTP sink), plus quiz scores and community topics so
+read-heavy routes have something to return. Each mix is a list of
+Scenarios with relative weights.
+"""
+import random
+import re
+import uuid
+
+import requests
+
+from bench.loadgen import Scenario
+
+PARAGRAPH = (
+    "Photosynthesis converts light energy into chemical energy stored in glucose. "
+    "The light-dependent reactions take place in the thylakoid membranes and produce ATP and NADPH. "
+    "The Calvin cycle in the stroma uses that ATP and NADPH to fix carbon dioxide into sugars. "
+    "Chlorophyll absorbs mostly blue and red light, which is why leaves look green. "
+    "Factors such as light intensity, temperature and carbon dioxide concentration limit the rate. "
+)
+
+
+def _quiz_questions(rng, count=5):
+    return [{
+        'id': f'q{i}',
+        'topic': rng.choice(['photosynthesis', 'cells', 'energy', 'genetics']),
+        'question': f'Question {i}',
+        'options': ['a', 'b', 'c', 'd'],
+        'correctAnswer': rng.randrange(4),
+    } for i in range(count)]
+
+
+def seed_data(base_url, smtp_sink, users=5, quizzes_per_user=3, topics=20, seed=1) -> dict:
+    rng = random.Random(seed)
+    session = requests.Session()
+    run_id = uuid.uuid4().hex[:8]
+    user_ids = []
+    for i in range(users):
+        address = f'bench-{run_id}-{i}@example.test'
+        res = session.post(f'{base_url}/api/auth/signup',
+                           json={'name': f'Bench {i}', 'email': address, 'password': 'bench-password'})
+        res.raise_for_status()
+        code = re.search(r'\b(\d{6})\b', smtp_sink.wait_for(address)).group(1)
+        res = session.post(f'{base_url}/api/auth/verify-code', json={'email': address, 'code': code})
+        res.raise_for_status()
+        user_ids.append(res.json()['user']['id'])
+
+    for user_id in user_ids:
+        for _ in range(quizzes_per_user):
+            questions = _quiz_questions(rng)
+            answers = {q['id']: rng.randrange(4) for q in questions}
+            session.post(f'{base_url}/api/submit-quiz', headers={'X-User-Id': str(user_id)},
+                         json={'questions': questions, 'answers': answers, 'sessionId': str(user_id),
+                               'quizTitle': 'Bench quiz'}).raise_for_status()
+
+    for i in range(topics):
+        session.post(f'{base_url}/api/community/topics', headers={'X-User-Id': str(rng.choice(user_ids))},
+                     json={'title': f'Bench topic {i}', 'content': PARAGRAPH[:200]}).raise_for_status()
+
+    return {'user_ids': user_ids}
+
+
+def _user(ctx, rng):
+    return {'X-User-Id': str(rng.choice(ctx['user_ids']))}
+
+
+def _generate_quiz(ctx, rng):
+    return {'method': 'POST', 'path': '/api/generate-quiz',
+            'json': {'text': PARAGRAPH * rng.randint(2, 8), 'numQuestions': rng.choice([5, 10])}}
+
+
+def _voice_qa(ctx, rng):
+    return {'method': 'POST', 'path': '/api/voice-qa', 'headers': _user(ctx, rng),
+            'json': {'question': f'Explain {rng.choice(["the Calvin cycle", "ATP", "chlorophyll"])} simply.',
+                     'tts': False}}
+
+
+def _dashboard(ctx, rng):
+    return {'method': 'GET', 'path': '/api/analytics/dashboard', 'headers': _user(ctx, rng)}
+
+
+def _community_feed(ctx, rng):
+    return {'method': 'GET', 'path': '/api/community/topics'}
+
+
+def _submit_quiz(ctx, rng):
+    questions = _quiz_questions(rng)
+    user = _user(ctx, rng)
+    return {'method': 'POST', 'path': '/api/submit-quiz', 'headers': user,
+            'json': {'questions': questions, 'answers': {q['id']: rng.randrange(4) for q in questions},
+                     'sessionId': user['X-User-Id'], 'quizTitle': 'Bench quiz'}}
+
+
+def _summarize_url(ctx, rng):
+    return {'method': 'POST', 'path': '/api/summarize-url',
+            'json': {'url': f'https://www.youtube.com/watch?v=bench{rng.randrange(50)}', 'maxWords': 150}}
+
+
+MIXES = {
+    # Typical interactive traffic: mostly reads, some LLM-backed calls
+    'default': [
+        Scenario('generate_quiz', 2, _generate_quiz),
+        Scenario('voice_qa', 3, _voice_qa),
+        Scenario('dashboard', 4, _dashboard),
+        Scenario('community_feed', 4, _community_feed),
+        Scenario('submit_quiz', 2, _submit_quiz),
+    ],
+    'llm': [
+        Scenario('generate_quiz', 1, _generate_quiz),
+        Scenario('voice_qa', 1, _voice_qa),
+        Scenario('summarize_url', 1, _summarize_url),
+    ],
+    'reads': [
+        Scenario('dashboard', 1, _dashboard),
+        Scenario('community_feed', 1, _community_feed),
+    ],
+}
+
+
+def parse_mix(spec: str):
+    """A mix name from MIXES, or 'scenario=weight,...' over the scenarios defined there."""
+    if spec in MIXES:
+        return MIXES[spec]
+    known = {s.name: s for mix in MIXES.values() for s in mix}
+    scenarios = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in known:
+            raise ValueError(f"unknown scenario {name!r} (known: {', '.join(sorted(known))})")
+        base = known[name.strip()]
+        scenarios.append(Scenario(base.name, float(weight or 1), base.build, base.ok_statuses))
+    return scenarios
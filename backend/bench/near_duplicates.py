@@ -0,0 +1,79 @@
+"""
+Calibration of the question bank's near-duplicate check.
+
+    cd backend
+    python -m bench.near_duplicates
+    python -m bench.near_duplicates --corpus my_questions.json --thresholds 0.3,0.4,0.5
+
+Scores every pair in the corpus (bench/data/quiz_near_duplicates.json by
+default): a question against its rewordings ("same") and against the other
+questions on its source ("different"). Reports the similarity distribution
+of both kinds and, per threshold, the share of rewordings that would be
+kept as new questions and the share of different questions that would be
+rejected as repeats. The corpus format is described in its "about" field.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+
+import question_bank
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), 'data', 'quiz_near_duplicates.json')
+
+
+def pairs(corpus):
+    """(same, different): lists of question-text pairs."""
+    same, different = [], []
+    for source in corpus['sources']:
+        groups = [[q['question']] + q['rewordings'] for q in source['questions']]
+        for group in groups:
+            same.extend(itertools.combinations(group, 2))
+        for a, b in itertools.combinations(groups, 2):
+            different.extend(itertools.product(a, b))
+    return same, different
+
+
+def _scores(pairs_):
+    return sorted(question_bank.similarity(question_bank.fingerprint(a), question_bank.fingerprint(b))
+                  for a, b in pairs_)
+
+
+def _summary(scores):
+    return {'pairs': len(scores), 'min': round(scores[0], 3), 'median': round(statistics.median(scores), 3),
+            'max': round(scores[-1], 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='question corpus (JSON)')
+    parser.add_argument('--thresholds', default='0.3,0.35,0.4,0.45,0.5,0.6',
+                        help='comma-separated similarity thresholds to evaluate')
+    parser.add_argument('--out', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    with open(args.corpus, encoding='utf-8') as f:
+        same, different = pairs(json.load(f))
+    same_scores, different_scores = _scores(same), _scores(different)
+    report = {
+        'current_threshold': question_bank.NEAR_DUPLICATE_SIMILARITY,
+        'same': _summary(same_scores),
+        'different': _summary(different_scores),
+        'thresholds': [{
+            'threshold': threshold,
+            'rewordings_kept': round(sum(s < threshold for s in same_scores) / len(same_scores), 4),
+            'different_rejected': round(sum(s >= threshold for s in different_scores) / len(different_scores), 4),
+        } for threshold in (float(t) for t in args.thresholds.split(','))],
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Benchmark for the PDF exports (/api/generate-pdf, /api/generate-answer-key).
+
+    cd backend
+    python -m bench.pdf_export --questions 500 --out pdf_export.json
+
+For a deterministic quiz of --questions multiple-choice items (with
+non-Latin-1 text) it records, best-of --repeat:
+  - font setup: registering the TTF on a fresh document vs deep-copying the
+    preloaded template (what every render pays, see pdf_render.py);
+  - cold render: layout + output + write to the cache, per export kind;
+  - cached export: the full request through the Flask test client when the
+    PDF is already on disk, with the streamed body read to the end;
+plus the tracemalloc peak of a cold render and the file size.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+WORDS = ("cell membrane protein enzyme energy glucose photosynthesis respiration mitochondria nucleus "
+         "force velocity momentum gravity circuit voltage algorithm recursion naïve café résumé "
+         "Schrödinger Δ-function α-helix β-sheet ≈ → ✓").split()
+
+ENDPOINTS = {'qa': '/api/generate-pdf', 'answer_key': '/api/generate-answer-key'}
+
+
+def quiz(rng, questions):
+    def phrase(n):
+        return ' '.join(rng.choice(WORDS) for _ in range(n))
+    return [{
+        'question': phrase(rng.randint(8, 30)).capitalize() + '?',
+        'options': [phrase(rng.randint(1, 8)) for _ in range(4)],
+        'correctAnswer': rng.randrange(4),
+    } for _ in range(questions)]
+
+
+def _best(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 3)
+
+
+def run(questions=500, repeat=5, seed=7):
+    cache_dir = tempfile.mkdtemp(prefix='sla-pdf-bench-')
+    os.environ['PDF_CACHE_DIR'] = cache_dir
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import app
+    import pdf_render
+
+    try:
+        items = quiz(random.Random(seed), questions)
+        title = f'Benchmark quiz ({questions} questions)'
+        _, unicode, _ = pdf_render.warm()
+        report = {
+            'unicode_font': unicode,
+            'font_setup_ms': {
+                'add_font_per_document': _best(pdf_render._build_template, repeat),
+                'template_copy': _best(pdf_render._new_document, repeat),
+            },
+            'kinds': {},
+        }
+
+        client = app.app.test_client()
+        for kind, endpoint in ENDPOINTS.items():
+            path = pdf_render.render_to_file(kind, title, items)
+
+            def cold():
+                os.unlink(path)
+                pdf_render.render_to_file(kind, title, items)
+
+            def cached():
+                response = client.post(endpoint, json={'items': items, 'title': title})
+                assert response.status_code == 200, response.get_data()[:200]
+                response.get_data()
+                response.close()
+
+            cold_ms = _best(cold, repeat)
+            tracemalloc.start()
+            try:
+                tracemalloc.reset_peak()
+                cold()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            report['kinds'][kind] = {
+                'cold_render_ms': cold_ms,
+                'cached_request_ms': _best(cached, repeat),
+                'cold_render_peak_bytes': peak,
+                'pdf_bytes': os.path.getsize(path),
+            }
+        return report
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    report = {'python': platform.python_version(), 'questions': args.questions,
+              **run(args.questions, args.repeat, args.seed)}
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
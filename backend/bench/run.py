@@ -0,0 +1,165 @@
+"""
+Run a load test against the backend with every external service stubbed.
+
+    cd backend
+    python -m bench.run --mix default --rps 20 --duration 60 --out bench.json
+
+By default the app is started in a subprocess against a throwaway SQLite
+database; pass --app-url to target an already running deployment (which must
+itself be configured with the printed stub URLs).
+
+--server picks how the app is served: `werkzeug` (the dev server, one
+thread per request), `asgi` (uvicorn with the async LLM routes of asgi.py)
+or `asgi-sync` (uvicorn with every request on a --threads pool, like a
+threaded WSGI worker). `python -m bench.async_modes` compares the last two.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from bench.loadgen import LoadGenerator
+from bench.mixes import parse_mix, seed_data
+from bench.stubs import LLMConfig, SMTPSink, StubServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def stub_env(stub: StubServer, smtp: SMTPSink) -> dict:
+    return {
+        'NVIDIA_API_BASE': f'{stub.url}/v1',
+        'NVIDIA_API_KEY': 'bench',
+        'YTDLP_INFO_URL': f'{stub.url}/youtube/info',
+        'SMTP_HOST': '127.0.0.1',
+        'SMTP_PORT': str(smtp.port),
+        'SMTP_FROM': 'bench@example.test',
+        'SMTP_STARTTLS': 'false',
+        'SMTP_RATE_PER_MINUTE': '6000',
+    }
+
+
+SERVERS = ('werkzeug', 'asgi', 'asgi-sync')
+
+
+def start_app(env_overrides: dict, db_path: str, port: int, server='werkzeug', workers=1, threads=16):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'),
+               **env_overrides)
+    if server == 'werkzeug':
+        code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True, use_reloader=False)"
+        command = [sys.executable, '-c', code]
+    else:
+        env.update(ASGI_ASYNC_LLM='true' if server == 'asgi' else 'false',
+                   ASGI_WSGI_THREADS=str(threads), ASGI_THREADS=str(threads))
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(workers), '--log-level', 'warning', '--backlog', '4096']
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def wait_healthy(base_url, proc=None, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"app exited during startup:\n{proc.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            if requests.get(f'{base_url}/api/health', timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f'{base_url} did not become healthy')
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default='default', help="mix name or 'scenario=weight,...'")
+    parser.add_argument('--rps', type=float, default=10.0)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--max-in-flight', type=int, default=64)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='seconds to first token')
+    parser.add_argument('--llm-token-rate', type=float, default=200.0, help='tokens/second (0 = instant)')
+    parser.add_argument('--llm-tokens', type=int, default=120, help='completion length for free-text answers')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--server', choices=SERVERS, default='werkzeug', help='how to serve the app (see above)')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes (asgi servers)')
+    parser.add_argument('--threads', type=int, default=16, help='thread pool per worker (asgi servers)')
+    parser.add_argument('--no-admission', action='store_true', help='start the app with ADMISSION_ENABLED=false')
+    parser.add_argument('--app-url', help='benchmark an already running app instead of starting one')
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    scenarios = parse_mix(args.mix)
+    stub = StubServer(llm=LLMConfig(args.llm_latency, args.llm_token_rate, args.llm_tokens,
+                                    args.llm_error_rate, args.seed)).start()
+    smtp = SMTPSink().start()
+    env = stub_env(stub, smtp)
+    if args.no_admission:
+        env['ADMISSION_ENABLED'] = 'false'
+
+    proc = None
+    tmpdir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        if args.app_url:
+            base_url = args.app_url.rstrip('/')
+            print('Configure the app with:', ' '.join(f'{k}={v}' for k, v in env.items()), file=sys.stderr)
+            wait_healthy(base_url)
+        else:
+            port = _free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            proc = start_app(env, os.path.join(tmpdir, 'bench.db'), port, args.server, args.workers, args.threads)
+            wait_healthy(base_url, proc)
+
+        context = seed_data(base_url, smtp, users=args.users, seed=args.seed)
+        generator = LoadGenerator(base_url, scenarios, context, rps=args.rps, duration=args.duration,
+                                  warmup=args.warmup, max_in_flight=args.max_in_flight, seed=args.seed)
+        result = generator.run()
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        stub.shutdown()
+        smtp.shutdown()
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'config': {k: v for k, v in vars(args).items() if k != 'out'},
+        'stub_calls': stub.counts,
+        **result,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+    return 0 if result['requests'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+Local stand-ins for the services the backend calls.
+
+- StubServer: one HTTP server providing
+    POST /v1/chat/completions   OpenAI-compatible LLM (latency, token rate,
+                                streaming, error rate are configurable)
+    GET  /youtube/info?url=...  yt-dlp style info dict (point YTDLP_INFO_URL here)
+    GET  /youtube/captions/<id>.vtt
+- SMTPSink: accepts mail over plain SMTP and keeps the parsed messages so
+  the harness can read verification codes.
+"""
+import email
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "learning memory recall practice concept model system energy process cell structure function "
+    "theory example result analysis method data network layer signal value change rate growth"
+).split()
+
+
+class LLMConfig:
+    def __init__(self, latency=0.2, token_rate=200.0, completion_tokens=120, error_rate=0.0, seed=0):
+        self.latency = latency                  # seconds before the first token
+        self.token_rate = token_rate            # tokens per second after that (0 = instant)
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate            # fraction of calls answered with HTTP 500
+        self.seed = seed
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _quiz_json(rng, count):
+    items = []
+    for i in range(count):
+        items.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'topic': rng.choice(WORDS).title(),
+            'question': f"Which statement best describes {_words(rng, 3)} in this context?",
+            'options': [_words(rng, 4) for _ in range(4)],
+            'correctAnswer': rng.randrange(4),
+        })
+    return json.dumps({'title': f"Quiz on {_words(rng, 2).title()}", 'items': items})
+
+
+def _completion_text(payload, rng, default_tokens):
+    system = ' '.join(m.get('content') or '' for m in payload.get('messages', []) if m.get('role') == 'system')
+    if '"items"' in system:
+        match = re.search(r'exactly (\d+)', system)
+        return _quiz_json(rng, int(match.group(1)) if match else 5)
+    tokens = min(default_tokens, int(payload.get('max_tokens') or default_tokens))
+    return _words(rng, tokens)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send_json(404, {'error': 'not found'})
+
+        cfg = self.server.llm
+        rng = random.Random(self.server.next_seed())
+        self.server.count('chat_completions')
+        time.sleep(cfg.latency)
+        if cfg.error_rate and rng.random() < cfg.error_rate:
+            return self._send_json(500, {'error': {'message': 'stub failure'}})
+
+        text = _completion_text(payload, rng, cfg.completion_tokens)
+        pieces = re.findall(r'\S+\s*', text)
+        prompt_tokens = sum(len((m.get('content') or '').split()) for m in payload.get('messages', []))
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(pieces),
+                 'total_tokens': prompt_tokens + len(pieces)}
+        model = payload.get('model', 'stub')
+
+        if not payload.get('stream'):
+            if cfg.token_rate:
+                time.sleep(len(pieces) / cfg.token_rate)
+            return self._send_json(200, {
+                'id': f'chatcmpl-{uuid.uuid4().hex[:12]}', 'object': 'chat.completion', 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def emit(obj):
+            data = f"data: {obj}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for piece in pieces:
+            if cfg.token_rate:
+                time.sleep(1 / cfg.token_rate)
+            emit(json.dumps({'model': model, 'choices': [{'index': 0, 'delta': {'content': piece}}]}))
+        emit(json.dumps({'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}))
+        emit('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        base = f"http://{self.headers.get('Host')}"
+        if parsed.path == '/youtube/info':
+            url = (parse_qs(parsed.query).get('url') or [''])[0]
+            video_id = re.split(r'v=|youtu\.be/', url)[-1].split('&')[0].split('?')[0] or 'unknown'
+            self.server.count('youtube_info')
+            return self._send_json(200, {
+                'id': video_id, 'title': f'Stub video {video_id}',
+                'subtitles': {'en': [{'ext': 'vtt', 'url': f'{base}/youtube/captions/{video_id}.vtt'}]},
+                'automatic_captions': {},
+            })
+        match = re.fullmatch(r'/youtube/captions/([\w-]+)\.vtt', parsed.path)
+        if match:
+            self.server.count('youtube_captions')
+            rng = random.Random(match.group(1))
+            cues = ['WEBVTT', '']
+            for i in range(60):
+                cues += [str(i + 1), f'00:00:{i:02d}.000 --> 00:00:{i:02d}.900', _words(rng, 12), '']
+            data = '\n'.join(cues).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/vtt')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(404, {'error': 'not found'})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024       # the async mode opens hundreds of connections at once
+
+    def __init__(self, host='127.0.0.1', port=0, llm: LLMConfig = None):
+        super().__init__((host, port), _StubHandler)
+        self.llm = llm or LLMConfig()
+        self.counts = {}
+        self._seed = self.llm.seed
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def next_seed(self):
+        with self._lock:
+            self._seed += 1
+            return self._seed
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='bench-stub-http', daemon=True).start()
+        return self
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 bench-smtp ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors='replace').strip()
+            verb = cmd.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 bench-smtp')
+            elif verb == 'MAIL':
+                sender, recipients = cmd.split(':', 1)[1].strip(' <>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(cmd.split(':', 1)[1].strip(' <>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                self.server.deliver(sender, recipients, email.message_from_bytes(b''.join(lines)))
+                self.reply('250 OK queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Plain-text SMTP server that stores every message (no auth, no TLS)."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = []
+        self._cond = threading.Condition()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def deliver(self, sender, recipients, message):
+        with self._cond:
+            self.messages.append((sender, recipients, message))
+            self._cond.notify_all()
+
+    def wait_for(self, recipient, timeout=30.0):
+        """Block until a message to `recipient` arrives; returns its body text."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for _, rcpts, message in reversed(self.messages):
+                    if recipient in rcpts:
+                        return message.get_payload(decode=True).decode(errors='replace')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no mail for {recipient}")
+                self._cond.wait(remaining)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='bench-smtp', daemon=True).start()
+        return self
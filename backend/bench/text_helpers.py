@@ -0,0 +1,245 @@
+"""
+Micro-benchmarks for the pure-Python text helpers in app.py.
+
+    cd backend
+    python -m bench.text_helpers --out text_helpers.json
+    python -m bench.text_helpers --helpers _split_sentences,_key_terms --fail-above 1.5
+
+Each helper runs on deterministic corpora (short notes, a ~100-page
+textbook, noisy OCR-like text, plus any --corpus files) truncated or
+repeated to several sizes. For every (helper, corpus, size) the best-of-N
+wall time and the tracemalloc peak are recorded, and a log-log fit over the
+sizes gives a scaling exponent per helper/corpus: ~1 is linear, ~2 is
+quadratic. --fail-above turns an exponent over the threshold into a
+non-zero exit so CI can catch accidental quadratic behaviour.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+VOCABULARY = (
+    "cell membrane protein enzyme energy glucose photosynthesis respiration mitochondria nucleus "
+    "gene chromosome mutation evolution selection population ecosystem climate carbon nitrogen "
+    "force velocity acceleration momentum gravity friction circuit voltage current resistance "
+    "algorithm function variable recursion complexity database network protocol encryption"
+).split()
+FILLER = "the a of in to is are and which that with for this by as on from can be".split()
+
+DEFAULT_SIZES = (2_000, 20_000, 100_000, 300_000)
+
+
+def _sentence(rng):
+    words = [rng.choice(VOCABULARY if rng.random() < 0.35 else FILLER) for _ in range(rng.randint(8, 24))]
+    words[0] = words[0].capitalize()
+    return ' '.join(words) + rng.choice('...?!')
+
+
+def short_notes(rng, chars):
+    lines = []
+    while sum(len(l) + 1 for l in lines) < chars:
+        prefix = rng.choice(['- ', '* ', '1. ', '', '• '])
+        lines.append(prefix + _sentence(rng))
+        if rng.random() < 0.2:
+            lines.append('')
+    return '\n'.join(lines)[:chars]
+
+
+def textbook(rng, chars):
+    """Paragraphed prose, with headings and the repetition real textbooks have."""
+    paragraphs, total, chapter = [], 0, 1
+    recurring = [_sentence(rng) for _ in range(30)]
+    while total < chars:
+        if rng.random() < 0.05:
+            paragraphs.append(f"Chapter {chapter}: {rng.choice(VOCABULARY).title()} and {rng.choice(VOCABULARY)}")
+            chapter += 1
+        body = ' '.join(rng.choice(recurring) if rng.random() < 0.15 else _sentence(rng) for _ in range(rng.randint(3, 8)))
+        paragraphs.append(body)
+        total += len(body) + 2
+    return '\n\n'.join(paragraphs)[:chars]
+
+
+def ocr_noisy(rng, chars):
+    """Prose with OCR artefacts: hyphenated line breaks, (cid:NN) glyphs, stray spacing, substitutions."""
+    swaps = {'l': '1', 'o': '0', 'e': 'c', 'rn': 'm'}
+    out, total = [], 0
+    while total < chars:
+        s = _sentence(rng)
+        if rng.random() < 0.3:
+            k = rng.choice(list(swaps))
+            s = s.replace(k, swaps[k], 1)
+        if rng.random() < 0.2:
+            cut = rng.randrange(1, len(s))
+            s = s[:cut] + '-\n' + s[cut:]
+        if rng.random() < 0.1:
+            s += f' (cid:{rng.randint(1, 200)})'
+        if rng.random() < 0.1:
+            s = ' '.join(s)[:len(s) * 2]
+        out.append(s)
+        total += len(s) + 1
+    return ('\n' if rng.random() < 0.5 else ' ').join(out)[:chars]
+
+
+CORPORA = {'short_notes': short_notes, 'textbook': textbook, 'ocr_noisy': ocr_noisy}
+
+
+def _sized(text, chars):
+    if len(text) >= chars:
+        return text[:chars]
+    return (text + '\n\n') * (chars // (len(text) + 2)) + text[:chars % (len(text) + 2)]
+
+
+def _word_boxes(text):
+    """pdfplumber-style extract_words output laid out on ~90-char lines."""
+    words, x, top = [], 0.0, 0.0
+    for token in text.split():
+        width = 5.0 * len(token)
+        if x + width > 450:
+            x, top = 0.0, top + 12.0
+        words.append({'text': token, 'x0': x, 'x1': x + width, 'top': top})
+        x += width + 4.0
+    return words
+
+
+def _helper_cases(app):
+    """name -> (prepare(text) -> args, call(*args)); prepare runs outside the timed section."""
+    return {
+        '_split_sentences': (lambda t: (t,), app._split_sentences),
+        '_tokenize_words': (lambda t: (t,), app._tokenize_words),
+        '_key_terms': (lambda t: (t,), app._key_terms),
+        '_extract_main_topics': (lambda t: (t, app._key_terms(t)), app._extract_main_topics),
+        '_best_sentence_for_term': (
+            lambda t: ((app._key_terms(t, 1) or ['energy'])[0], app._split_sentences(t)), app._best_sentence_for_term),
+        '_reconstruct_text_from_words': (lambda t: (_word_boxes(t),), app._reconstruct_text_from_words),
+        '_chunk_text_by_chars': (lambda t: (t,), app._chunk_text_by_chars),
+        '_format_paragraphs': (lambda t: (t,), app._format_paragraphs),
+    }
+
+
+def _time_call(call, args, min_time=0.2, repeat=5):
+    """Best-of-`repeat` seconds per call, with the loop count auto-scaled to ~min_time per repeat."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            call(*args)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10 or number >= 1_000_000:
+            break
+        number *= 10
+    number = max(1, int(min_time / max(elapsed / number, 1e-9)))
+    best = float('inf')
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                call(*args)
+            best = min(best, (time.perf_counter() - started) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def _peak_memory(call, args):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        call(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def scaling_exponent(sizes, values):
+    """Least-squares slope of log(value) against log(size)."""
+    points = [(math.log(s), math.log(v)) for s, v in zip(sizes, values) if s > 0 and v > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(p[0] for p in points) / len(points)
+    mean_y = sum(p[1] for p in points) / len(points)
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if var == 0:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in points) / var, 3)
+
+
+def run(helpers=None, sizes=DEFAULT_SIZES, corpus_files=(), seed=7, min_time=0.2, repeat=5):
+    # The helpers never touch the database; don't require one to import the app
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import app  # imported here so `--help` works without the app's environment
+
+    cases = _helper_cases(app)
+    names = helpers or list(cases)
+    corpora = {name: gen(random.Random(seed), max(sizes)) for name, gen in CORPORA.items()}
+    for path in corpus_files:
+        with open(path, encoding='utf-8', errors='replace') as fh:
+            corpora[os.path.basename(path)] = fh.read()
+
+    results = []
+    for helper in names:
+        prepare, call = cases[helper]
+        for corpus_name, corpus in corpora.items():
+            rows = []
+            for size in sizes:
+                args = prepare(_sized(corpus, size))
+                rows.append({
+                    'chars': size,
+                    'seconds': _time_call(call, args, min_time, repeat),
+                    'peak_bytes': _peak_memory(call, args),
+                })
+            results.append({
+                'helper': helper,
+                'corpus': corpus_name,
+                'sizes': [{**r, 'seconds': float(f"{r['seconds']:.6g}")} for r in rows],
+                'time_exponent': scaling_exponent([r['chars'] for r in rows], [r['seconds'] for r in rows]),
+                'memory_exponent': scaling_exponent([r['chars'] for r in rows], [r['peak_bytes'] for r in rows]),
+            })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--helpers', help='comma-separated helper names (default: all)')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='input sizes in characters')
+    parser.add_argument('--corpus', action='append', default=[], help='extra real-world text file (repeatable)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.2, help='target seconds per timing repeat')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fail-above', type=float, help='exit 1 if any time exponent exceeds this')
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    helpers = [h.strip() for h in args.helpers.split(',')] if args.helpers else None
+    sizes = tuple(int(s) for s in args.sizes.split(','))
+    results = run(helpers, sizes, args.corpus, args.seed, args.min_time, args.repeat)
+    report = {'python': platform.python_version(), 'seed': args.seed, 'sizes': list(sizes), 'results': results}
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+    if args.fail_above is not None:
+        offenders = [r for r in results if (r['time_exponent'] or 0) > args.fail_above]
+        for r in offenders:
+            print(f"{r['helper']} on {r['corpus']}: time exponent {r['time_exponent']} > {args.fail_above}",
+                  file=sys.stderr)
+        return 1 if offenders else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
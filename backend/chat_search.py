@@ -0,0 +1,140 @@
+"""
+Full-text search over a user's chat history (user_message and ai_response).
+
+Uses the index schema.py built for the database: FTS5 with bm25 ranking and
+snippet() on SQLite, websearch_to_tsquery + ts_rank_cd + ts_headline on
+PostgreSQL, and an unranked newest-first LIKE scan elsewhere. Results are
+ranked hits with HTML-escaped highlights, matches wrapped in <mark>.
+"""
+import html
+import re
+
+from sqlalchemy import DateTime, text
+
+import metrics
+import schema
+from models import db, ChatHistory
+
+# Control characters mark matches inside the database; the text is escaped
+# before they become <mark> tags, so message content can never inject HTML
+_OPEN, _CLOSE = '\x02', '\x03'
+_ELLIPSIS = '…'
+
+_FTS5_QUERY = f"""
+    SELECT h.id, h.session_id, h.context, h.created_at,
+           bm25(chat_history_fts) AS rank,
+           snippet(chat_history_fts, 0, :open, :close, '{_ELLIPSIS}', 16) AS user_message,
+           snippet(chat_history_fts, 1, :open, :close, '{_ELLIPSIS}', 32) AS ai_response
+    FROM chat_history_fts JOIN chat_history h ON h.id = chat_history_fts.rowid
+    WHERE chat_history_fts MATCH :match AND {{owner}} {{context}}
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+_TSVECTOR_QUERY = f"""
+    SELECT hit.id, hit.session_id, hit.context, hit.created_at, hit.rank,
+           ts_headline('{schema.SEARCH_LANGUAGE}', hit.user_message, hit.query, :options) AS user_message,
+           ts_headline('{schema.SEARCH_LANGUAGE}', hit.ai_response, hit.query, :options) AS ai_response
+    FROM (
+        SELECT h.*, q.query, ts_rank_cd({schema.CHAT_TSVECTOR}, q.query) AS rank
+        FROM chat_history h, websearch_to_tsquery('{schema.SEARCH_LANGUAGE}', :q) AS q(query)
+        WHERE {schema.CHAT_TSVECTOR} @@ q.query AND {{owner}} {{context}}
+        ORDER BY rank DESC
+        LIMIT :limit
+    ) AS hit
+    ORDER BY hit.rank DESC
+"""
+
+
+def _fts5_match(query: str):
+    """FTS5 MATCH expression: every word must occur, the last one as a prefix (search-as-you-type)."""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _highlight(marked: str) -> str:
+    return html.escape(marked or '').replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def _like_highlight(value: str, terms, width=160) -> str:
+    value = value or ''
+    lowered = value.lower()
+    first = min((lowered.find(t) for t in terms if t in lowered), default=0)
+    start = max(0, first - width // 4)
+    fragment = value[start:start + width]
+    escaped = html.escape(fragment)
+    for term in sorted(set(terms), key=len, reverse=True):
+        escaped = re.sub(f'({re.escape(html.escape(term))})', r'<mark>\1</mark>', escaped, flags=re.IGNORECASE)
+    prefix = _ELLIPSIS if start > 0 else ''
+    suffix = _ELLIPSIS if start + width < len(value) else ''
+    return prefix + escaped + suffix
+
+
+def search(query, user_id=None, session_id=None, context=None, limit=20):
+    """Ranked hits for `query` in one user's (or one anonymous session's) history."""
+    if user_id is None and session_id is None:
+        raise ValueError('user_id or session_id is required')
+    query = (query or '').strip()
+    if not query:
+        return []
+    owner = 'h.user_id = :owner' if user_id is not None else 'h.session_id = :owner'
+    params = {'owner': user_id if user_id is not None else session_id, 'limit': limit}
+    context_clause = ''
+    if context:
+        context_clause = 'AND h.context = :context'
+        params['context'] = context
+
+    backend = schema.search_backend()
+    with metrics.stage_timer('chat_search'):
+        if backend == 'fts5':
+            match = _fts5_match(query)
+            if match is None:
+                return []
+            sql = text(_FTS5_QUERY.format(owner=owner, context=context_clause)).columns(created_at=DateTime)
+            rows = db.session.execute(sql, dict(params, match=match, open=_OPEN, close=_CLOSE)).mappings()
+            return [_hit(row, -row['rank']) for row in rows]
+        if backend == 'tsvector':
+            sql = text(_TSVECTOR_QUERY.format(owner=owner, context=context_clause)).columns(created_at=DateTime)
+            options = f'StartSel="{_OPEN}", StopSel="{_CLOSE}", MaxFragments=2, MaxWords=24, MinWords=8'
+            rows = db.session.execute(sql, dict(params, q=query, options=options)).mappings()
+            return [_hit(row, row['rank']) for row in rows]
+        return _like_search(query, user_id, session_id, context, limit)
+
+
+def _hit(row, score):
+    return {
+        'id': row['id'],
+        'session_id': row['session_id'],
+        'context': row['context'],
+        'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+        'score': round(float(score), 4),
+        'user_message_highlight': _highlight(row['user_message']),
+        'ai_response_highlight': _highlight(row['ai_response']),
+    }
+
+
+def _like_search(query, user_id, session_id, context, limit):
+    terms = [t.lower() for t in re.findall(r'\w+', query)]
+    if not terms:
+        return []
+    q = ChatHistory.query.filter_by(user_id=user_id) if user_id is not None \
+        else ChatHistory.query.filter_by(session_id=session_id)
+    if context:
+        q = q.filter_by(context=context)
+    for term in terms:
+        pattern = f'%{term}%'
+        q = q.filter(db.or_(ChatHistory.user_message.ilike(pattern), ChatHistory.ai_response.ilike(pattern)))
+    rows = q.order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()).limit(limit).all()
+    return [{
+        'id': row.id,
+        'session_id': row.session_id,
+        'context': row.context,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'score': None,
+        'user_message_highlight': _like_highlight(row.user_message, terms),
+        'ai_response_highlight': _like_highlight(row.ai_response, terms),
+    } for row in rows]
@@ -0,0 +1,231 @@
+"""
+Compressed storage for large text and JSON columns.
+
+Document.content, VideoSummary.summary_text and QuizScore.answers_data are
+written once, read rarely and then in full, and were most of their tables'
+bytes. CompressedText / CompressedJSON keep them as zstd frames
+(COMPRESSION_LEVEL, default 3) in a binary column; values shorter than
+COMPRESSION_MIN_BYTES, or that do not shrink, stay plain UTF-8. Reads tell
+the two apart by the zstd magic number, which valid UTF-8 never starts
+with, so rows written before the migration keep reading correctly until
+`flask compress-columns` rewrites them.
+
+Each column names a dictionary. `flask compression-train --column NAME`
+trains a zstd dictionary on a sample of that column's values and stores it
+in compression_dictionaries; new values use the newest dictionary of their
+name. Rows of a few KB compress several times better with a dictionary
+trained on similar text (every answers_data row repeats the same keys and
+phrasing). A frame records its dictionary id, so rows stay readable after
+retraining. Dictionaries are loaded once per process (ensure_schema) and
+again when a frame names one this process has not seen; a worker starts
+writing with a new dictionary after it restarts.
+
+The columns are deferred on the models, so listing queries never fetch the
+bodies; handlers that need them for many rows use undefer().
+
+chat_history.ai_response is not compressed this way: the full-text index
+reads it inside the database (FTS5 external content, the tsvector
+expression index; see schema.py). On PostgreSQL it gets lz4 TOAST
+compression instead.
+"""
+import json
+import logging
+import os
+import threading
+
+from sqlalchemy import LargeBinary, bindparam, select, type_coerce, update
+from sqlalchemy.types import TypeDecorator
+
+from lazy_imports import lazy_import
+
+zstd = lazy_import('zstandard')
+
+log = logging.getLogger(__name__)
+
+LEVEL = int(os.getenv('COMPRESSION_LEVEL', '3'))
+MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '64'))
+DICTIONARY_SIZE = int(os.getenv('COMPRESSION_DICTIONARY_SIZE', str(64 * 1024)))
+
+_MAGIC = b'\x28\xb5\x2f\xfd'
+
+_dictionaries = {}          # zstd dictionary id -> ZstdCompressionDict
+_current = {}               # dictionary name -> id used for new values
+_lock = threading.Lock()
+_local = threading.local()  # zstd (de)compressor objects must not be shared between threads
+
+
+def register(name, dictionary):
+    """Make `dictionary` (a ZstdCompressionDict) the one new values of `name` are written with."""
+    with _lock:
+        _dictionaries[dictionary.dict_id()] = dictionary
+        _current[name] = dictionary.dict_id()
+
+
+def _codec(kind, dict_id):
+    cache = _local.__dict__.setdefault(kind, {})
+    codec = cache.get(dict_id)
+    if codec is None:
+        dictionary = _dictionaries.get(dict_id) if dict_id else None
+        if kind == 'compressors':
+            codec = zstd.ZstdCompressor(level=LEVEL, dict_data=dictionary)
+        else:
+            codec = zstd.ZstdDecompressor(dict_data=dictionary)
+        cache[dict_id] = codec
+    return codec
+
+
+def compress(data: bytes, name=None) -> bytes:
+    if len(data) < MIN_BYTES:
+        return data
+    frame = _codec('compressors', _current.get(name, 0)).compress(data)
+    return frame if len(frame) < len(data) else data
+
+
+def decompress(value) -> str:
+    """The text of a stored value: a zstd frame, plain UTF-8, or (SQLite, before migration) a str."""
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value[:4] != _MAGIC:
+        return value.decode('utf-8')
+    dict_id = zstd.get_frame_parameters(value).dict_id
+    if dict_id and dict_id not in _dictionaries:
+        load_dictionaries()
+        if dict_id not in _dictionaries:
+            raise RuntimeError(f"Compression dictionary {dict_id} is missing from compression_dictionaries")
+    return _codec('decompressors', dict_id).decompress(value).decode('utf-8')
+
+
+def frame_dictionary(value):
+    """Dictionary id of a stored value: 0 for a frame without one, None if it is not compressed."""
+    if isinstance(value, str):
+        return None
+    value = bytes(value)
+    return zstd.get_frame_parameters(value).dict_id if value[:4] == _MAGIC else None
+
+
+class CompressedText(TypeDecorator):
+    """Text stored zstd-compressed in a binary column, with the dictionary called `dictionary`."""
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, dictionary=None):
+        super().__init__()
+        self.dictionary = dictionary
+
+    def serialize(self, value) -> bytes:
+        return value.encode('utf-8')
+
+    def deserialize(self, text: str):
+        return text
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else compress(self.serialize(value), self.dictionary)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else self.deserialize(decompress(value))
+
+
+class CompressedJSON(CompressedText):
+    """CompressedText holding a JSON document (compact separators, UTF-8)."""
+    cache_ok = True
+
+    def serialize(self, value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def deserialize(self, text: str):
+        return json.loads(text)
+
+
+def compressed_columns(metadata):
+    """[(table, column)] for every compressed column in `metadata`."""
+    return [(table, column) for table in metadata.sorted_tables for column in table.columns
+            if isinstance(column.type, CompressedText)]
+
+
+def load_dictionaries():
+    """(Re)load the stored dictionaries; the newest of each name is used for new values."""
+    from models import db, CompressionDictionary
+    with db.engine.connect() as conn:
+        rows = conn.execute(select(CompressionDictionary.id, CompressionDictionary.name, CompressionDictionary.data)
+                            .order_by(CompressionDictionary.created_at, CompressionDictionary.id)).all()
+    for dict_id, name, data in rows:
+        register(name, _dictionaries.get(dict_id) or zstd.ZstdCompressionDict(bytes(data)))
+    return len(rows)
+
+
+def train(name, samples=2000, dict_size=DICTIONARY_SIZE):
+    """Train and store a dictionary for the column(s) using `name` on a random sample of their values."""
+    from models import db, CompressionDictionary
+    columns = [(t, c) for t, c in compressed_columns(db.metadata) if c.type.dictionary == name]
+    if not columns:
+        raise ValueError(f"No compressed column uses the dictionary {name!r}")
+
+    values = []
+    for table, column in columns:
+        rows = db.session.execute(select(column).where(column.isnot(None))
+                                  .order_by(db.func.random()).limit(samples))
+        values.extend(column.type.serialize(value) for value, in rows)
+    if len(values) < 10:
+        raise ValueError(f"Only {len(values)} values to train {name!r} on; need at least 10")
+
+    dictionary = zstd.train_dictionary(dict_size, values, level=LEVEL)
+    if db.session.get(CompressionDictionary, dictionary.dict_id()) is not None:
+        raise RuntimeError('Dictionary id collision; train again')
+    db.session.add(CompressionDictionary(id=dictionary.dict_id(), name=name, data=dictionary.as_bytes(),
+                                         samples=len(values)))
+    db.session.commit()
+
+    plain = sum(len(v) for v in values)
+    without = sum(len(zstd.ZstdCompressor(level=LEVEL).compress(v)) for v in values)
+    with_dict = sum(len(zstd.ZstdCompressor(level=LEVEL, dict_data=dictionary).compress(v)) for v in values)
+    register(name, dictionary)
+    return {'dictionary': name, 'id': dictionary.dict_id(), 'samples': len(values),
+            'dictionary_bytes': len(dictionary.as_bytes()),
+            'ratio_without_dictionary': round(plain / without, 2),
+            'ratio_with_dictionary': round(plain / with_dict, 2)}
+
+
+def rewrite(batch_size=500, recompress=False):
+    """Compress values stored before their column was compressed (or, with `recompress`, with an
+    older dictionary). Keyset-paged by primary key, one transaction per batch; safe to rerun."""
+    from models import db
+    from unit_of_work import unit_of_work
+    totals = {}
+    for table, column in compressed_columns(db.metadata):
+        pk = table.primary_key.columns.values()[0]
+        counts = totals[f'{table.name}.{column.name}'] = {'rows': 0, 'rewritten': 0, 'bytes_before': 0,
+                                                          'bytes_after': 0}
+        current = _current.get(column.type.dictionary, 0)
+        stmt = update(table).where(pk == bindparam('_pk')).values({column.name: bindparam('_value', type_=LargeBinary)})
+        last = None
+        while True:
+            query = select(pk, type_coerce(column, LargeBinary)).where(column.isnot(None)).order_by(pk).limit(batch_size)
+            if last is not None:
+                query = query.where(pk > last)
+            rows = db.session.execute(query).all()
+            if not rows:
+                break
+            last = rows[-1][0]
+            changed = []
+            for key, value in rows:
+                counts['rows'] += 1
+                stored = value.encode('utf-8') if isinstance(value, str) else bytes(value)
+                dict_id = frame_dictionary(stored)
+                if dict_id is None and len(stored) < MIN_BYTES:
+                    continue
+                if dict_id is not None and (not recompress or dict_id == current):
+                    continue
+                # Through the column type: JSON written by the old column type is re-serialized compactly
+                value = compress(column.type.serialize(column.type.deserialize(decompress(value))),
+                                 column.type.dictionary)
+                if value != stored:
+                    changed.append({'_pk': key, '_value': value})
+                    counts['bytes_before'] += len(stored)
+                    counts['bytes_after'] += len(value)
+            if changed:
+                with unit_of_work():
+                    db.session.execute(stmt, changed)
+                counts['rewritten'] += len(changed)
+        log.info("Compressed %s.%s: %s", table.name, column.name, counts)
+    return totals
@@ -0,0 +1,228 @@
+"""
+Streaming export of one learner's data (GET /api/export).
+
+    GET /api/export?format=ndjson                      everything, one JSON object per line
+    GET /api/export?format=csv&type=quiz_answers       one record type as CSV
+    GET /api/export?format=ndjson&cursor=<cursor>      continue after a record
+
+Record types, in export order: quiz_scores (with answers_data),
+quiz_answers (one record per answer), chat_history, feynman_scores,
+video_summaries, learning_paths (with steps) and learning_path_steps.
+NDJSON defaults to every type except the two flattened ones; `type` takes
+a comma-separated list. CSV takes exactly one type.
+
+Every type is read as one query per source table (archived rows first, see
+retention.py), ordered by (created_at, id) and fetched with
+yield_per(EXPORT_BATCH_SIZE): a server-side cursor on PostgreSQL, fetchmany
+on SQLite. Records are encoded and written in chunks of EXPORT_CHUNK_BYTES
+as they arrive, so memory stays flat however long the history. With
+`Accept-Encoding: gzip` the chunks go through one zlib stream (sync-flushed
+per chunk) and the response is Content-Encoding: gzip.
+
+Every record carries a `cursor` (pagination.encode_cursor of its row,
+prefixed with the type and table and followed by an HMAC signature); pass
+the last one received as `cursor` with the same format and type to
+continue after it. Only resumes from a cursor this server signed skip the
+export rate limit (see `issued()`); the key is EXPORT_CURSOR_SECRET (or
+SECRET_KEY), which all workers must share for that, else a random one per
+process. When one row yields
+several records (the answers of a quiz, the steps of a path) only the last
+carries it, so resume from the last non-empty cursor. `limit` caps the
+rows (quizzes, messages, paths, ...) of one response, at most
+EXPORT_MAX_LIMIT. CSV repeats the
+header only when no cursor is given, so resumed parts can be appended to
+the first.
+"""
+import base64
+import csv
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import zlib
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload, undefer
+
+import metrics
+from models import (ChatHistory, ChatHistoryArchive, FeynmanScore, LearningPath, QuizScore, QuizScoreArchive,
+                    VideoSummary)
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+MAX_LIMIT = int(os.getenv('EXPORT_MAX_LIMIT', '100000'))
+CURSOR_SECRET = (os.getenv('EXPORT_CURSOR_SECRET') or os.getenv('SECRET_KEY') or os.urandom(32).hex()).encode()
+
+EXPORTED = metrics.registry.counter('export_records_total', 'Records written by /api/export', ['type'])
+
+
+def _quiz_scores(score):
+    return [score.to_dict()]
+
+
+def _quiz_answers(score):
+    answers = score.answers_data if isinstance(score.answers_data, list) else []
+    return [{
+        'quiz_score_id': score.id,
+        'quiz_title': score.quiz_title,
+        'created_at': score.created_at.isoformat(),
+        'number': number,
+        'question': answer.get('question'),
+        'topic': answer.get('topic'),
+        'user_answer': answer.get('userAnswer'),
+        'correct_answer': answer.get('correctAnswer'),
+        'is_correct': answer.get('isCorrect'),
+        'options': answer.get('options'),
+    } for number, answer in enumerate(answers, 1) if isinstance(answer, dict)]
+
+
+def _learning_paths(path):
+    return [{**path.to_dict(), 'steps': [step.to_dict() for step in sorted(path.steps, key=lambda s: s.step_number)]}]
+
+
+def _learning_path_steps(path):
+    return [{'learning_path_id': path.id, **step.to_dict()} for step in sorted(path.steps, key=lambda s: s.step_number)]
+
+
+_QUIZ_SOURCES = ((QuizScoreArchive, [undefer(QuizScoreArchive.answers_data)]),
+                 (QuizScore, [undefer(QuizScore.answers_data)]))
+_PATH_SOURCES = ((LearningPath, [selectinload(LearningPath.steps)]),)
+
+# name -> (sources as (model, loader options), row -> records, CSV columns)
+TYPES = {
+    'quiz_scores': (_QUIZ_SOURCES, _quiz_scores,
+                    ['id', 'session_id', 'quiz_title', 'total_questions', 'correct_answers', 'score_percentage',
+                     'created_at', 'archived']),
+    'quiz_answers': (_QUIZ_SOURCES, _quiz_answers,
+                     ['quiz_score_id', 'quiz_title', 'created_at', 'number', 'question', 'topic', 'user_answer',
+                      'correct_answer', 'is_correct', 'options']),
+    'chat_history': (((ChatHistoryArchive, []), (ChatHistory, [])), lambda m: [m.to_dict()],
+                     ['id', 'session_id', 'context', 'user_message', 'ai_response', 'created_at', 'archived']),
+    'feynman_scores': (((FeynmanScore, []),), lambda f: [f.to_dict()],
+                       ['id', 'session_id', 'topic', 'persona', 'score', 'clarity_score', 'depth_score', 'feedback',
+                        'created_at']),
+    'video_summaries': (((VideoSummary, [undefer(VideoSummary.summary_text)]),), lambda v: [v.to_dict()],
+                        ['id', 'title', 'video_url', 'summary_text', 'created_at']),
+    'learning_paths': (_PATH_SOURCES, _learning_paths,
+                       ['id', 'topic', 'level', 'total_steps', 'completed_steps', 'progress', 'created_at']),
+    'learning_path_steps': (_PATH_SOURCES, _learning_path_steps,
+                            ['learning_path_id', 'id', 'step_number', 'title', 'details', 'video_query', 'video_link',
+                             'video_title', 'video_thumbnail', 'video_views', 'coding_link', 'is_completed']),
+}
+NDJSON_DEFAULT = ('quiz_scores', 'chat_history', 'feynman_scores', 'video_summaries', 'learning_paths')
+
+
+def parse_types(fmt, value):
+    """The record types a request asks for; ValueError for an unknown format or type."""
+    if fmt not in ('ndjson', 'csv'):
+        raise ValueError("format must be 'ndjson' or 'csv'")
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in TYPES]
+    if unknown:
+        raise ValueError(f"unknown type {unknown[0]!r}; expected one of {', '.join(TYPES)}")
+    if fmt == 'csv' and len(names) != 1:
+        raise ValueError('CSV exports take exactly one type')
+    # In export order, so a cursor always points forward
+    return [name for name in TYPES if name in names] if names else list(NDJSON_DEFAULT)
+
+
+def _signature(unsigned):
+    digest = hmac.new(CURSOR_SECRET, unsigned.encode(), hashlib.sha256).digest()[:12]
+    return base64.urlsafe_b64encode(digest).decode()
+
+
+def _cursor(name, model, row):
+    unsigned = f'{name}.{model.__tablename__}.{encode_cursor(row.created_at, row.id)}'
+    return f'{unsigned}.{_signature(unsigned)}'
+
+
+def issued(cursor) -> bool:
+    """True if `cursor` was signed by this server (not merely well-formed)."""
+    unsigned, _, signature = (cursor or '').rpartition('.')
+    return bool(unsigned) and hmac.compare_digest(signature, _signature(unsigned))
+
+
+def _position(types, cursor):
+    """(index of the type/table source to start at, (created_at, id) to continue after or None)."""
+    if not cursor:
+        return 0, None
+    try:
+        # An unsigned cursor still resumes; it is only charged like a new export
+        name, table, position = cursor.split('.')[:3]
+    except ValueError:
+        raise InvalidCursor(f'invalid cursor: {cursor!r}')
+    sources = [(n, model.__tablename__) for n in types for model, _ in TYPES[n][0]]
+    if (name, table) not in sources:
+        raise InvalidCursor(f'cursor {cursor!r} does not belong to this export')
+    return sources.index((name, table)), decode_cursor(position)
+
+
+def records(user_id, types, cursor=None, limit=None):
+    """(type, record) pairs for the user's rows after `cursor`. Raises InvalidCursor now, not when iterated."""
+    start, position = _position(types, cursor)
+    return _records(user_id, types, start, position, limit)
+
+
+def _records(user_id, types, start, position, limit):
+    index, sent = -1, 0
+    for name in types:
+        sources, to_records, _ = TYPES[name]
+        for model, options in sources:
+            index += 1
+            if index < start:
+                continue
+            query = model.query.filter_by(user_id=user_id).options(*options)
+            if index == start and position:
+                query = query.filter(tuple_(model.created_at, model.id) > position)
+            query = query.order_by(model.created_at, model.id).yield_per(BATCH_SIZE)
+            for row in query:
+                rows = to_records(row)
+                for i, record in enumerate(rows, 1):
+                    record.pop('user_id', None)
+                    record['cursor'] = _cursor(name, model, row) if i == len(rows) else None
+                    yield name, record
+                EXPORTED.inc(len(rows), type=name)
+                sent += 1
+                if limit and sent >= limit:
+                    return
+
+
+def _csv_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return '' if value is None else value
+
+
+def encode(fmt, types, items, header=True):
+    """Yield the export as UTF-8 byte chunks of about CHUNK_BYTES."""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        columns = TYPES[types[0]][2] + ['cursor']
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(columns)
+    for name, record in items:
+        if fmt == 'csv':
+            writer.writerow([_csv_value(record.get(column)) for column in columns])
+        else:
+            buffer.write(json.dumps({'type': name, **record}, ensure_ascii=False, separators=(',', ':')))
+            buffer.write('\n')
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzipped(chunks):
+    """gzip a chunk stream on the fly; each chunk is sync-flushed so the client can decode as it arrives."""
+    stream = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield stream.compress(chunk) + stream.flush(zlib.Z_SYNC_FLUSH)
+    yield stream.flush()
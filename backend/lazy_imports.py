@@ -0,0 +1,91 @@
+"""
+Deferred imports for heavy optional subsystems.
+
+`whisper = lazy_import('whisper')` binds a proxy that imports the real module
+on first attribute access, so importing app.py (and forking a worker) does
+not pay for torch, yt-dlp, pdfplumber, etc. until a request needs them.
+
+Subsystems can also be warmed up front with `preload()`; run it in the
+master process (e.g. gunicorn --preload with PRELOAD_SUBSYSTEMS set) so the
+loaded pages are shared copy-on-write by every forked worker.
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Module proxy that imports `name` on first attribute access."""
+
+    def __init__(self, name: str):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _load(self):
+        module = self._module
+        if module is not None:
+            return module
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                module = importlib.import_module(self._name)
+                object.__setattr__(self, '_module', module)
+                log.info("Lazy-loaded %s in %.2fs", self._name, time.perf_counter() - started)
+            return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    return name in sys.modules
+
+
+# name -> callable that warms the subsystem
+_SUBSYSTEMS = {}
+
+
+def register_subsystem(name: str, warm):
+    _SUBSYSTEMS[name] = warm
+
+
+def subsystems():
+    return sorted(_SUBSYSTEMS)
+
+
+def preload(names) -> dict:
+    """Warm the named subsystems now; returns {name: seconds}. Unknown names are logged and skipped."""
+    timings = {}
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        warm = _SUBSYSTEMS.get(name)
+        if warm is None:
+            log.warning("Unknown preload subsystem %r (known: %s)", name, ', '.join(subsystems()))
+            continue
+        started = time.perf_counter()
+        try:
+            warm()
+        except Exception as exc:
+            log.warning("Preloading %s failed: %s", name, exc)
+            continue
+        timings[name] = round(time.perf_counter() - started, 3)
+        log.info("Preloaded %s in %.2fs", name, timings[name])
+    return timings
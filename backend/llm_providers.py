@@ -0,0 +1,345 @@
+"""
+LLM providers behind one interface.
+
+Every chat completion in the app goes through `_llm_chat` /
+`_llm_chat_stream` / `_llm_chat_async` in app.py, which call the provider
+returned by `get()`:
+
+    content, usage = provider.chat(messages, temperature, max_tokens)
+    usage = yield from provider.stream(messages, temperature, max_tokens)   # yields text pieces
+    content, usage = await provider.chat_async(messages, temperature, max_tokens)
+
+- `nvidia`: the OpenAI-compatible NVIDIA API (NVIDIA_API_KEY,
+  NVIDIA_API_BASE, NVIDIA_MODEL).
+- `llama_cpp`: a quantized GGUF model on the local CPU through
+  llama-cpp-python (`pip install llama-cpp-python`; LLAMA_MODEL_PATH). The
+  model is loaded once per process and owned by one scheduler thread, since
+  a llama.cpp context must not be used from two threads at once.
+
+LLM_PROVIDER picks one (default `auto`: nvidia when an API key is set,
+otherwise llama_cpp when LLAMA_MODEL_PATH is set), so an offline or keyless
+deployment answers from the local model instead of the canned fallbacks.
+
+The llama_cpp scheduler batches what arrives within LLAMA_BATCH_WINDOW_MS
+(up to LLAMA_MAX_BATCH requests). llama-cpp-python decodes one sequence at
+a time, so batching here means: identical requests in a batch are answered
+by one completion, and the batch runs sorted by prompt so that consecutive
+prompts share their longest prefix (the long system prompts) in llama.cpp's
+KV cache instead of evaluating it again.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from lazy_imports import lazy_import
+
+httpx = lazy_import('httpx')
+llama_cpp = lazy_import('llama_cpp')
+
+log = logging.getLogger(__name__)
+
+
+class Provider:
+    name = 'provider'
+    model = ''
+    # Whether a duplicate request can finish before the original (see llm_router.py)
+    hedgeable = True
+
+    def chat(self, messages, temperature, max_tokens):
+        """(content, usage) for one chat completion."""
+        raise NotImplementedError
+
+    def stream(self, messages, temperature, max_tokens):
+        """Yield the completion text piece by piece; returns usage."""
+        content, usage = self.chat(messages, temperature, max_tokens)
+        yield content
+        return usage
+
+    async def chat_async(self, messages, temperature, max_tokens):
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class NvidiaProvider(Provider):
+    """The NVIDIA (OpenAI-compatible) chat completions API over HTTP."""
+    name = 'nvidia'
+
+    def __init__(self, base, api_key, model, timeout=60):
+        self.base = base
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        # One pooled client per process for the ASGI app (see asgi.py); closed on shutdown
+        self._async_client = None
+
+    @classmethod
+    def from_env(cls, model=None):
+        # Prefer NVIDIA_* env vars, but keep compatibility with OPENAI_* if set
+        return cls(os.getenv('NVIDIA_API_BASE', 'https://integrate.api.nvidia.com/v1'),
+                   os.getenv('NVIDIA_API_KEY') or os.getenv('OPENAI_API_KEY'),
+                   model or os.getenv('NVIDIA_MODEL', 'meta/llama-3.1-8b-instruct'))
+
+    def _request(self, messages, temperature, max_tokens, stream=False):
+        if not self.api_key:
+            raise RuntimeError('Missing NVIDIA_API_KEY environment variable')
+
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+        payload = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': float(temperature),
+            'max_tokens': int(max_tokens),
+            'stream': stream
+        }
+        if stream:
+            # Usage arrives in a final chunk with empty choices
+            payload['stream_options'] = {'include_usage': True}
+        return f"{self.base}/chat/completions", headers, payload
+
+    @staticmethod
+    def _result(response):
+        """(content, usage) from a requests or httpx response."""
+        if response.status_code != 200:
+            raise RuntimeError(f"NVIDIA API error: {response.status_code} - {response.text}")
+
+        result = response.json()
+        return result['choices'][0]['message']['content'], result.get('usage') or {}
+
+    def chat(self, messages, temperature, max_tokens):
+        url, headers, payload = self._request(messages, temperature, max_tokens)
+        return self._result(requests.post(url, headers=headers, json=payload, timeout=self.timeout))
+
+    def stream(self, messages, temperature, max_tokens):
+        url, headers, payload = self._request(messages, temperature, max_tokens, stream=True)
+        usage = {}
+        with requests.post(url, headers=headers, json=payload, timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"NVIDIA API error: {response.status_code} - {response.text}")
+            # Lines as bytes: SSE is UTF-8 whatever charset (if any) the server declares
+            for line in response.iter_lines():
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get('usage') or usage
+                for choice in chunk.get('choices') or ():
+                    piece = (choice.get('delta') or {}).get('content')
+                    if piece:
+                        yield piece
+        return usage
+
+    async def chat_async(self, messages, temperature, max_tokens):
+        url, headers, payload = self._request(messages, temperature, max_tokens)
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=int(os.getenv('ASYNC_LLM_MAX_CONNECTIONS', '1000')),
+                                    max_keepalive_connections=int(os.getenv('ASYNC_LLM_KEEPALIVE', '100'))))
+        return self._result(await self._async_client.post(url, headers=headers, json=payload))
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+class _Job:
+    __slots__ = ('messages', 'temperature', 'max_tokens', 'future', 'pieces', 'cancelled')
+
+    def __init__(self, messages, temperature, max_tokens, stream):
+        self.messages = messages
+        self.temperature = float(temperature)
+        self.max_tokens = int(max_tokens)
+        self.future = Future()
+        self.pieces = queue.Queue() if stream else None
+        self.cancelled = False
+
+    def prompt_key(self):
+        return '\x00'.join(f"{m.get('role')}\x01{m.get('content') or ''}" for m in self.messages)
+
+    def dedupe_key(self):
+        # Streams each need their own pieces; plain completions with the same input share one
+        if self.pieces is not None:
+            return id(self)
+        return json.dumps([self.messages, self.temperature, self.max_tokens], sort_keys=True)
+
+
+class LlamaCppProvider(Provider):
+    """A local GGUF model through llama-cpp-python, served by one scheduler thread per process."""
+    name = 'llama_cpp'
+    # One scheduler thread: a duplicate only queues behind the original
+    hedgeable = False
+
+    def __init__(self, model_path, n_ctx=4096, n_threads=None, batch_window=0.01, max_batch=8, timeout=300):
+        self.model_path = model_path
+        self.model = os.path.basename(model_path) if model_path else 'llama_cpp'
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._llama = None
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, model=None):
+        return cls(model or os.getenv('LLAMA_MODEL_PATH'),
+                   n_ctx=int(os.getenv('LLAMA_N_CTX', '4096')),
+                   n_threads=int(os.getenv('LLAMA_N_THREADS', '0')) or None,
+                   batch_window=float(os.getenv('LLAMA_BATCH_WINDOW_MS', '10')) / 1000,
+                   max_batch=int(os.getenv('LLAMA_MAX_BATCH', '8')),
+                   timeout=float(os.getenv('LLAMA_TIMEOUT', '300')))
+
+    def load(self):
+        """Load the model (once per process) and start the scheduler thread."""
+        with self._lock:
+            if self._llama is None:
+                if not self.model_path:
+                    raise RuntimeError('Missing LLAMA_MODEL_PATH environment variable')
+                started = time.perf_counter()
+                self._llama = llama_cpp.Llama(model_path=self.model_path, n_ctx=self.n_ctx,
+                                              n_threads=self.n_threads, verbose=False)
+                log.info("Loaded %s in %.1fs", self.model, time.perf_counter() - started)
+            # Threads do not survive fork: a worker forked after preload() starts its own
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._serve, name='llama-cpp', daemon=True)
+                self._thread.start()
+        return self._llama
+
+    def _submit(self, messages, temperature, max_tokens, stream=False):
+        self.load()
+        job = _Job(messages, temperature, max_tokens, stream)
+        self._jobs.put(job)
+        return job
+
+    def chat(self, messages, temperature, max_tokens):
+        return self._submit(messages, temperature, max_tokens).future.result(timeout=self.timeout)
+
+    def stream(self, messages, temperature, max_tokens):
+        job = self._submit(messages, temperature, max_tokens, stream=True)
+        try:
+            while True:
+                piece = job.pieces.get(timeout=self.timeout)
+                if piece is None:
+                    break
+                yield piece
+            return job.future.result()[1]
+        finally:
+            # Tells the scheduler to stop decoding if the consumer went away early
+            job.cancelled = True
+
+    async def chat_async(self, messages, temperature, max_tokens):
+        # Loading the model blocks; everything after waits on the scheduler without a thread
+        job = await asyncio.to_thread(self._submit, messages, temperature, max_tokens)
+        return await asyncio.wait_for(asyncio.wrap_future(job.future), self.timeout)
+
+    def _serve(self):
+        while True:
+            batch = [self._jobs.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            groups = {}
+            for job in batch:
+                # A future cancelled while queued (caller timed out or lost a hedge) is skipped
+                if not job.cancelled and job.future.set_running_or_notify_cancel():
+                    groups.setdefault(job.dedupe_key(), []).append(job)
+            # Sorted prompts run back to back with their shared prefix still in the KV cache
+            for jobs in sorted(groups.values(), key=lambda js: js[0].prompt_key()):
+                self._run(jobs)
+
+    def _run(self, jobs):
+        lead = jobs[0]
+        try:
+            if lead.pieces is None:
+                result = self._llama.create_chat_completion(
+                    messages=lead.messages, temperature=lead.temperature, max_tokens=lead.max_tokens)
+                value = (result['choices'][0]['message']['content'] or '', result.get('usage') or {})
+                for job in jobs:
+                    job.future.set_result(value)
+                return
+            completion_tokens = 0
+            for chunk in self._llama.create_chat_completion(
+                    messages=lead.messages, temperature=lead.temperature, max_tokens=lead.max_tokens, stream=True):
+                if lead.cancelled:
+                    break
+                piece = chunk['choices'][0]['delta'].get('content')
+                if piece:
+                    completion_tokens += 1
+                    lead.pieces.put(piece)
+            lead.future.set_result(('', {'completion_tokens': completion_tokens}))
+        except Exception as exc:
+            log.warning("llama.cpp completion failed: %s", exc)
+            for job in jobs:
+                job.future.set_exception(exc)
+        finally:
+            if lead.pieces is not None:
+                lead.pieces.put(None)
+
+
+_FACTORIES = {
+    'nvidia': NvidiaProvider.from_env,
+    'llama_cpp': LlamaCppProvider.from_env,
+}
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def default_name() -> str:
+    name = os.getenv('LLM_PROVIDER', 'auto').strip().lower()
+    if name != 'auto':
+        return name
+    if os.getenv('NVIDIA_API_KEY') or os.getenv('OPENAI_API_KEY') or not os.getenv('LLAMA_MODEL_PATH'):
+        return 'nvidia'
+    return 'llama_cpp'
+
+
+def get(name=None, model=None) -> Provider:
+    """The provider called `name` (default: LLM_PROVIDER) serving `model` (default: its env setting).
+
+    Built from the environment on first use and shared by every caller.
+    """
+    name = name or default_name()
+    provider = _providers.get((name, model))
+    if provider is None:
+        if name not in _FACTORIES:
+            raise RuntimeError(f"Unknown LLM provider {name!r} (expected one of {', '.join(_FACTORIES)})")
+        with _providers_lock:
+            provider = _providers.get((name, model)) or _providers.setdefault((name, model), _FACTORIES[name](model))
+    return provider
+
+
+def parse(spec: str) -> Provider:
+    """The provider for `name` or `name:model` (e.g. `nvidia:meta/llama-3.1-70b-instruct`)."""
+    name, _, model = spec.strip().partition(':')
+    return get(name.strip().lower(), model.strip() or None)
+
+
+async def aclose():
+    """Close pooled async clients (ASGI shutdown)."""
+    for provider in list(_providers.values()):
+        await provider.aclose()
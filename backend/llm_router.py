@@ -0,0 +1,350 @@
+"""
+Latency-aware routing and hedged requests across LLM providers/models.
+
+LLM_CANDIDATES lists the provider/model pairs a call may go to, e.g.
+
+    LLM_CANDIDATES=nvidia:meta/llama-3.1-8b-instruct,nvidia:mistralai/mistral-7b-instruct-v0.3,llama_cpp
+
+(default: just the LLM_PROVIDER provider, i.e. no routing). The call class
+is the `caller` passed to `_llm_chat` (llm_steps handlers pass their
+generator's name, e.g. `_voice_qa_steps`), so a 300-token Feynman reply and
+a 2000-token plan are timed separately. For each class and candidate the router keeps the last
+LLM_ROUTER_WINDOW outcomes (at most LLM_ROUTER_WINDOW_SECONDS old) and
+sends the call to the healthy candidate with the lowest median latency:
+
+- a candidate with fewer than LLM_ROUTER_MIN_SAMPLES outcomes in the class
+  is tried first, so new and recovered candidates get measured;
+- one whose error rate exceeds LLM_ROUTER_MAX_ERROR_RATE is unhealthy and
+  only used when every candidate is; its errors age out of the window, so
+  it is tried again after at most LLM_ROUTER_WINDOW_SECONDS;
+- LLM_ROUTER_EXPLORE (default 0.05) of calls go to a random healthy
+  candidate to keep every latency estimate current.
+
+Hedging (LLM_HEDGE_CALLERS, by default voice Q&A and Feynman chat): if the
+answer has not arrived after the class's p95 latency on that candidate, a
+duplicate goes to the next-best candidate (or the same one) and the first
+successful answer wins. Costs are capped three ways: no hedge before the
+p95 is known, calls asking for more than LLM_HEDGE_MAX_TOKENS are never
+duplicated, and hedges are paid from a budget that grows by
+LLM_HEDGE_BUDGET per eligible call (default 0.1, so at most ~10% extra
+requests) up to LLM_HEDGE_BURST. Streams are routed but not hedged.
+
+Every attempt, hedges included, is recorded in llm_request_duration_seconds
+and llm_tokens_total under its own model, so duplicated spend shows up in
+the token counts; llm_hedges_total counts launched hedges and which side won.
+`answered_by()` names the provider whose answer the last call in this
+thread (or asyncio task) returned, for responses that report it.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import llm_providers
+import metrics
+import profiling
+
+log = logging.getLogger(__name__)
+
+HEDGES = metrics.registry.counter(
+    'llm_hedges_total', 'Hedged LLM calls by outcome (launched, won, lost, no_budget)', ('caller', 'outcome'))
+
+DEFAULT_HEDGE_CALLERS = '_voice_qa_steps,voice_qa_stream,_feynman_chat_steps'
+
+_answered_by = contextvars.ContextVar('llm_answered_by', default=None)
+
+
+def answered_by():
+    """Name of the provider that answered the last successful call in this thread or task (None before any)."""
+    return _answered_by.get()
+
+
+class _Stats:
+    """Rolling outcomes of one candidate for one call class."""
+
+    def __init__(self, size):
+        self.outcomes = deque(maxlen=size)     # (monotonic time, latency or None on error)
+
+    def add(self, now, latency):
+        self.outcomes.append((now, latency))
+
+    def summary(self, now, max_age):
+        while self.outcomes and now - self.outcomes[0][0] > max_age:
+            self.outcomes.popleft()
+        latencies = sorted(latency for _, latency in self.outcomes if latency is not None)
+        n = len(self.outcomes)
+        if not latencies:
+            return n, (1.0 if n else 0.0), None, None
+        return (n, 1 - len(latencies) / n,
+                latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))])
+
+
+class Router:
+    def __init__(self, candidates, window=100, window_seconds=300, min_samples=5, max_error_rate=0.5,
+                 explore=0.05, hedge_callers=(), hedge_budget=0.1, hedge_burst=5, hedge_max_tokens=1500,
+                 hedge_min_delay=0.05, hedge_threads=64):
+        self.candidates = list(candidates)
+        self.window = window
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.explore = explore
+        self.hedge_callers = frozenset(hedge_callers)
+        self.hedge_budget = hedge_budget
+        self.hedge_burst = hedge_burst
+        self.hedge_max_tokens = hedge_max_tokens
+        self.hedge_min_delay = hedge_min_delay
+        self._hedge_tokens = float(hedge_burst)
+        self._hedge_threads = hedge_threads
+        self._pool = None
+        self._stats = {}                        # (call class, candidate index) -> _Stats
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        specs = [s for s in os.getenv('LLM_CANDIDATES', '').split(',') if s.strip()]
+        candidates = [llm_providers.parse(s) for s in specs] or [llm_providers.get()]
+        hedge = os.getenv('LLM_HEDGE', 'off').lower() in ('1', 'on', 'true', 'yes')
+        return cls(candidates,
+                   window=int(os.getenv('LLM_ROUTER_WINDOW', '100')),
+                   window_seconds=float(os.getenv('LLM_ROUTER_WINDOW_SECONDS', '300')),
+                   min_samples=int(os.getenv('LLM_ROUTER_MIN_SAMPLES', '5')),
+                   max_error_rate=float(os.getenv('LLM_ROUTER_MAX_ERROR_RATE', '0.5')),
+                   explore=float(os.getenv('LLM_ROUTER_EXPLORE', '0.05')),
+                   hedge_callers=[c.strip() for c in os.getenv('LLM_HEDGE_CALLERS', DEFAULT_HEDGE_CALLERS).split(',')
+                                  if c.strip()] if hedge else (),
+                   hedge_budget=float(os.getenv('LLM_HEDGE_BUDGET', '0.1')),
+                   hedge_burst=float(os.getenv('LLM_HEDGE_BURST', '5')),
+                   hedge_max_tokens=int(os.getenv('LLM_HEDGE_MAX_TOKENS', '1500')),
+                   hedge_min_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY_MS', '50')) / 1000,
+                   hedge_threads=int(os.getenv('LLM_HEDGE_THREADS', '64')))
+
+    # --- choosing -----------------------------------------------------------
+
+    def _summary(self, call_class, index, now):
+        stats = self._stats.get((call_class, index))
+        return stats.summary(now, self.window_seconds) if stats else (0, 0.0, None, None)
+
+    def rank(self, call_class):
+        """Candidate indexes for `call_class`, best first."""
+        now = time.monotonic()
+        with self._lock:
+            summaries = [self._summary(call_class, i, now) for i in range(len(self.candidates))]
+        scored = []
+        for i, (n, error_rate, p50, _) in enumerate(summaries):
+            if n < self.min_samples:
+                scored.append((0, 0.0, i))          # unmeasured: measure it
+            else:
+                unhealthy = error_rate > self.max_error_rate
+                scored.append((int(unhealthy), p50 if p50 is not None else float('inf'), i))
+        scored.sort()
+        ranked = [i for _, _, i in scored]
+        healthy = [i for unhealthy, _, i in scored if not unhealthy]
+        if len(healthy) > 1 and random.random() < self.explore:
+            first = random.choice(healthy)
+            ranked.remove(first)
+            ranked.insert(0, first)
+        return ranked
+
+    def _hedge_plan(self, call_class, ranked, max_tokens):
+        """(delay, backup index) when this call may be hedged, else None."""
+        if call_class not in self.hedge_callers or max_tokens > self.hedge_max_tokens:
+            return None
+        primary = ranked[0]
+        backups = ranked[1:] or ([primary] if self.candidates[primary].hedgeable else [])
+        if not backups:
+            return None
+        with self._lock:
+            n, _, _, p95 = self._summary(call_class, primary, time.monotonic())
+            if n < self.min_samples or p95 is None:
+                return None
+            self._hedge_tokens = min(self.hedge_burst, self._hedge_tokens + self.hedge_budget)
+        return max(self.hedge_min_delay, p95), backups[0]
+
+    def _take_hedge_token(self):
+        with self._lock:
+            if self._hedge_tokens < 1:
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+    # --- calling ------------------------------------------------------------
+
+    def record(self, call_class, index, latency, ok):
+        with self._lock:
+            stats = self._stats.get((call_class, index))
+            if stats is None:
+                stats = self._stats[call_class, index] = _Stats(self.window)
+            stats.add(time.monotonic(), latency if ok else None)
+
+    def _observe(self, call_class, index, started, usage=None, window=None):
+        """Record one attempt in the router window and the LLM metrics (usage is None on error)."""
+        latency = time.perf_counter() - started
+        model = self.candidates[index].model
+        self.record(window or call_class, index, latency, usage is not None)
+        metrics.LLM_LATENCY.observe(latency, caller=call_class, model=model,
+                                    outcome='ok' if usage is not None else 'error')
+        if usage is not None:
+            metrics.LLM_TOKENS.inc(usage.get('prompt_tokens') or 0, caller=call_class, model=model, kind='prompt')
+            metrics.LLM_TOKENS.inc(usage.get('completion_tokens') or 0, caller=call_class, model=model,
+                                   kind='completion')
+
+    def _answered(self, index, content):
+        _answered_by.set(self.candidates[index].name)
+        return content
+
+    def _call(self, call_class, index, messages, temperature, max_tokens):
+        started = time.perf_counter()
+        try:
+            content, usage = self.candidates[index].chat(messages, temperature, max_tokens)
+        except Exception:
+            self._observe(call_class, index, started)
+            raise
+        self._observe(call_class, index, started, usage)
+        return content
+
+    async def _call_async(self, call_class, index, messages, temperature, max_tokens):
+        started = time.perf_counter()
+        try:
+            content, usage = await self.candidates[index].chat_async(messages, temperature, max_tokens)
+        except Exception:
+            # CancelledError (the other side of a hedge won) is not an Exception: nothing is recorded
+            self._observe(call_class, index, started)
+            raise
+        self._observe(call_class, index, started, usage)
+        return content
+
+    def chat(self, call_class, messages, temperature, max_tokens):
+        """The completion text from the best candidate, hedged when the call class allows it."""
+        ranked = self.rank(call_class)
+        primary = ranked[0]
+        with profiling.span('llm', f'{call_class} {self.candidates[primary].model}'):
+            plan = self._hedge_plan(call_class, ranked, max_tokens)
+            if plan is None:
+                return self._answered(primary, self._call(call_class, primary, messages, temperature, max_tokens))
+
+            delay, backup = plan
+            pool = self._get_pool()
+            first = pool.submit(self._call, call_class, primary, messages, temperature, max_tokens)
+            pending = {first}
+            index = {first: primary}
+            if not wait(pending, timeout=delay).done:
+                if self._take_hedge_token():
+                    HEDGES.inc(caller=call_class, outcome='launched')
+                    hedge = pool.submit(self._call, call_class, backup, messages, temperature, max_tokens)
+                    pending.add(hedge)
+                    index[hedge] = backup
+                else:
+                    HEDGES.inc(caller=call_class, outcome='no_budget')
+            hedged = len(pending) > 1
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if hedged:
+                            HEDGES.inc(caller=call_class, outcome='lost' if future is first else 'won')
+                        # The slower request cannot be aborted; it finishes in the pool and is still measured
+                        return self._answered(index[future], future.result())
+                    error = future.exception()
+            raise error
+
+    async def chat_async(self, call_class, messages, temperature, max_tokens):
+        """chat() for the ASGI app; the losing request of a hedge is cancelled."""
+        ranked = self.rank(call_class)
+        primary = ranked[0]
+        first = asyncio.ensure_future(self._call_async(call_class, primary, messages, temperature, max_tokens))
+        plan = self._hedge_plan(call_class, ranked, max_tokens)
+        if plan is None:
+            return self._answered(primary, await first)
+
+        delay, backup = plan
+        pending = {first}
+        index = {first: primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                if self._take_hedge_token():
+                    HEDGES.inc(caller=call_class, outcome='launched')
+                    hedge = asyncio.ensure_future(
+                        self._call_async(call_class, backup, messages, temperature, max_tokens))
+                    pending.add(hedge)
+                    index[hedge] = backup
+                else:
+                    HEDGES.inc(caller=call_class, outcome='no_budget')
+            hedged = len(pending) > 1
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged:
+                            HEDGES.inc(caller=call_class, outcome='lost' if task is first else 'won')
+                        return self._answered(index[task], task.result())
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stream(self, call_class, messages, temperature, max_tokens):
+        """Yield the completion text from the best candidate for streams of `call_class` (never hedged)."""
+        window = f'{call_class} stream'
+        index = self.rank(window)[0]
+        started = time.perf_counter()
+        try:
+            with profiling.span('llm', f'{call_class} {self.candidates[index].model} stream'):
+                usage = yield from self.candidates[index].stream(messages, temperature, max_tokens)
+        except GeneratorExit:
+            # The consumer went away; says nothing about the provider
+            raise
+        except Exception:
+            self._observe(call_class, index, started, window=window)
+            raise
+        self._observe(call_class, index, started, usage or {}, window)
+        self._answered(index, None)
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self._hedge_threads, thread_name_prefix='llm-hedge')
+        return self._pool
+
+    def snapshot(self):
+        """Per call class and candidate: samples, error rate and latency percentiles (for /api/health)."""
+        now = time.monotonic()
+        with self._lock:
+            keys = sorted(self._stats)
+            rows = []
+            for call_class, index in keys:
+                n, error_rate, p50, p95 = self._summary(call_class, index, now)
+                rows.append({
+                    'class': call_class,
+                    'provider': self.candidates[index].name,
+                    'model': self.candidates[index].model,
+                    'samples': n,
+                    'errorRate': round(error_rate, 3),
+                    'p50': round(p50, 3) if p50 is not None else None,
+                    'p95': round(p95, 3) if p95 is not None else None,
+                })
+        return rows
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get() -> Router:
+    """The process-wide router, built from the environment on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router.from_env()
+    return _router
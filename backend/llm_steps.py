@@ -0,0 +1,54 @@
+"""
+LLM-backed handlers written once for both serving modes.
+
+A handler body is a generator that yields an LLMCall wherever it needs a
+completion and gets the text back from the yield (or the call's exception,
+raised at the yield, so ordinary try/except fallbacks keep working):
+
+    def _feynman_chat_steps():
+        ...
+        ai_text = yield LLMCall(messages, temperature=0.7, max_tokens=300)
+        ...
+        return jsonify({'response': ai_text})
+
+The Flask views drive it synchronously with `run(steps, _llm_chat)`.
+asgi.py drives the same generator with an awaited async client and runs
+only the code between yields (request parsing, DB work) in a worker thread,
+so a request waiting on the model holds no thread.
+"""
+from typing import NamedTuple
+
+
+class LLMCall(NamedTuple):
+    messages: list
+    temperature: float = 0.7
+    max_tokens: int = 1500
+
+
+def advance(steps, value=None, error=None):
+    """Resume `steps` with a completion or an exception; returns (done, LLMCall or final result)."""
+    try:
+        call = steps.throw(error) if error is not None else steps.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+    return False, call
+
+
+def caller_name(steps) -> str:
+    """Handler name used to attribute LLM latency and tokens."""
+    return steps.gi_code.co_name
+
+
+def run(steps, chat):
+    """Drive `steps` to completion, answering each LLMCall with chat(messages, temperature, max_tokens, caller=)."""
+    caller = caller_name(steps)
+    value = error = None
+    while True:
+        done, result = advance(steps, value, error)
+        if done:
+            return result
+        value = error = None
+        try:
+            value = chat(result.messages, result.temperature, result.max_tokens, caller=caller)
+        except Exception as exc:
+            error = exc
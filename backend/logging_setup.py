@@ -0,0 +1,137 @@
+"""
+Structured logging for the backend.
+
+- Leveled loggers (`logging.getLogger(__name__)`) instead of print().
+- JSON lines (LOG_FORMAT=json, the default) or plain text (LOG_FORMAT=text).
+- Every record carries the id of the request that produced it; the id is
+  taken from an incoming X-Request-Id header or generated, and echoed back.
+- High-frequency events can be sampled per call:
+      log.debug("Yielding chunk", extra={'sample_rate': 0.01})
+- Handlers only enqueue records; a QueueListener thread does the actual
+  stdout write, so request threads never block on I/O.
+
+Configure with LOG_LEVEL (default INFO) and LOG_FORMAT.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'sample_rate'}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(g, 'request_id', None) or '-'
+        else:
+            record.request_id = '-'
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Drop a record with probability 1 - record.sample_rate (when given)."""
+
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', None)
+        if rate is None or rate >= 1:
+            return True
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s')
+
+
+class _RequestQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records without formatting them on the request thread."""
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks cannot cross the queue; render them now, keep them separate from msg
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def _install(formatter, level):
+    global _listener
+    q = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    _listener = logging.handlers.QueueListener(q, stream)
+    _listener.start()
+
+    handler = _RequestQueueHandler(q)
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+
+def configure_logging(app=None, level=None, fmt=None):
+    """Install the queue-backed root handler and, if given, the per-request id hooks."""
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'json')).lower()
+    formatter = JsonFormatter() if fmt == 'json' else TextFormatter()
+
+    if _listener is None:
+        _install(formatter, level)
+        atexit.register(lambda: _listener and _listener.stop())
+        # The listener thread does not survive fork(); give each child its own queue and thread
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda: _install(formatter, level))
+    else:
+        logging.getLogger().setLevel(level)
+
+    # Keep third-party client chatter out of INFO logs
+    for noisy in ('urllib3', 'httpx', 'httpcore', 'openai'):
+        logging.getLogger(noisy).setLevel(max(logging.WARNING, logging.getLogger().level))
+
+    if app is not None:
+        @app.before_request
+        def _assign_request_id():
+            g.request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex[:16]
+
+        @app.after_request
+        def _echo_request_id(response):
+            rid = getattr(g, 'request_id', None)
+            if rid:
+                response.headers['X-Request-Id'] = rid
+            return response
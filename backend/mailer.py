@@ -0,0 +1,241 @@
+"""
+Outbound email queue.
+
+Request handlers only insert a row into `outbound_emails`; a background
+worker claims due rows, sends them over one long-lived authenticated SMTP
+connection, and retries failures with exponential backoff under a
+send-rate limit.
+
+The rate limit is per dispatcher process. By default a dispatcher starts
+lazily in each process that enqueues mail, so N web workers may send up to
+N times the rate. For one global limit, turn that off (inline=False,
+EMAIL_INLINE_WORKER=false) and run a single sender process with
+`flask --app app email-worker`.
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from models import db, OutboundEmail
+
+log = logging.getLogger(__name__)
+
+
+class SMTPConfig:
+    def __init__(self, host=None, port=0, user=None, password=None, sender=None,
+                 use_ssl=None, starttls=None, timeout=30):
+        self.host = host
+        self.port = int(port or 0)
+        self.user = user
+        self.password = password
+        self.sender = sender or user
+        # Port 465 is implicit TLS; everything else upgrades with STARTTLS unless disabled
+        self.use_ssl = (self.port == 465) if use_ssl is None else use_ssl
+        self.starttls = (not self.use_ssl) if starttls is None else starttls
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls):
+        starttls = os.getenv('SMTP_STARTTLS')
+        return cls(
+            host=os.getenv('SMTP_HOST'),
+            port=int(os.getenv('SMTP_PORT', '0') or 0),
+            user=os.getenv('SMTP_USER'),
+            password=os.getenv('SMTP_PASS'),
+            sender=os.getenv('SMTP_FROM'),
+            starttls=None if starttls is None else starttls.lower() in ('1', 'true', 'yes'),
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.port and self.sender)
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, up to `capacity` in a burst."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class EmailDispatcher:
+    def __init__(self, app, config: SMTPConfig, rate_per_minute: int = 30, max_attempts: int = 5,
+                 backoff_seconds: int = 30, poll_interval: float = 5.0, idle_timeout: float = 60.0,
+                 batch_size: int = 20, claim_timeout: int = 300, inline: bool = True):
+        self.app = app
+        self.inline = inline
+        self.config = config
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.batch_size = batch_size
+        self.claim_timeout = claim_timeout
+        self._bucket = TokenBucket(rate_per_minute / 60.0, max(1, rate_per_minute // 6))
+        self._conn = None
+        self._last_used = 0.0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # --- producer side ---------------------------------------------------
+
+    def enqueue(self, recipient: str, subject: str, body: str) -> bool:
+        """Persist a message for background delivery. Returns False if SMTP is not configured."""
+        if not self.config.configured:
+            log.warning("SMTP is not fully configured; skipping email send.")
+            return False
+        db.session.add(OutboundEmail(recipient=recipient, subject=subject, body=body))
+        db.session.commit()
+        if self.inline:
+            self.start()
+            self._wake.set()
+        return True
+
+    def pending_count(self) -> int:
+        return OutboundEmail.query.filter(OutboundEmail.status.in_(('pending', 'sending'))).count()
+
+    # --- worker side -----------------------------------------------------
+
+    def start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._conn = None
+            self._thread = threading.Thread(target=self.run_forever, name='email-dispatcher', daemon=True)
+            self._thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    sent = self.process_due()
+            except Exception as exc:
+                log.exception("Email dispatcher error: %s", exc)
+                sent = 0
+            if sent:
+                continue
+            if self._conn is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._disconnect()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def process_due(self) -> int:
+        """Claim and send one batch of due messages. Must run inside an app context."""
+        now = datetime.utcnow()
+        # Recover rows left in 'sending' by a worker that died mid-send
+        OutboundEmail.query.filter(
+            OutboundEmail.status == 'sending',
+            OutboundEmail.claimed_at < now - timedelta(seconds=self.claim_timeout)
+        ).update({'status': 'pending'}, synchronize_session=False)
+        db.session.commit()
+
+        candidates = [row.id for row in OutboundEmail.query.with_entities(OutboundEmail.id).filter(
+            OutboundEmail.status == 'pending',
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at.asc()).limit(self.batch_size)]
+
+        processed = 0
+        for email_id in candidates:
+            # Conditional update so concurrent workers never send the same row twice
+            claimed = OutboundEmail.query.filter_by(id=email_id, status='pending').update(
+                {'status': 'sending', 'claimed_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                continue
+            self._deliver(OutboundEmail.query.get(email_id))
+            processed += 1
+        return processed
+
+    def _deliver(self, row: OutboundEmail):
+        msg = EmailMessage()
+        msg['Subject'] = row.subject
+        msg['From'] = self.config.sender
+        msg['To'] = row.recipient
+        msg.set_content(row.body)
+
+        self._bucket.acquire()
+        try:
+            self._send(msg)
+            row.status = 'sent'
+            row.sent_at = datetime.utcnow()
+            row.last_error = None
+        except Exception as exc:
+            row.attempts = (row.attempts or 0) + 1
+            row.last_error = str(exc)
+            if row.attempts >= self.max_attempts:
+                row.status = 'failed'
+                log.error("Giving up on email %s to %s: %s", row.id, row.recipient, exc)
+            else:
+                row.status = 'pending'
+                delay = min(self.backoff_seconds * (2 ** (row.attempts - 1)), 3600)
+                row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                log.warning("Email %s failed (attempt %d), retrying in %ss: %s", row.id, row.attempts, delay, exc)
+        db.session.commit()
+
+    def _send(self, msg: EmailMessage):
+        for attempt in (1, 2):
+            conn = self._connect()
+            try:
+                conn.send_message(msg)
+                self._last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                # The server dropped our idle connection; reconnect once and retry. Other SMTPExceptions
+                # (OSError subclasses too) are the server's answer, e.g. a 5xx rejection: resending won't help
+                self._disconnect()
+                if attempt == 2:
+                    raise
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        cfg = self.config
+        if cfg.use_ssl:
+            conn = smtplib.SMTP_SSL(cfg.host, cfg.port, timeout=cfg.timeout)
+        else:
+            conn = smtplib.SMTP(cfg.host, cfg.port, timeout=cfg.timeout)
+        try:
+            if cfg.starttls and not cfg.use_ssl:
+                conn.starttls()
+            if cfg.user and cfg.password:
+                conn.login(cfg.user, cfg.password)
+        except BaseException:
+            conn.close()
+            raise
+        self._conn = conn
+        self._last_used = time.monotonic()
+        return conn
+
+    def _disconnect(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
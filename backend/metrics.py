@@ -0,0 +1,405 @@
+"""
+Prometheus-style metrics.
+
+A small in-process registry (counters, histograms, gauges) rendered in the
+Prometheus text exposition format at /metrics.
+
+Multiple worker processes: set METRICS_DIR to a directory shared by all
+workers. Each process periodically writes its own values to
+METRICS_DIR/<pid>-<token>.json (the token keeps a reused PID from
+overwriting an exited worker's file) and /metrics merges every file, so any
+worker can answer a scrape. Counters and histograms are summed across all
+files; gauges over live processes only. The scrape folds the counters and
+histograms of exited workers into METRICS_DIR/exited.json and deletes their
+files, so totals never go backwards and the directory does not grow with
+every restart.
+"""
+import bisect
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import profiling
+
+log = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv('METRICS_DIR')
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+EXITED_FILE = 'exited.json'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def dump(self):
+        with self._lock:
+            return [[list(k), v if not isinstance(v, list) else list(v)] for k, v in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Per-process gauge; values from live processes are summed at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+    def set_function(self, function):
+        """Compute the (unlabelled) value on demand, e.g. a queue's current size."""
+        self._function = function
+
+    def dump(self):
+        if self._function is not None:
+            try:
+                self.set(float(self._function()))
+            except Exception as exc:
+                log.debug("Gauge %s callback failed: %s", self.name, exc)
+        return super().dump()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [per-bucket counts..., +Inf count, sum]
+            state = self._values.get(key)
+            if state is None:
+                state = [0] * (len(self.buckets) + 2)
+                self._values[key] = state
+            state[idx] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._flusher_pid = None
+        self._instance = None           # (pid, token, started) of this process's file
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, function):
+        """Register a scrape-time callback returning [(name, kind, help, [(labels dict, value)])].
+
+        Use this for values that are global rather than per-process (e.g. rows in a queue table).
+        """
+        self._collectors.append(function)
+
+    # --- multi-process support --------------------------------------------
+
+    def _current_instance(self):
+        # Forked workers inherit the parent's registry; each gets its own file
+        if self._instance is None or self._instance[0] != os.getpid():
+            self._instance = (os.getpid(), uuid.uuid4().hex[:8], time.time())
+        return self._instance
+
+    def _snapshot(self):
+        pid, _, started = self._current_instance()
+        return {
+            'pid': pid,
+            'started': started,
+            'metrics': {
+                m.name: {
+                    'kind': m.kind,
+                    'help': m.documentation,
+                    'labelnames': list(m.labelnames),
+                    'buckets': list(getattr(m, 'buckets', ())),
+                    'values': m.dump(),
+                } for m in list(self._metrics.values())
+            }
+        }
+
+    def flush(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self._snapshot(), fh)
+        pid, token, _ = self._current_instance()
+        os.replace(tmp, os.path.join(self.directory, f'{pid}-{token}.json'))
+
+    def start_flusher(self):
+        """Start the periodic per-process flush (no-op without METRICS_DIR)."""
+        if not self.directory:
+            return
+        if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+                return
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as exc:
+                log.warning("Metrics flush failed: %s", exc)
+
+    def _load_snapshots(self):
+        if not self.directory:
+            return [self._snapshot()]
+        self.flush()
+        exited_path = os.path.join(self.directory, EXITED_FILE)
+        with _directory_lock(self.directory):
+            snapshots = {}
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                try:
+                    with open(path) as fh:
+                        snapshots[path] = json.load(fh)
+                except (OSError, ValueError):
+                    continue
+            exited = snapshots.pop(exited_path, None) or {'pid': None, 'metrics': {}}
+
+            # A PID belongs to one live process at most: the newest file that claims it
+            newest = {}
+            for path, snap in snapshots.items():
+                pid = snap.get('pid')
+                if pid not in newest or snap.get('started', 0) > snapshots[newest[pid]].get('started', 0):
+                    newest[pid] = path
+            dead = [path for path, snap in snapshots.items()
+                    if newest.get(snap.get('pid')) != path or not _pid_alive(snap.get('pid'))]
+            if dead:
+                for path in dead:
+                    _add_totals(exited, snapshots.pop(path))
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'w') as fh:
+                    json.dump(exited, fh)
+                os.replace(tmp, exited_path)
+                for path in dead:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        return list(snapshots.values()) + [exited]
+
+    # --- exposition ---------------------------------------------------------
+
+    def render(self) -> str:
+        merged = {}
+        for snap in self._load_snapshots():
+            # Files of exited workers are folded into exited.json, which keeps no gauges
+            _merge_values(merged, snap.get('metrics', {}))
+
+        lines = []
+        for name in sorted(merged):
+            m = merged[name]
+            lines.append(f"# HELP {name} {m['help']}")
+            lines.append(f"# TYPE {name} {m['kind']}")
+            labelnames = m['labelnames']
+            for key, value in sorted(m['values'].items()):
+                pairs = list(zip(labelnames, key))
+                if m['kind'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(list(m['buckets']) + ['+Inf'], value[:-1]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(pairs)} {value[-1]}")
+                    lines.append(f"{name}_count{_format_labels(pairs)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_format_labels(pairs)} {value}")
+
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, samples in collector():
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for labels, value in samples:
+                        lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+            except Exception as exc:
+                log.warning("Metrics collector failed: %s", exc)
+        return '\n'.join(lines) + '\n'
+
+
+def _merge_values(merged, metrics):
+    """Add `metrics` ({name: metric dict} of a snapshot) into `merged` in place, keyed by label values."""
+    for name, m in metrics.items():
+        target = merged.setdefault(name, {**m, 'values': {}})
+        for labels, value in m['values']:
+            key = tuple(labels)
+            if m['kind'] == 'histogram':
+                prev = target['values'].get(key)
+                target['values'][key] = value if prev is None else [a + b for a, b in zip(prev, value)]
+            else:
+                target['values'][key] = target['values'].get(key, 0) + value
+
+
+def _add_totals(exited, snap):
+    """Fold an exited worker's counters and histograms into the `exited` snapshot."""
+    merged = {name: {**m, 'values': dict((tuple(labels), value) for labels, value in m['values'])}
+              for name, m in exited['metrics'].items()}
+    _merge_values(merged, {name: m for name, m in snap.get('metrics', {}).items() if m['kind'] != 'gauge'})
+    exited['metrics'] = {name: {**m, 'values': [[list(key), value] for key, value in m['values'].items()]}
+                         for name, m in merged.items()}
+
+
+@contextmanager
+def _directory_lock(directory):
+    """Serialize scrapes that fold exited workers' files (POSIX; elsewhere only one worker runs)."""
+    if os.name != 'posix':
+        yield
+        return
+    import fcntl
+    with open(os.path.join(directory, '.lock'), 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+registry = Registry(METRICS_DIR)
+
+# --- Metrics shared across the backend ---------------------------------------
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('route', 'method', 'status'))
+REQUEST_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'SQL statements executed per request', ('route',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250))
+LLM_LATENCY = registry.histogram(
+    'llm_request_duration_seconds', 'LLM call latency by calling function', ('caller', 'model', 'outcome'))
+LLM_TOKENS = registry.counter(
+    'llm_tokens_total', 'LLM tokens by calling function', ('caller', 'model', 'kind'))
+STAGE_LATENCY = registry.histogram(
+    'stage_duration_seconds', 'Latency of expensive pipeline stages (whisper_load, whisper_transcribe, ffmpeg_decode, pdf_extract_page, ...)',
+    ('stage',))
+CACHE_REQUESTS = registry.counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ('cache', 'result'))
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time one pipeline stage into stage_duration_seconds (and the request profile, if any)."""
+    with STAGE_LATENCY.time(stage=stage), profiling.span('stage', stage):
+        yield
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def init_app(app):
+    """Instrument request latency and per-request SQL counts, and expose /metrics."""
+    from flask import Response, g, request
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        from flask import has_request_context
+        if has_request_context():
+            g.db_queries = getattr(g, 'db_queries', 0) + 1
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        registry.start_flusher()
+
+    @app.after_request
+    def _record_request(response):
+        started = getattr(g, 'request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.observe(time.perf_counter() - started, route=route,
+                                    method=request.method, status=response.status_code)
+            REQUEST_DB_QUERIES.observe(getattr(g, 'db_queries', 0), route=route)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -2,6 +2,8 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from compression import CompressedJSON, CompressedText
+
 db = SQLAlchemy()
 
 class User(db.Model):
@@ -55,12 +57,13 @@ class QuizScore(db.Model):
     total_questions = db.Column(db.Integer, nullable=False)
     correct_answers = db.Column(db.Integer, nullable=False)
     score_percentage = db.Column(db.Float, nullable=False)
-    answers_data = db.Column(db.JSON, nullable=True)  # Store detailed answers
+    # Detailed answers; zstd-compressed and loaded only when accessed or undefer()ed (see compression.py)
+    answers_data = db.deferred(db.Column(CompressedJSON('quiz_scores.answers_data'), nullable=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     
-    def to_dict(self):
+    def to_dict(self, include_answers=True):
         """Convert quiz score to dictionary"""
-        return {
+        data = {
             'id': self.id,
             'user_id': self.user_id,
             'session_id': self.session_id,
@@ -68,9 +71,11 @@ class QuizScore(db.Model):
             'total_questions': self.total_questions,
             'correct_answers': self.correct_answers,
             'score_percentage': self.score_percentage,
-            'answers_data': self.answers_data,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+        if include_answers:
+            data['answers_data'] = self.answers_data
+        return data
 
 
 class ChatSession(db.Model):
@@ -82,6 +87,16 @@ class ChatSession(db.Model):
     mode = db.Column(db.String(50), default='chat')  # 'chat', 'interview', 'feynman'
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # Denormalized for the session list; maintained when a message is added (app._add_chat_message)
+    message_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    last_preview = db.Column(db.String(200), nullable=True)
+
+    # Sidebar: newest sessions of one user, keyset-paged on (updated_at, id)
+    __table_args__ = (
+        db.Index('ix_chat_sessions_user_updated', user_id, updated_at.desc(), id.desc()),
+    )
     
     # Relationship
     messages = db.relationship('ChatHistory', backref='session', lazy=True, cascade='all, delete-orphan')
@@ -92,6 +107,9 @@ class ChatSession(db.Model):
             'user_id': self.user_id,
             'title': self.title,
             'mode': self.mode,
+            'message_count': self.message_count or 0,
+            'last_message_at': self.last_message_at.isoformat() if self.last_message_at else None,
+            'last_preview': self.last_preview,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -99,6 +117,11 @@ class ChatSession(db.Model):
 
 class ChatHistory(db.Model):
     __tablename__ = 'chat_history'
+    # Keyset pagination on (created_at, id) per user / per session (see pagination.py)
+    __table_args__ = (
+        db.Index('ix_chat_history_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_chat_history_session_created', 'session_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)  # Nullable for anonymous
@@ -127,7 +150,7 @@ class Document(db.Model):
     id = db.Column(db.String(36), primary_key=True)  # UUID
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     filename = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=False)  # Extracted text content
+    content = db.deferred(db.Column(CompressedText('documents.content'), nullable=False))  # Extracted text content
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     def to_dict(self):
@@ -139,6 +162,203 @@ class Document(db.Model):
         }
 
 
+class OutboundEmail(db.Model):
+    __tablename__ = 'outbound_emails'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+
+class InflightRequest(db.Model):
+    """Cross-worker single-flight lock; holds the shared result briefly once done (see singleflight.py)."""
+    __tablename__ = 'inflight_requests'
+
+    key = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)
+    status = db.Column(db.String(20), default='running', nullable=False)  # running, done
+    result = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class QuestionBankItem(db.Model):
+    """A generated quiz question kept for reuse with the same source text (see question_bank.py)."""
+    __tablename__ = 'question_bank'
+    __table_args__ = (
+        db.Index('ix_question_bank_source_topic', 'source_hash', 'topic'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)  # UUID, also the quiz item id
+    source_hash = db.Column(db.String(64), nullable=False)  # sha256 of the normalized source text
+    topic = db.Column(db.String(100), nullable=False, default='General')
+    question = db.Column(db.Text, nullable=False)
+    options = db.Column(db.JSON, nullable=False)
+    correct_answer = db.Column(db.Integer, nullable=False)
+    times_served = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_item(self):
+        return {
+            'id': self.id,
+            'question': self.question,
+            'options': self.options,
+            'correctAnswer': self.correct_answer,
+            'topic': self.topic
+        }
+
+
+class QuestionBankServe(db.Model):
+    """A bank question already given to a learner, so they are not served it again."""
+    __tablename__ = 'question_bank_serves'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    item_id = db.Column(db.String(36), db.ForeignKey('question_bank.id'), primary_key=True)
+    served_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ReviewState(db.Model):
+    """SM-2 memory state of one topic for one learner (see spaced_repetition.py)."""
+    __tablename__ = 'review_states'
+    __table_args__ = (
+        # The review queue is a range scan: WHERE user_id = ? AND due_at <= now ORDER BY due_at
+        db.Index('ix_review_states_user_due', 'user_id', 'due_at'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    topic = db.Column(db.String(255), primary_key=True)
+    ease = db.Column(db.Float, default=2.5, nullable=False)
+    interval_days = db.Column(db.Integer, default=0, nullable=False)
+    repetitions = db.Column(db.Integer, default=0, nullable=False)  # successful reviews in a row
+    lapses = db.Column(db.Integer, default=0, nullable=False)
+    correct = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    last_grade = db.Column(db.Integer, nullable=True)  # 0-5
+    last_reviewed_at = db.Column(db.DateTime, nullable=True)
+    due_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'topic': self.topic,
+            'dueAt': self.due_at.isoformat() if self.due_at else None,
+            'lastReviewedAt': self.last_reviewed_at.isoformat() if self.last_reviewed_at else None,
+            'intervalDays': self.interval_days,
+            'ease': round(self.ease, 2),
+            'repetitions': self.repetitions,
+            'lapses': self.lapses,
+            'lastGrade': self.last_grade,
+            'accuracy': round(self.correct / self.total * 100, 1) if self.total else None
+        }
+
+
+class CompressionDictionary(db.Model):
+    """A zstd dictionary for compressed columns (see compression.py); the newest per name is used for writes."""
+    __tablename__ = 'compression_dictionaries'
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)  # zstd dictionary id
+    name = db.Column(db.String(100), nullable=False, index=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class QuizScoreArchive(db.Model):
+    """Quiz scores moved out of quiz_scores by retention.py; partitioned by month on PostgreSQL."""
+    __tablename__ = 'quiz_scores_archive'
+    # The partition key has to be part of the primary key
+    __table_args__ = (
+        db.Index('ix_quiz_scores_archive_user_created', 'user_id', 'created_at'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    session_id = db.Column(db.String(255), nullable=True)
+    quiz_title = db.Column(db.String(500), nullable=True)
+    total_questions = db.Column(db.Integer, nullable=False)
+    correct_answers = db.Column(db.Integer, nullable=False)
+    score_percentage = db.Column(db.Float, nullable=False)
+    answers_data = db.deferred(db.Column(CompressedJSON('quiz_scores.answers_data'), nullable=True))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self, include_answers=True):
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'session_id': self.session_id,
+            'quiz_title': self.quiz_title,
+            'total_questions': self.total_questions,
+            'correct_answers': self.correct_answers,
+            'score_percentage': self.score_percentage,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'archived': True
+        }
+        if include_answers:
+            data['answers_data'] = self.answers_data
+        return data
+
+
+class ChatHistoryArchive(db.Model):
+    """Chat messages moved out of chat_history by retention.py; partitioned by month on PostgreSQL."""
+    __tablename__ = 'chat_history_archive'
+    __table_args__ = (
+        db.Index('ix_chat_history_archive_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_chat_history_archive_session_created', 'session_id', 'created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    # No foreign key: deleting a session deletes its archived messages explicitly (app.delete_chat_session)
+    session_id = db.Column(db.String(255), nullable=True)
+    user_message = db.Column(CompressedText('chat_history_archive'), nullable=False)
+    ai_response = db.Column(CompressedText('chat_history_archive'), nullable=False)
+    context = db.Column(db.String(100), nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'session_id': self.session_id,
+            'user_message': self.user_message,
+            'ai_response': self.ai_response,
+            'context': self.context,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'archived': True
+        }
+
+
+class QuizRollup(db.Model):
+    """Totals of a user's archived quiz scores (see retention.py), added to what is computed from quiz_scores."""
+    __tablename__ = 'quiz_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'name', name='uq_quiz_rollups_user_kind_name'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'all', 'subject', 'active' or 'topic'
+    name = db.Column(db.String(500), nullable=False, default='')  # subject or topic; '' for the per-user kinds
+    quizzes = db.Column(db.Integer, nullable=False, default=0)
+    questions = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    last_score = db.Column(db.Float, nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
 class FocusAreaDismissal(db.Model):
     __tablename__ = 'focus_area_dismissals'
     
@@ -243,18 +463,20 @@ class VideoSummary(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     video_url = db.Column(db.String(500), nullable=True)
     title = db.Column(db.String(255), nullable=False)
-    summary_text = db.Column(db.Text, nullable=False)
+    summary_text = db.deferred(db.Column(CompressedText('video_summaries.summary_text'), nullable=False))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_text=True):
+        data = {
             'id': self.id,
             'user_id': self.user_id,
             'video_url': self.video_url,
             'title': self.title,
-            'summary_text': self.summary_text,
             'created_at': self.created_at.isoformat()
         }
+        if include_text:
+            data['summary_text'] = self.summary_text
+        return data
 
 class CommunityTopic(db.Model):
     __tablename__ = 'community_topics'
@@ -302,4 +524,4 @@ class CommunityComment(db.Model):
             'username': self.user.username if self.user else 'Unknown',
             'content': self.content,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
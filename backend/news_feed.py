@@ -0,0 +1,176 @@
+"""
+In-memory news feed aggregator backing /api/news.
+
+Feeds are fetched on a background thread with conditional GET (ETag /
+Last-Modified), parsed once, and kept as an immutable snapshot so requests
+never touch the network.
+
+Configure with NEWS_FEEDS, a comma-separated list of feed URLs. Each URL may
+carry its own staleness limit in seconds after a '|', e.g.
+    NEWS_FEEDS="http://feeds.bbci.co.uk/news/world/rss.xml|3600,https://example.com/rss|900"
+Entries from a feed whose last successful fetch is older than its limit are
+left out of the snapshot until the feed recovers.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FEEDS = 'http://feeds.bbci.co.uk/news/world/rss.xml'
+DEFAULT_MAX_AGE = int(os.getenv('NEWS_MAX_AGE', '3600'))
+REFRESH_INTERVAL = int(os.getenv('NEWS_REFRESH_INTERVAL', '300'))
+FETCH_TIMEOUT = float(os.getenv('NEWS_FETCH_TIMEOUT', '10'))
+MAX_ENTRIES_PER_FEED = 50
+
+
+class FeedState:
+    """Fetch state and parsed articles for one configured feed."""
+
+    def __init__(self, url: str, max_age: int):
+        self.url = url
+        self.max_age = max_age
+        self.etag = None
+        self.modified = None
+        self.articles = ()
+        self.fetched_at = 0.0
+        self.next_refresh_at = 0.0
+        self.last_error = None
+
+    def is_fresh(self, now: float) -> bool:
+        return bool(self.articles) and (now - self.fetched_at) <= self.max_age
+
+
+def parse_feed_config(raw: str, default_max_age: int = DEFAULT_MAX_AGE):
+    feeds = []
+    for part in (raw or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        url, _, max_age = part.partition('|')
+        try:
+            age = int(max_age) if max_age.strip() else default_max_age
+        except ValueError:
+            age = default_max_age
+        feeds.append(FeedState(url.strip(), age))
+    return feeds
+
+
+def _article_from_entry(entry) -> dict:
+    return {
+        'title': entry.get('title', ''),
+        'link': entry.get('link', ''),
+        'summary': entry.get('summary', ''),
+        'published': entry.get('published', '')
+    }
+
+
+class FeedAggregator:
+    def __init__(self, feeds, refresh_interval: int = REFRESH_INTERVAL, fetch_timeout: float = FETCH_TIMEOUT):
+        self.feeds = list(feeds)
+        self.refresh_interval = refresh_interval
+        self.fetch_timeout = fetch_timeout
+        self._http = requests.Session()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Start the refresh thread once per process (safe to call on every request)."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # After a fork the parent's thread does not exist in this process
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='news-feed-refresh', daemon=True)
+            self._thread.start()
+
+    def wait_ready(self, timeout: float) -> bool:
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        while True:
+            now = self.refresh_due()
+            self._ready.set()
+            next_due = min(s.next_refresh_at for s in self.feeds) if self.feeds else now + self.refresh_interval
+            time.sleep(max(1.0, next_due - time.time()))
+
+    def refresh_due(self) -> float:
+        """Refresh every feed whose schedule has come up; returns the current time."""
+        now = time.time()
+        for state in self.feeds:
+            if state.next_refresh_at <= now:
+                self.refresh_feed(state)
+                # Refresh often enough that a healthy feed never goes stale
+                every = min(self.refresh_interval, max(30, state.max_age // 2))
+                state.next_refresh_at = time.time() + every
+        return now
+
+    def refresh_feed(self, state: FeedState) -> None:
+        headers = {}
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.modified:
+            headers['If-Modified-Since'] = state.modified
+        try:
+            response = self._http.get(state.url, headers=headers, timeout=self.fetch_timeout)
+            if response.status_code == 304:
+                state.fetched_at = time.time()
+                state.last_error = None
+                return
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+
+            import feedparser  # deferred: only the refresh thread needs it
+            parsed = feedparser.parse(response.content)
+            articles = tuple(_article_from_entry(e) for e in parsed.entries[:MAX_ENTRIES_PER_FEED])
+            if not articles and parsed.bozo:
+                raise RuntimeError(f"unparseable feed: {parsed.get('bozo_exception')}")
+
+            # Swap in a new tuple; readers holding the old one are unaffected
+            state.articles = articles
+            state.etag = response.headers.get('ETag')
+            state.modified = response.headers.get('Last-Modified')
+            state.fetched_at = time.time()
+            state.last_error = None
+        except Exception as exc:
+            state.last_error = str(exc)
+            log.warning("News feed refresh failed for %s: %s", state.url, exc)
+
+    def articles(self) -> list:
+        """All articles from feeds that are still within their staleness limit."""
+        now = time.time()
+        combined = []
+        for state in self.feeds:
+            if state.is_fresh(now):
+                combined.extend(state.articles)
+        return combined
+
+    def sample(self, count: int) -> list:
+        articles = self.articles()
+        if len(articles) <= count:
+            shuffled = list(articles)
+            random.shuffle(shuffled)
+            return shuffled
+        return random.sample(articles, count)
+
+    def status(self) -> list:
+        now = time.time()
+        return [{
+            'url': s.url,
+            'fresh': s.is_fresh(now),
+            'articles': len(s.articles),
+            'age': round(now - s.fetched_at, 1) if s.fetched_at else None,
+            'maxAge': s.max_age,
+            'error': s.last_error
+        } for s in self.feeds]
+
+
+news_aggregator = FeedAggregator(parse_feed_config(os.getenv('NEWS_FEEDS', DEFAULT_FEEDS)))
@@ -0,0 +1,81 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+A page is ordered by (timestamp, id) and the cursor is the position of its
+last row, so the next page is `WHERE (ts, id) < (:ts, :id) ORDER BY ts DESC,
+id DESC LIMIT n`: one index range scan however deep the client pages,
+instead of OFFSET re-reading every skipped row. Rows inserted meanwhile do
+not shift later pages.
+
+    rows, next_cursor = keyset_page(query, ChatHistory.created_at, ChatHistory.id,
+                                    request.args.get('cursor'), parse_limit(request.args.get('limit')))
+
+`keyset_pages()` pages through several sources in turn, such as the live
+chat history followed by its archive (retention.py).
+
+Cursors are opaque URL-safe strings; a malformed one raises InvalidCursor
+(respond 400).
+"""
+import base64
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = int(os.getenv('PAGE_DEFAULT_LIMIT', '50'))
+MAX_LIMIT = int(os.getenv('PAGE_MAX_LIMIT', '200'))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT) -> int:
+    """Page size from a query-string value, clamped to 1..maximum."""
+    try:
+        limit = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(ts, row_id) -> str:
+    raw = json.dumps([ts.isoformat() if ts else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from encode_cursor()."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), row_id
+    except Exception as exc:
+        raise InvalidCursor(f'invalid cursor: {cursor!r}') from exc
+
+
+def keyset_page(query, ts_column, id_column, cursor=None, limit=DEFAULT_LIMIT, descending=True):
+    """(rows, next_cursor) for one page of `query`; next_cursor is None on the last page."""
+    return keyset_pages([(query, ts_column, id_column)], cursor, limit, descending)
+
+
+def keyset_pages(sources, cursor=None, limit=DEFAULT_LIMIT, descending=True):
+    """keyset_page over several (query, ts_column, id_column) sources whose rows follow one another in
+    page order, e.g. live rows then their archive: a source is only read once the ones before it run out."""
+    position = decode_cursor(cursor) if cursor else None
+    rows = []
+    for query, ts_column, id_column in sources:
+        if position:
+            key = tuple_(ts_column, id_column)
+            query = query.filter(key < position if descending else key > position)
+        order = (ts_column.desc(), id_column.desc()) if descending else (ts_column.asc(), id_column.asc())
+        # One extra row tells whether there is a next page without a COUNT
+        rows.extend(query.order_by(*order).limit(limit + 1 - len(rows)).all())
+        if len(rows) > limit:
+            break
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, ts_column.key), getattr(last, id_column.key))
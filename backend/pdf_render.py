@@ -0,0 +1,219 @@
+"""
+PDF rendering for the Q&A / quiz export and the answer key.
+
+- Unicode text: a TrueType font (PDF_FONT_PATH and PDF_FONT_BOLD_PATH, or
+  DejaVu Sans from the usual system locations) is parsed once per process
+  into a template document; each render deep-copies the template (~10 ms)
+  instead of re-registering the font (~100 ms). fpdf2 shares the parsed
+  fontTools object between copies and subsets it in place on output(), so
+  every copy gets its own lazily-loaded TTFont over the cached font bytes.
+  Without a TTF the core Helvetica font is used and text is folded to Latin-1.
+- Output is cached on disk under PDF_CACHE_DIR by a hash of the kind, title
+  and items, so re-exporting the same quiz is a file lookup. Views send the
+  cached file with send_file, which streams it from disk instead of copying
+  the document through BytesIO. PDF_CACHE_MAX_FILES bounds the directory.
+- Identical concurrent renders are coalesced (see singleflight.py).
+"""
+import copy
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import metrics
+from lazy_imports import lazy_import
+from singleflight import SingleFlight
+
+fpdf = lazy_import('fpdf')
+ttLib = lazy_import('fontTools.ttLib')
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv('PDF_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'sla-pdf-cache')
+CACHE_MAX_FILES = int(os.getenv('PDF_CACHE_MAX_FILES', '500'))
+FONT_FAMILY = 'Unicode'
+
+# Bump when the layout changes so stale cached files are not served
+RENDER_VERSION = 1
+
+_FONT_CANDIDATES = (
+    ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+    ('/usr/share/fonts/dejavu/DejaVuSans.ttf', '/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf'),
+    ('/usr/share/fonts/TTF/DejaVuSans.ttf', '/usr/share/fonts/TTF/DejaVuSans-Bold.ttf'),
+    ('/Library/Fonts/Arial Unicode.ttf', None),
+    ('C:\\Windows\\Fonts\\arial.ttf', 'C:\\Windows\\Fonts\\arialbd.ttf'),
+)
+
+# Core-font fallback for characters outside Latin-1
+_LATIN1_MARKERS = {'✓': '(correct)', '○': '', '•': '-', '–': '-', '—': '-', '“': '"', '”': '"', '‘': "'", '’': "'"}
+
+_template = None
+_template_lock = threading.Lock()
+_render_flight = SingleFlight('pdf_render', cross_worker=False)
+
+
+def _font_paths():
+    regular = os.getenv('PDF_FONT_PATH')
+    if regular:
+        return regular, os.getenv('PDF_FONT_BOLD_PATH')
+    for regular, bold in _FONT_CANDIDATES:
+        if os.path.exists(regular):
+            return regular, bold if bold and os.path.exists(bold) else None
+    return None, None
+
+
+def _build_template():
+    """(template document, has Unicode font, font key -> font file bytes)."""
+    pdf = fpdf.FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    regular, bold = _font_paths()
+    if not regular:
+        log.warning("No Unicode TTF font found (set PDF_FONT_PATH); PDF text is limited to Latin-1")
+        return pdf, False, {}
+    try:
+        pdf.add_font(FONT_FAMILY, '', regular)
+        pdf.add_font(FONT_FAMILY, 'B', bold or regular)
+        font_bytes = {}
+        for key, font in pdf.fonts.items():
+            with open(font.ttffile, 'rb') as fh:
+                font_bytes[key] = fh.read()
+    except Exception as exc:
+        log.warning("Could not load PDF font %s, falling back to Latin-1: %s", regular, exc)
+        pdf = fpdf.FPDF()
+        pdf.set_auto_page_break(True, margin=15)
+        return pdf, False, {}
+    return pdf, True, font_bytes
+
+
+def warm():
+    """Parse the font into the template now (used by PRELOAD_SUBSYSTEMS=pdf)."""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = _build_template()
+        return _template
+
+
+def _new_document():
+    template, unicode, font_bytes = warm()
+    with _template_lock:
+        pdf = copy.deepcopy(template)
+    for key, data in font_bytes.items():
+        # Lazy: only the table directory is read here (~0.2 ms)
+        pdf.fonts[key].ttfont = ttLib.TTFont(io.BytesIO(data), recalcTimestamp=False, lazy=True)
+    return pdf, unicode
+
+
+def _text(unicode, value) -> str:
+    text = str(value)
+    if unicode:
+        return text
+    for char, replacement in _LATIN1_MARKERS.items():
+        text = text.replace(char, replacement)
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+def _set_font(pdf, unicode, style, size):
+    pdf.set_font(FONT_FAMILY if unicode else 'Helvetica', style, size)
+
+
+def _line(pdf, unicode, height, text):
+    pdf.multi_cell(0, height, _text(unicode, text), new_x='LMARGIN', new_y='NEXT')
+
+
+def build(kind, title, items):
+    """Lay out a 'qa' export or an 'answer_key' (options marked ✓/○); returns the FPDF document."""
+    pdf, unicode = _new_document()
+    pdf.add_page()
+    pdf.set_title(_text(unicode, title))
+    _set_font(pdf, unicode, 'B', 16)
+    pdf.cell(0, 10, _text(unicode, title), new_x='LMARGIN', new_y='NEXT')
+    pdf.ln(4)
+    for idx, item in enumerate(items, start=1):
+        question_text = str(item.get('question', ''))
+        options = item.get('options', [])
+        correct_answer = item.get('correctAnswer', 0)
+
+        _set_font(pdf, unicode, 'B', 12)
+        _line(pdf, unicode, 8, f"Q{idx}: {question_text}")
+        _set_font(pdf, unicode, '', 12)
+
+        if options and len(options) == 4:
+            if kind == 'answer_key':
+                lines = [f"   {chr(65+i)}. {option} {'✓' if i == correct_answer else '○'}"
+                         for i, option in enumerate(options)]
+            else:
+                lines = [f"   {chr(65+i)}. {option}" for i, option in enumerate(options)]
+            _line(pdf, unicode, 8, '\n'.join(lines))
+        else:
+            # Fallback for old format
+            _line(pdf, unicode, 8, f"A{idx}: {item.get('answer', '')}")
+
+        pdf.ln(2)
+    return pdf
+
+
+def content_key(kind, title, items) -> str:
+    payload = json.dumps([RENDER_VERSION, kind, title, items], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_to_file(kind, title, items) -> str:
+    """Path of the cached PDF for this content, rendering it first if needed."""
+    key = content_key(kind, title, items)
+    path = os.path.join(CACHE_DIR, f'{key}.pdf')
+    if os.path.exists(path):
+        metrics.cache_lookup('pdf', True)
+        try:
+            os.utime(path)      # keep recently used exports through pruning
+        except OSError:
+            pass
+        return path
+    metrics.cache_lookup('pdf', False)
+    return _render_flight.do(key, lambda: _render(kind, title, items, path))
+
+
+def open_pdf(kind, title, items):
+    """Open binary file of the rendered PDF, for send_file (stays readable if pruned meanwhile)."""
+    try:
+        return open(render_to_file(kind, title, items), 'rb')
+    except FileNotFoundError:
+        # Pruned between the lookup and the open by another worker; render it again
+        return open(render_to_file(kind, title, items), 'rb')
+
+
+def _render(kind, title, items, path):
+    if os.path.exists(path):
+        return path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with metrics.stage_timer('pdf_render'):
+        pdf = build(kind, title, items)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(pdf.output())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    _prune()
+    return path
+
+
+def _prune():
+    try:
+        entries = [e for e in os.scandir(CACHE_DIR) if e.name.endswith('.pdf')]
+    except OSError:
+        return
+    if len(entries) <= CACHE_MAX_FILES:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - CACHE_MAX_FILES]:
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
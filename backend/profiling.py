@@ -0,0 +1,412 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries `X-Profile: 1` together with the admin
+token (`X-Admin-Token` or `Authorization: Bearer`), or at random with
+probability PROFILE_SAMPLE_RATE (default 0). While it runs:
+
+- a shared sampler thread snapshots the request thread's Python stack every
+  PROFILE_INTERVAL_MS (sys._current_frames), and
+- spans are recorded for SQL statements, outbound HTTP (requests), child
+  processes (ffmpeg, yt-dlp post-processing), LLM calls and any
+  metrics.stage_timer() stage (PDF extraction, Whisper, ...).
+
+HTTP and child-process spans come from a profile function
+(sys.setprofile) installed on the profiled request's thread only, while it
+runs; no library class is patched and other threads are untouched. None of
+the hooks are installed unless profiling is possible at all (ADMIN_TOKEN
+set or PROFILE_SAMPLE_RATE > 0).
+
+The result is written to PROFILE_DIR as a speedscope file (one sampled
+profile plus one timeline per span kind) and the response gets an
+X-Profile-Id header. Admins list and download profiles at
+/api/admin/profiles and /api/admin/profiles/<id> (open the file at
+https://www.speedscope.app). The admin endpoints are disabled unless
+ADMIN_TOKEN is set.
+"""
+import glob
+import hmac
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from pagination import parse_limit
+
+log = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'sla-profiles')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000.0
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+ENABLED = bool(ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+MAX_SPAN_LABEL = 200
+
+
+class ProfileSession:
+    def __init__(self, thread_id, label):
+        self.id = uuid.uuid4().hex[:16]
+        self.thread_id = thread_id
+        self.label = label
+        self.started = time.perf_counter()
+        self.created_at = time.time()
+        self.samples = []       # [(elapsed seconds, stack tuple root->leaf)]
+        self.spans = []         # [(kind, label, start, end)] relative to `started`
+        self._last_sample = self.started
+        self.previous_profiler = None
+
+    def add_sample(self, now, stack):
+        self.samples.append((now - self._last_sample, stack))
+        self._last_sample = now
+
+    def add_span(self, kind, label, start, end):
+        self.spans.append((kind, str(label)[:MAX_SPAN_LABEL], start - self.started, end - self.started))
+
+
+_active = {}                    # thread id -> ProfileSession
+_active_lock = threading.Lock()
+_wake = threading.Event()
+_sampler = None
+_sampler_pid = None
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return (code.co_name, code.co_filename, code.co_firstlineno)
+
+
+def _sample_loop():
+    while True:
+        if not _active:
+            _wake.wait()
+            _wake.clear()
+            continue
+        time.sleep(PROFILE_INTERVAL)
+        frames = sys._current_frames()
+        now = time.perf_counter()
+        for thread_id, session in list(_active.items()):
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_key(frame))
+                frame = frame.f_back
+            stack.reverse()
+            session.add_sample(now, tuple(stack))
+
+
+def _ensure_sampler():
+    global _sampler, _sampler_pid
+    if _sampler is not None and _sampler_pid == os.getpid() and _sampler.is_alive():
+        return
+    with _active_lock:
+        if _sampler is not None and _sampler_pid == os.getpid() and _sampler.is_alive():
+            return
+        _sampler_pid = os.getpid()
+        _sampler = threading.Thread(target=_sample_loop, name='profile-sampler', daemon=True)
+        _sampler.start()
+
+
+def start(label) -> ProfileSession:
+    """Profile the calling thread until stop(session) is called on it."""
+    session = ProfileSession(threading.get_ident(), label)
+    _ensure_sampler()
+    with _active_lock:
+        _active[session.thread_id] = session
+    _wake.set()
+    session.previous_profiler = sys.getprofile()
+    sys.setprofile(_call_spans(session))
+    return session
+
+
+def stop(session: ProfileSession):
+    if threading.get_ident() == session.thread_id:
+        sys.setprofile(session.previous_profiler)
+    with _active_lock:
+        _active.pop(session.thread_id, None)
+    session.ended = time.perf_counter()
+
+
+@contextmanager
+def span(kind, label):
+    """Record a timeline span on the current thread's profile (no-op when not profiling)."""
+    session = _active.get(threading.get_ident())
+    if session is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        session.add_span(kind, label, start_time, time.perf_counter())
+
+
+# --- speedscope export --------------------------------------------------------
+
+def _nest(spans):
+    """Order spans for an evented profile; clip any that overlap their parent without nesting."""
+    events, stack = [], []
+    for kind, label, start, end in sorted(spans, key=lambda s: (s[2], -s[3])):
+        while stack and stack[-1][1] <= start:
+            events.append(('C',) + stack.pop())
+        if stack:
+            end = min(end, stack[-1][1])
+        events.append(('O', label, start))
+        stack.append((label, end))
+    while stack:
+        events.append(('C',) + stack.pop())
+    return events
+
+
+def to_speedscope(session: ProfileSession, meta: dict) -> dict:
+    frames, index = [], {}
+
+    def frame_id(key):
+        if key not in index:
+            index[key] = len(frames)
+            name, filename, line = key
+            frames.append({'name': name, 'file': filename, 'line': line})
+        return index[key]
+
+    duration_ms = (session.ended - session.started) * 1000
+    profiles = [{
+        'type': 'sampled',
+        'name': f"{session.label} (stack samples)",
+        'unit': 'milliseconds',
+        'startValue': 0,
+        'endValue': duration_ms,
+        'samples': [[frame_id(k) for k in stack] for _, stack in session.samples],
+        'weights': [round(dt * 1000, 3) for dt, _ in session.samples],
+    }]
+    for kind in sorted({s[0] for s in session.spans}):
+        events = []
+        for kind_event in _nest([s for s in session.spans if s[0] == kind]):
+            typ, label, at = kind_event
+            events.append({'type': typ, 'frame': frame_id((f'{kind}: {label}', kind, 0)), 'at': round(at * 1000, 3)})
+        profiles.append({
+            'type': 'evented',
+            'name': f"{session.label} ({kind} spans)",
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': duration_ms,
+            'events': events,
+        })
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': session.label,
+        'exporter': 'smart-learning-assistant profiling',
+        'activeProfileIndex': 0,
+        'shared': {'frames': frames},
+        'profiles': profiles,
+        'metadata': meta,
+    }
+
+
+def summarize(session: ProfileSession, **extra) -> dict:
+    totals = {}
+    for kind, _, start, end in session.spans:
+        entry = totals.setdefault(kind, {'count': 0, 'ms': 0.0})
+        entry['count'] += 1
+        entry['ms'] = round(entry['ms'] + (end - start) * 1000, 3)
+    slowest = sorted(session.spans, key=lambda s: s[3] - s[2], reverse=True)[:10]
+    return {
+        'id': session.id,
+        'label': session.label,
+        'created_at': session.created_at,
+        'duration_ms': round((session.ended - session.started) * 1000, 3),
+        'samples': len(session.samples),
+        'span_totals': totals,
+        'slowest_spans': [{'kind': k, 'label': l, 'ms': round((e - s) * 1000, 3)} for k, l, s, e in slowest],
+        **extra,
+    }
+
+
+def save(session: ProfileSession, **extra) -> dict:
+    meta = summarize(session, **extra)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{session.id}.speedscope.json')
+    fd, tmp = tempfile.mkstemp(dir=PROFILE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(to_speedscope(session, meta), fh)
+    os.replace(tmp, path)
+    _prune()
+    return meta
+
+
+def _profile_files():
+    return sorted(glob.glob(os.path.join(PROFILE_DIR, '*.speedscope.json')), key=os.path.getmtime, reverse=True)
+
+
+def _prune():
+    for path in _profile_files()[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def list_profiles(limit=50):
+    out = []
+    for path in _profile_files()[:limit]:
+        try:
+            with open(path) as fh:
+                out.append(json.load(fh).get('metadata') or {})
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def profile_path(profile_id):
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f'{profile_id}.speedscope.json')
+    return path if os.path.exists(path) else None
+
+
+# --- automatic spans for SQL, HTTP and child processes ------------------------
+
+_timed_calls = None             # code object -> (span kind, frame -> label)
+
+
+def _http_label(frame):
+    request = frame.f_locals.get('request')
+    return f'{request.method} {request.url.split("?")[0]}' if request is not None else 'request'
+
+
+def _process_label(frame):
+    argv = getattr(frame.f_locals.get('self'), 'args', None)
+    return os.path.basename(str(argv[0] if isinstance(argv, (list, tuple)) else argv).split()[0])
+
+
+def _get_timed_calls():
+    global _timed_calls
+    if _timed_calls is None:
+        import requests
+        _timed_calls = {
+            requests.Session.send.__code__: ('http', _http_label),
+            subprocess.Popen.communicate.__code__: ('subprocess', _process_label),
+            subprocess.Popen.wait.__code__: ('subprocess', _process_label),
+        }
+    return _timed_calls
+
+
+def _call_spans(session: ProfileSession):
+    """A sys.setprofile function recording a span for each call to one of the timed library functions."""
+    timed = _get_timed_calls()
+    running = {}                # frame -> (kind, label function, start)
+    processes = set()           # Popen objects with a span open (communicate() calls wait())
+
+    def profiler(frame, event, arg):
+        if event == 'call':
+            target = timed.get(frame.f_code)
+            if target is None:
+                return
+            if target[0] == 'subprocess':
+                process = frame.f_locals.get('self')
+                # Popen.__exit__ waits again on a process that has already exited
+                if id(process) in processes or getattr(process, 'returncode', None) is not None:
+                    return
+                processes.add(id(process))
+            running[frame] = (*target, time.perf_counter())
+        elif event == 'return' and running:
+            pending = running.pop(frame, None)
+            if pending is not None:
+                kind, label, started = pending
+                if kind == 'subprocess':
+                    processes.discard(id(frame.f_locals.get('self')))
+                session.add_span(kind, label(frame), started, time.perf_counter())
+
+    return profiler
+
+
+def _instrument_sqlalchemy():
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() in _active:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        session = _active.get(threading.get_ident())
+        started = conn.info.get('profile_started')
+        if session is not None and started:
+            session.add_span('db', ' '.join(statement.split()), started.pop(), time.perf_counter())
+
+
+# --- Flask integration ----------------------------------------------------------
+
+def _is_admin(request):
+    if not ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get('X-Admin-Token') or ''
+    auth = request.headers.get('Authorization', '')
+    if not supplied and auth.lower().startswith('bearer '):
+        supplied = auth.split(' ', 1)[1].strip()
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+def init_app(app):
+    """Register the admin download endpoints and, when profiling is enabled, the per-request hooks."""
+    from flask import jsonify, request, send_file
+
+    if ENABLED:
+        _instrument_sqlalchemy()
+        _register_request_hooks(app)
+
+    @app.route('/api/admin/profiles', methods=['GET'])
+    def admin_list_profiles():
+        if not _is_admin(request):
+            return jsonify({'error': 'Forbidden'}), 403
+        return jsonify({'profiles': list_profiles(parse_limit(request.args.get('limit'), 50, 500))})
+
+    @app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+    def admin_download_profile(profile_id):
+        if not _is_admin(request):
+            return jsonify({'error': 'Forbidden'}), 403
+        path = profile_path(profile_id)
+        if not path:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, mimetype='application/json', as_attachment=True,
+                         download_name=os.path.basename(path))
+
+
+def _register_request_hooks(app):
+    from flask import g, request
+
+    @app.before_request
+    def _maybe_start_profile():
+        wanted = request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes') and _is_admin(request)
+        if wanted or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+            g.profile_session = start(f'{request.method} {request.path}')
+
+    @app.after_request
+    def _finish_profile(response):
+        session = g.pop('profile_session', None)
+        if session is None:
+            return response
+        stop(session)
+        try:
+            route = request.url_rule.rule if request.url_rule else None
+            save(session, method=request.method, path=request.path, route=route, status=response.status_code)
+            response.headers['X-Profile-Id'] = session.id
+        except Exception as exc:
+            log.warning("Could not save profile %s: %s", session.id, exc)
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        # after_request is skipped when a handler raises; don't leave the thread registered
+        session = g.pop('profile_session', None)
+        if session is not None:
+            stop(session)
@@ -0,0 +1,122 @@
+"""
+Question bank: generated quiz questions kept per source text and reused.
+
+A quiz request first takes questions for its source (sha256 of the
+normalized text) that this learner has not been served yet, least-served
+first, and asks the LLM only for the shortfall. New questions go into the
+bank (add) for the next learner; the generation depends only on the source
+and the size of the shortfall, so learners asking at the same time share
+it, and serve() then records what each one was given. Anonymous requests
+have no history and get the least-served questions.
+
+Near-duplicates are caught by the Jaccard similarity of the questions'
+content words (question-template words dropped, plural/tense endings
+stripped): a question at least QUESTION_BANK_NEAR_DUPLICATE_SIMILARITY
+(default 0.4) similar to one already in the quiz or the bank is the same
+question, so a reworded repeat from the model is rejected like an exact
+one. On the corpus in bench/data/quiz_near_duplicates.json (python -m
+bench.near_duplicates) rewordings have a median similarity of 0.71 and
+different questions on the same source 0.1; at 0.4 under 2% of either
+kind of pair lands on the wrong side. A source's bank stays in the
+hundreds of questions, so the sets are built from the stored text on each
+request.
+"""
+import hashlib
+import logging
+import os
+import re
+
+from sqlalchemy import exists, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, QuestionBankItem, QuestionBankServe
+from singleflight import normalize_text
+from unit_of_work import insert_rows, unit_of_work
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv('QUESTION_BANK', 'on').lower() not in ('0', 'off', 'false')
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv('QUESTION_BANK_NEAR_DUPLICATE_SIMILARITY', '0.4'))
+
+_WORD = re.compile(r'\w+')
+# Question-template words would otherwise make unrelated questions look alike
+_STOPWORDS = frozenset((
+    "a an and are as at be by does do for from how in is it its of on or that the this to was what when "
+    "where which who why with according text based information following best most statement describes context "
+    "did were been into during after have has had whose whom"
+).split())
+_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+
+def source_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def fingerprint(text: str) -> frozenset:
+    """The content words of a question, crudely stemmed."""
+    return frozenset(_stem(t) for t in _WORD.findall((text or '').lower()) if t not in _STOPWORDS)
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two fingerprints."""
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def is_near_duplicate(fingerprint: frozenset, fingerprints,
+                      threshold: float = NEAR_DUPLICATE_SIMILARITY) -> bool:
+    return any(similarity(fingerprint, other) >= threshold for other in fingerprints)
+
+
+def take(source: str, user_id, limit: int):
+    """Up to `limit` bank questions for `source` not yet served to `user_id`, least-served first."""
+    query = QuestionBankItem.query.filter_by(source_hash=source)
+    if user_id is not None:
+        query = query.filter(~exists().where(QuestionBankServe.user_id == user_id,
+                                             QuestionBankServe.item_id == QuestionBankItem.id))
+    return query.order_by(QuestionBankItem.times_served, QuestionBankItem.created_at).limit(limit).all()
+
+
+def fingerprints(source: str):
+    """Fingerprint of every bank question for `source`; new questions near any of them are repeats."""
+    return [fingerprint(question)
+            for question, in db.session.query(QuestionBankItem.question).filter_by(source_hash=source)]
+
+
+def add(source: str, new_items):
+    """Store newly generated questions for `source`; serve() counts them as they are handed out."""
+    if not new_items:
+        return
+    with unit_of_work():
+        insert_rows(QuestionBankItem, [{
+            'id': item['id'],
+            'source_hash': source,
+            'topic': (item.get('topic') or 'General')[:100],
+            'question': item['question'],
+            'options': item['options'],
+            'correct_answer': item['correctAnswer'],
+            'times_served': 0,
+        } for item in new_items])
+
+
+def serve(user_id, item_ids):
+    """Count bank questions as served, and to the learner when there is one, in one commit."""
+    if not item_ids:
+        return
+    try:
+        with unit_of_work():
+            db.session.execute(
+                update(QuestionBankItem).where(QuestionBankItem.id.in_(item_ids))
+                .values(times_served=QuestionBankItem.times_served + 1)
+                .execution_options(synchronize_session=False))
+            if user_id is not None:
+                insert_rows(QuestionBankServe, [{'user_id': user_id, 'item_id': item_id} for item_id in item_ids])
+    except IntegrityError as exc:
+        # The same learner's concurrent request served these first; the quiz itself is still fine
+        log.info("Question bank serve skipped: %s", exc.orig)
@@ -0,0 +1,218 @@
+"""
+Quiz items out of an LLM completion as it streams.
+
+The quiz prompt asks for `{"title": "...", "items": [{...}, ...]}` (a bare
+array of items is accepted too). QuizStreamParser scans the completion one
+chunk at a time and hands back each item object the moment its closing
+brace arrives, so a client can show the first question while the model is
+still writing the fifth, and a truncated or partly malformed completion
+still yields every item that closed cleanly. Prose or code fences around
+the JSON are skipped.
+
+QuizCollector applies the normalization rules (normalize_item) to those
+items, drops near-duplicates (see question_bank.py) of questions already
+in the quiz or the bank and tracks how many are still `missing`,
+which is what the quiz handler asks the model for in a follow-up call
+instead of regenerating the whole quiz.
+"""
+import json
+import uuid
+
+import metrics
+from question_bank import fingerprint, is_near_duplicate
+
+QUIZ_ITEMS = metrics.registry.counter(
+    'quiz_items_total', 'Quiz items parsed from LLM completions by outcome', ('outcome',))
+
+
+def normalize_item(raw):
+    """A quiz item with a question, exactly 4 unique options and correctAnswer 0-3, or None."""
+    if not isinstance(raw, dict):
+        return None
+    q = str(raw.get('question', '')).strip()
+    options = raw.get('options', [])
+    correct_answer = raw.get('correctAnswer', 0)
+    topic = str(raw.get('topic') or 'General').strip()
+
+    if not q or not isinstance(options, list) or len(options) != 4:
+        return None
+    options = [str(opt).strip() for opt in options if str(opt).strip()]
+    if len(options) != 4:
+        return None
+    # bool is an int subclass; true/false is not an answer index
+    if not isinstance(correct_answer, int) or isinstance(correct_answer, bool) or not (0 <= correct_answer <= 3):
+        return None
+    if len(set(options)) != 4:
+        return None
+
+    return {
+        'id': raw.get('id') or str(uuid.uuid4()),
+        'question': q,
+        'options': options,
+        'correctAnswer': correct_answer,
+        'topic': topic,
+    }
+
+
+class QuizStreamParser:
+    """Incremental scanner for one completion; feed() returns ('title', str) and ('item', dict or None) events."""
+
+    def __init__(self):
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._root = None           # '{' or '[' once the JSON has started
+        self._items_depth = None    # stack depth inside the items array
+        self._key = None            # last key read in the root object
+        self._expect_key = False
+        self._capture = None        # 'item', 'key' or 'title' while copying characters
+        self._captured = []
+        self.closed = False
+
+    def feed(self, chunk: str):
+        events = []
+        for ch in chunk:
+            if self.closed:
+                break
+            if self._capture is not None:
+                self._captured.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._capture in ('key', 'title'):
+                        self._end_string(events)
+                continue
+
+            if self._root is None:
+                if ch in '{[':
+                    self._root = ch
+                    self._stack.append(ch)
+                    self._expect_key = ch == '{'
+                    self._items_depth = 1 if ch == '[' else None
+                continue
+
+            depth = len(self._stack)
+            in_root_object = depth == 1 and self._root == '{'
+            if ch == '"':
+                self._in_string = True
+                if in_root_object and self._capture is None:
+                    if self._expect_key:
+                        self._start_capture('key', ch)
+                    elif self._key == 'title':
+                        self._start_capture('title', ch)
+            elif ch in '{[':
+                if ch == '{' and depth == self._items_depth and self._stack[-1] == '[':
+                    self._start_capture('item', ch)
+                elif ch == '[' and in_root_object and self._key == 'items':
+                    self._items_depth = 2
+                self._stack.append(ch)
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+                depth = len(self._stack)
+                if self._capture == 'item' and depth == self._items_depth:
+                    events.append(('item', self._end_item()))
+                elif ch == ']' and self._items_depth is not None and depth == self._items_depth - 1:
+                    self._items_depth = None
+                if not self._stack:
+                    self.closed = True
+            elif ch == ':' and in_root_object:
+                self._expect_key = False
+            elif ch == ',' and in_root_object:
+                self._expect_key = True
+        return events
+
+    def _start_capture(self, kind, ch):
+        self._capture = kind
+        self._captured = [ch]
+
+    def _take(self):
+        text = ''.join(self._captured)
+        self._capture, self._captured = None, []
+        return text
+
+    def _end_string(self, events):
+        kind = self._capture
+        try:
+            value = json.loads(self._take())
+        except ValueError:
+            return
+        if kind == 'key':
+            self._key = value
+            self._expect_key = False
+        else:
+            events.append(('title', value))
+
+    def _end_item(self):
+        try:
+            return json.loads(self._take())
+        except ValueError:
+            return None
+
+
+class QuizCollector:
+    """Valid, distinct quiz items gathered across one or more completions, up to `wanted`."""
+
+    def __init__(self, wanted: int = 0):
+        self.wanted = wanted
+        self.items = []
+        self.title = None
+        self.rejected = 0
+        self._known = []            # fingerprint of every question the quiz must not repeat
+        self._parser = QuizStreamParser()
+        self._fed = 0
+
+    @property
+    def missing(self) -> int:
+        return max(0, self.wanted - len(self.items))
+
+    def preload(self, known):
+        """`known` fingerprints (e.g. the question bank's) count as already asked."""
+        self._known.extend(known)
+
+    def start(self):
+        """Begin a new completion."""
+        self._parser = QuizStreamParser()
+        self._fed = 0
+
+    def feed(self, chunk: str):
+        """Accepted ('title', str) / ('item', dict) events for the next piece of the current completion."""
+        self._fed += len(chunk)
+        return self._accept(self._parser.feed(chunk))
+
+    def finish(self, text: str):
+        """Feed whatever part of the complete `text` was not streamed through feed()."""
+        return self.feed(text[self._fed:]) if len(text) > self._fed else []
+
+    def _accept(self, events):
+        accepted = []
+        for kind, value in events:
+            if kind == 'title':
+                if self.title is None and isinstance(value, str) and value.strip():
+                    self.title = value.strip()
+                    accepted.append(('title', self.title))
+                continue
+            if not self.missing:
+                QUIZ_ITEMS.inc(outcome='extra')
+                continue
+            item = normalize_item(value)
+            if item is None:
+                self.rejected += 1
+                QUIZ_ITEMS.inc(outcome='invalid')
+                continue
+            words = fingerprint(item['question'])
+            if is_near_duplicate(words, self._known):
+                QUIZ_ITEMS.inc(outcome='duplicate')
+                continue
+            # Ids are ours: models copy the prompt's placeholder, and the id is also the bank key
+            item['id'] = str(uuid.uuid4())
+            self._known.append(words)
+            self.items.append(item)
+            QUIZ_ITEMS.inc(outcome='accepted')
+            accepted.append(('item', item))
+        return accepted
@@ -0,0 +1,307 @@
+"""
+Retention for chat_history and quiz_scores.
+
+Rows older than RETENTION_CHAT_HISTORY_DAYS / RETENTION_QUIZ_SCORES_DAYS
+(default 0: keep everything live) move to chat_history_archive /
+quiz_scores_archive, so the live tables that every history, analytics and
+search query runs over stay bounded. Each batch of RETENTION_BATCH_SIZE
+rows is one transaction:
+
+- `DELETE ... WHERE id IN (oldest ids) RETURNING *` on the live table, so
+  two processes never move the same row;
+- INSERT into the archive, whose message text and answers are compressed
+  (compression.py);
+- for quiz scores, add the rows to the user's quiz_rollups, so the totals
+  readers add to the live rows (dashboard, analytics, skill map) never
+  count a score twice or lose one.
+
+Partitioning: on PostgreSQL the archive tables are partitioned by month on
+created_at (created on demand), and RETENTION_ARCHIVE_DAYS drops whole
+partitions once they are older; elsewhere (SQLite) they are plain tables
+and expired rows are deleted in batches. The rollups are kept either way.
+The live tables stay unpartitioned: focus_area_dismissals references
+quiz_scores.id, and a partitioned table's primary key would have to include
+created_at.
+
+Rollup kinds, per user:
+
+  all      every archived score: quizzes, score_sum (dashboard total, average)
+  subject  the same per quiz_subject() (dashboard mastery chart)
+  active   archived scores that were not dismissed: quizzes, questions,
+           correct, last_score (per-user analytics)
+  topic    per answer_topic() of those scores: questions, correct, last_at
+           (skill map)
+
+A dismissal is applied when its score is archived and then dropped;
+archived scores can no longer be dismissed. Chat history pages continue
+into the archive (pagination.keyset_pages); search and the Feynman session
+context only see live messages.
+
+`Compactor` runs `run_once()` every RETENTION_INTERVAL seconds in each web
+process once a policy is set; on PostgreSQL a transaction-level advisory
+lock lets one process at a time move rows. `flask retention-run` runs one
+pass, `flask retention-worker` runs the loop in the foreground.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, text, tuple_
+
+import metrics
+from models import db, ChatHistory, ChatHistoryArchive, FocusAreaDismissal, QuizRollup, QuizScore, QuizScoreArchive
+from unit_of_work import insert_rows, unit_of_work
+
+log = logging.getLogger(__name__)
+
+CHAT_HISTORY_DAYS = int(os.getenv('RETENTION_CHAT_HISTORY_DAYS', '0'))
+QUIZ_SCORES_DAYS = int(os.getenv('RETENTION_QUIZ_SCORES_DAYS', '0'))
+ARCHIVE_DAYS = int(os.getenv('RETENTION_ARCHIVE_DAYS', '0'))  # 0: keep archived rows
+BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '1000'))
+INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))
+
+NAME_MAX_CHARS = 500
+_ADVISORY_LOCK = 0x5e7e_0049
+
+ARCHIVED = metrics.registry.counter('retention_rows_archived_total', 'Rows moved to archive tables', ['table'])
+PURGED = metrics.registry.counter('retention_rows_purged_total',
+                                  'Archived rows deleted after RETENTION_ARCHIVE_DAYS', ['table'])
+
+
+def quiz_subject(title) -> str:
+    """Dashboard subject of a quiz title ("Quiz on photosynthesis" -> "Photosynthesis")."""
+    return (title or 'General').lower().replace('quiz on ', '').replace(' quiz', '').strip().title()
+
+
+def answer_topic(answer) -> str:
+    return str(answer.get('topic') or 'general').strip().lower() or 'general'
+
+
+def rollups(user_id):
+    """{kind: {name: QuizRollup}} for a user's archived quiz scores ('all' and 'active' use the name '')."""
+    found = {'all': {}, 'subject': {}, 'active': {}, 'topic': {}}
+    for rollup in QuizRollup.query.filter_by(user_id=user_id):
+        found.setdefault(rollup.kind, {})[rollup.name] = rollup
+    return found
+
+
+def delete_quiz_history(user_id):
+    """Delete a user's archived quiz scores and rollups (no commit); the live rows are the caller's."""
+    QuizScoreArchive.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    QuizRollup.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+
+# --- Moving rows ---------------------------------------------------------------
+
+def _locked(session) -> bool:
+    """Take the compaction lock for this transaction (PostgreSQL); False if another process holds it."""
+    if session.get_bind().dialect.name != 'postgresql':
+        return True  # SQLite: the DELETE takes the database write lock
+    return bool(session.execute(text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': _ADVISORY_LOCK}).scalar())
+
+
+def _month(ts):
+    return datetime(ts.year, ts.month, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _ensure_partitions(session, model, timestamps):
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    table = model.__tablename__
+    for month in sorted({_month(ts) for ts in timestamps}):
+        session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"))
+
+
+def _take_oldest(model, cutoff, batch_size):
+    """DELETE up to batch_size rows older than cutoff from a live table, returning them."""
+    table = model.__table__
+    oldest = select(table.c.id).where(table.c.created_at < cutoff).order_by(table.c.id).limit(batch_size)
+    return db.session.execute(delete(table).where(table.c.id.in_(oldest)).returning(*table.c)).all()
+
+
+def _archive(archive_model, rows, now):
+    _ensure_partitions(db.session, archive_model, [row.created_at for row in rows])
+    insert_rows(archive_model, [{**row._mapping, 'archived_at': now} for row in rows])
+
+
+def archive_chat_history(cutoff, batch_size=BATCH_SIZE):
+    """Move one batch of chat messages older than cutoff to the archive. Returns the number moved."""
+    with unit_of_work():
+        if not _locked(db.session):
+            return 0
+        rows = _take_oldest(ChatHistory, cutoff, batch_size)
+        if rows:
+            _archive(ChatHistoryArchive, rows, datetime.utcnow())
+    ARCHIVED.inc(len(rows), table='chat_history')
+    return len(rows)
+
+
+def _rollup_deltas(rows, dismissed):
+    """{(user_id, kind, name): {'quizzes', 'questions', 'correct', 'score_sum', 'last'}} for archived score rows."""
+    deltas = {}
+
+    def add(row, kind, name='', last_score=None, **counts):
+        delta = deltas.setdefault((row.user_id, kind, name[:NAME_MAX_CHARS]),
+                                  {'quizzes': 0, 'questions': 0, 'correct': 0, 'score_sum': 0.0, 'last': None})
+        for column, value in counts.items():
+            delta[column] += value
+        if delta['last'] is None or row.created_at >= delta['last'][0]:
+            delta['last'] = (row.created_at, last_score)
+
+    for row in rows:
+        add(row, 'all', quizzes=1, score_sum=row.score_percentage)
+        add(row, 'subject', quiz_subject(row.quiz_title), quizzes=1, score_sum=row.score_percentage)
+        if row.id in dismissed:
+            continue
+        add(row, 'active', last_score=row.score_percentage, quizzes=1,
+            questions=row.total_questions, correct=row.correct_answers)
+        answers = row.answers_data if isinstance(row.answers_data, list) else []
+        for answer in answers:
+            if isinstance(answer, dict):
+                add(row, 'topic', answer_topic(answer), questions=1, correct=int(bool(answer.get('isCorrect'))))
+    return deltas
+
+
+def _apply_rollups(deltas):
+    user_ids = {user_id for user_id, _, _ in deltas}
+    existing = {(r.user_id, r.kind, r.name): r for r in QuizRollup.query.filter(QuizRollup.user_id.in_(user_ids))}
+    for key, delta in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            user_id, kind, name = key
+            rollup = QuizRollup(user_id=user_id, kind=kind, name=name, quizzes=0, questions=0, correct=0, score_sum=0.0)
+            db.session.add(rollup)
+        rollup.quizzes += delta['quizzes']
+        rollup.questions += delta['questions']
+        rollup.correct += delta['correct']
+        rollup.score_sum += delta['score_sum']
+        last_at, last_score = delta['last']
+        if rollup.last_at is None or last_at >= rollup.last_at:
+            rollup.last_at, rollup.last_score = last_at, last_score
+
+
+def archive_quiz_scores(cutoff, batch_size=BATCH_SIZE):
+    """Move one batch of quiz scores older than cutoff to the archive and their totals to the rollups."""
+    with unit_of_work():
+        if not _locked(db.session):
+            return 0
+        dismissals = FocusAreaDismissal.__table__
+        oldest = (select(QuizScore.id).where(QuizScore.created_at < cutoff)
+                  .order_by(QuizScore.id).limit(batch_size).scalar_subquery())
+        # Dismissals reference the scores, so they go first
+        dismissed = set(db.session.execute(delete(dismissals).where(dismissals.c.quiz_score_id.in_(oldest))
+                                           .returning(dismissals.c.quiz_score_id)).scalars())
+        rows = _take_oldest(QuizScore, cutoff, batch_size)
+        if rows:
+            _archive(QuizScoreArchive, rows, datetime.utcnow())
+            _apply_rollups(_rollup_deltas(rows, dismissed))
+    ARCHIVED.inc(len(rows), table='quiz_scores')
+    return len(rows)
+
+
+# --- Expiring archived rows -----------------------------------------------------
+
+def _purge(archive_model, cutoff, batch_size):
+    """Delete archived rows older than cutoff: whole expired partitions on PostgreSQL, batches elsewhere."""
+    table = archive_model.__tablename__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        partitions = db.session.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table"), {'table': table}).scalars().all()
+        purged = 0
+        for partition in sorted(partitions):
+            try:
+                month = datetime.strptime(partition.rsplit('_p', 1)[1], '%Y%m')
+            except (IndexError, ValueError):
+                continue
+            if _next_month(month) <= cutoff:
+                with unit_of_work():
+                    purged += db.session.execute(text(f'SELECT count(*) FROM {partition}')).scalar()
+                    db.session.execute(text(f'DROP TABLE {partition}'))
+                log.info("Dropped archive partition %s", partition)
+        PURGED.inc(purged, table=table)
+        return purged
+
+    columns = archive_model.__table__.c
+    purged = 0
+    while True:
+        # Archived ids are unique only together with created_at (ids freed by the live table may be reused)
+        expired = select(columns.id, columns.created_at).where(columns.created_at < cutoff).limit(batch_size)
+        with unit_of_work():
+            deleted = db.session.execute(delete(archive_model.__table__).where(
+                tuple_(columns.id, columns.created_at).in_(expired))).rowcount
+        purged += deleted
+        if deleted < batch_size:
+            break
+    PURGED.inc(purged, table=table)
+    return purged
+
+
+def run_once(chat_days=None, quiz_days=None, archive_days=None, batch_size=BATCH_SIZE, now=None):
+    """One retention pass: archive everything past its policy, then expire old archive rows. Returns counts."""
+    now = now or datetime.utcnow()
+    chat_days = CHAT_HISTORY_DAYS if chat_days is None else chat_days
+    quiz_days = QUIZ_SCORES_DAYS if quiz_days is None else quiz_days
+    archive_days = ARCHIVE_DAYS if archive_days is None else archive_days
+    started = time.perf_counter()
+    totals = {}
+    for table, days, move in (('chat_history', chat_days, archive_chat_history),
+                              ('quiz_scores', quiz_days, archive_quiz_scores)):
+        if days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        totals[table] = 0
+        while True:
+            moved = move(cutoff, batch_size)
+            totals[table] += moved
+            if moved < batch_size:
+                break
+    if archive_days > 0:
+        cutoff = now - timedelta(days=archive_days)
+        for model in (ChatHistoryArchive, QuizScoreArchive):
+            totals[f'{model.__tablename__}_purged'] = _purge(model, cutoff, batch_size)
+    totals['seconds'] = round(time.perf_counter() - started, 2)
+    log.info("Retention pass: %s", totals)
+    return totals
+
+
+def enabled() -> bool:
+    return CHAT_HISTORY_DAYS > 0 or QUIZ_SCORES_DAYS > 0 or ARCHIVE_DAYS > 0
+
+
+class Compactor:
+    """Runs run_once() every `interval` seconds on a daemon thread of this process."""
+
+    def __init__(self, app, interval: float = INTERVAL):
+        self.app = app
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        if not enabled() or (self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run_forever, name='retention-compactor', daemon=True)
+            self._thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    run_once()
+            except Exception as exc:
+                log.exception("Retention pass failed: %s", exc)
+            time.sleep(self.interval)
@@ -0,0 +1,182 @@
+"""
+Schema objects that `db.create_all()` does not handle.
+
+create_all() only creates missing tables, so a column or index added to a
+model later never reaches an existing database, and dialect-specific
+objects cannot be declared on the models at all. `upgrade()` runs after
+create_all() in ensure_schema() and is idempotent, and
+serialized across workers by an advisory lock on PostgreSQL so that each
+worker inspects the schema only after the previous one has committed:
+
+- adds model columns missing from an existing table (ALTER TABLE ADD
+  COLUMN; they must be nullable or have a server_default) and runs the
+  column's one-off backfill from _BACKFILLS;
+- creates any model index that is missing on an existing table;
+- on PostgreSQL, converts columns that became compressed (compression.py)
+  from text/json to bytea, keeping their values as plain UTF-8 for
+  `flask compress-columns` to compress, and sets lz4 TOAST compression on
+  chat_history.ai_response. SQLite stores the bytes in the existing
+  columns as they are;
+- builds the chat history full-text index: an external-content FTS5 table
+  kept in sync by triggers on SQLite, a GIN expression index over
+  to_tsvector() on PostgreSQL. Other databases (or SQLite without FTS5)
+  fall back to LIKE scans; see chat_search.py.
+"""
+import logging
+import threading
+
+from sqlalchemy import LargeBinary, inspect, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from compression import compressed_columns
+from models import db
+
+log = logging.getLogger(__name__)
+
+SEARCH_LANGUAGE = 'english'
+
+_ADVISORY_LOCK = 0x5e7e_0048
+
+# Must match the indexed expression exactly or PostgreSQL will not use the index
+CHAT_TSVECTOR = (f"to_tsvector('{SEARCH_LANGUAGE}', coalesce(user_message, '') || ' ' || "
+                 f"coalesce(ai_response, ''))")
+
+_SQLITE_FTS = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+        user_message, ai_response, content='chat_history', content_rowid='id',
+        tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_ai AFTER INSERT ON chat_history BEGIN
+        INSERT INTO chat_history_fts(rowid, user_message, ai_response)
+        VALUES (new.id, new.user_message, new.ai_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_ad AFTER DELETE ON chat_history BEGIN
+        INSERT INTO chat_history_fts(chat_history_fts, rowid, user_message, ai_response)
+        VALUES ('delete', old.id, old.user_message, old.ai_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_au AFTER UPDATE OF user_message, ai_response ON chat_history BEGIN
+        INSERT INTO chat_history_fts(chat_history_fts, rowid, user_message, ai_response)
+        VALUES ('delete', old.id, old.user_message, old.ai_response);
+        INSERT INTO chat_history_fts(rowid, user_message, ai_response)
+        VALUES (new.id, new.user_message, new.ai_response);
+    END""",
+)
+
+# (table, column) -> UPDATE run once, after that column (and the others missing) was added
+_BACKFILLS = {
+    ('chat_sessions', 'message_count'): """
+        UPDATE chat_sessions SET
+            message_count = (SELECT count(*) FROM chat_history h WHERE h.session_id = chat_sessions.id),
+            last_message_at = (SELECT max(h.created_at) FROM chat_history h WHERE h.session_id = chat_sessions.id),
+            last_preview = (SELECT substr(h.ai_response, 1, 200) FROM chat_history h
+                            WHERE h.session_id = chat_sessions.id
+                            ORDER BY h.created_at DESC, h.id DESC LIMIT 1)
+    """,
+}
+
+_search_backend = None
+_lock = threading.Lock()
+
+
+def upgrade(engine=None):
+    """Bring an existing database up to the models plus the extra objects above."""
+    global _search_backend
+    engine = engine or db.engine
+    with _lock, engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Held until commit; every check below must run after it is taken
+            conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _ADVISORY_LOCK})
+        _add_missing_columns(conn)
+        _create_missing_indexes(conn)
+        if conn.dialect.name == 'sqlite':
+            _search_backend = _create_sqlite_fts(conn)
+        elif conn.dialect.name == 'postgresql':
+            _convert_compressed_columns(conn)
+            conn.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS ix_chat_history_search ON chat_history USING GIN ({CHAT_TSVECTOR})")
+            _search_backend = 'tsvector'
+        else:
+            _search_backend = 'like'
+    log.info("Schema upgraded; chat search backend: %s", _search_backend)
+
+
+def search_backend() -> str:
+    """'fts5', 'tsvector' or 'like' (before upgrade() has run: 'like')."""
+    return _search_backend or 'like'
+
+
+def _add_missing_columns(conn):
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    preparer = conn.dialect.identifier_preparer
+    backfills = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+                  f"{column.type.compile(conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            log.info("Adding column %s.%s", table.name, column.name)
+            conn.exec_driver_sql(ddl)
+            if (table.name, column.name) in _BACKFILLS:
+                backfills.append(_BACKFILLS[table.name, column.name])
+    # After every column exists: a backfill may fill several new columns at once
+    for backfill in backfills:
+        conn.exec_driver_sql(backfill)
+
+
+def _create_missing_indexes(conn):
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables or not table.indexes:
+            continue
+        present = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in present:
+                log.info("Creating index %s on %s", index.name, table.name)
+                index.create(bind=conn, checkfirst=True)
+
+
+def _convert_compressed_columns(conn):
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    preparer = conn.dialect.identifier_preparer
+    for table, column in compressed_columns(db.metadata):
+        if table.name not in existing_tables:
+            continue
+        reflected = {col['name']: col['type'] for col in inspector.get_columns(table.name)}
+        if column.name not in reflected or isinstance(reflected[column.name], LargeBinary):
+            continue
+        name = preparer.format_column(column)
+        log.info("Converting %s.%s to bytea", table.name, column.name)
+        conn.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ALTER COLUMN {name} TYPE BYTEA "
+                             f"USING convert_to({name}::text, 'UTF8')")
+    if conn.dialect.server_version_info >= (14,):
+        try:
+            # The search index reads ai_response in SQL, so it is compressed by the server instead
+            with conn.begin_nested():
+                conn.exec_driver_sql("ALTER TABLE chat_history ALTER COLUMN ai_response SET COMPRESSION lz4")
+        except DBAPIError as exc:
+            log.warning("lz4 column compression unavailable: %s", exc)
+
+
+def _create_sqlite_fts(conn):
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history_fts'").first()
+    try:
+        for statement in _SQLITE_FTS:
+            conn.exec_driver_sql(statement)
+    except OperationalError as exc:
+        log.warning("SQLite FTS5 unavailable, chat search falls back to LIKE: %s", exc)
+        return 'like'
+    if not exists:
+        # First run against an existing database: index the rows written so far
+        conn.exec_driver_sql("INSERT INTO chat_history_fts(chat_history_fts) VALUES ('rebuild')")
+    return 'fts5'
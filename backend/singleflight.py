@@ -0,0 +1,300 @@
+"""
+Single-flight coalescing of identical expensive requests.
+
+`flight.do(key, fn)` runs `fn` once per key at a time:
+
+- Within a worker, concurrent callers with the same key wait on the leader's
+  Future and share its result (or exception).
+- Across workers, the leader claims a row in `inflight_requests`; leaders in
+  other workers that find the row poll it and return the published result
+  instead of repeating the work. Results stay readable for
+  SINGLEFLIGHT_RESULT_TTL seconds, which also absorbs a burst of requests
+  that arrive just after the first one finished.
+
+`await flight.do_async(key, coro_fn)` is the ASGI counterpart; it coalesces
+callers on the same event loop only.
+
+`flight.stream(key, fn)` is do() for streamed responses: fn(emit) runs
+through do() on a background thread, and every concurrent caller with the
+key iterates the events it emits, replayed from the first, followed by
+`.result`. Callers that end up following do() (a leader in another worker,
+or a do() caller already running) get no events, only the result.
+
+Cross-worker sharing needs JSON-serializable results and an app context.
+The leader's lock is a SINGLEFLIGHT_LOCK_TTL (default 30s) lease that a
+background thread renews while fn() runs, so the lock of a worker that was
+killed mid-flight is taken over within that time. A caller never waits
+longer than SINGLEFLIGHT_WAIT (default 120s, about one request's budget;
+each flight may set its own) before doing the work itself.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import db, InflightRequest
+
+log = logging.getLogger(__name__)
+
+LOCK_TTL = int(os.getenv('SINGLEFLIGHT_LOCK_TTL', '30'))
+RESULT_TTL = int(os.getenv('SINGLEFLIGHT_RESULT_TTL', '30'))
+WAIT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_WAIT', '120'))
+POLL_INTERVAL = float(os.getenv('SINGLEFLIGHT_POLL_INTERVAL', '0.5'))
+CROSS_WORKER = os.getenv('SINGLEFLIGHT_CROSS_WORKER', 'true').lower() in ('1', 'true', 'yes')
+
+SINGLEFLIGHT_CALLS = metrics.registry.counter(
+    'singleflight_calls_total', 'Coalesced calls by flight and role (leader, local, shared, timeout)',
+    ('flight', 'role'))
+
+
+def make_key(*parts) -> str:
+    """Stable hash of the normalized inputs identifying one unit of work."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join((text or '').split())
+
+
+class SingleFlight:
+    def __init__(self, name, cross_worker=CROSS_WORKER, lock_ttl=LOCK_TTL, result_ttl=RESULT_TTL,
+                 wait_timeout=WAIT_TIMEOUT, poll_interval=POLL_INTERVAL):
+        self.name = name
+        self.cross_worker = cross_worker
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._streams = {}
+
+    def do(self, key, fn, publish_if=None):
+        """Run fn() once per key; `publish_if(result)` False keeps a result from other workers (e.g. errors)."""
+        key = make_key(self.name, key)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role='local')
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                log.warning("Gave up waiting for the local %s leader of %s; running it here", self.name, key[:12])
+                SINGLEFLIGHT_CALLS.inc(flight=self.name, role='timeout')
+                return fn()
+
+        try:
+            result = self._run_shared(key, fn, publish_if)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def do_async(self, key, coro_fn):
+        """Await coro_fn() once per key among concurrent callers on this event loop."""
+        key = make_key(self.name, key)
+        task = self._tasks.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role='leader')
+            task = self._tasks[key] = asyncio.ensure_future(coro_fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role='local')
+        # A caller that disconnects must not cancel the work the others are waiting on
+        return await asyncio.shield(task)
+
+    def stream(self, key, fn, publish_if=None, context=contextlib.nullcontext):
+        """Replay of fn(emit) run once per key; `context()` wraps the background run (e.g. app.app_context)."""
+        stream_key = make_key(self.name, key)
+        with self._lock:
+            replay = self._streams.get(stream_key)
+            leader = replay is None
+            if leader:
+                replay = self._streams[stream_key] = Replay()
+        if not leader:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role='local')
+            return replay
+
+        def run():
+            try:
+                with context():
+                    replay.finish(result=self.do(key, lambda: fn(replay.emit), publish_if))
+            except BaseException as exc:
+                replay.finish(error=exc)
+            finally:
+                with self._lock:
+                    self._streams.pop(stream_key, None)
+
+        # A reader that disconnects must not stop the work the others are reading
+        threading.Thread(target=run, name=f'{self.name}-stream', daemon=True).start()
+        return replay
+
+    # --- cross-worker coordination -------------------------------------------
+
+    def _run_shared(self, key, fn, publish_if):
+        if not self.cross_worker:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role='leader')
+            return fn()
+
+        owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                state, result = self._acquire(key, owner)
+            except Exception as exc:
+                # The lock table is an optimisation; never fail the request because of it
+                log.warning("single-flight lock for %s unavailable: %s", self.name, exc)
+                SINGLEFLIGHT_CALLS.inc(flight=self.name, role='leader')
+                return fn()
+            if state == 'acquired':
+                break
+            if state == 'done':
+                SINGLEFLIGHT_CALLS.inc(flight=self.name, role='shared')
+                return result
+            if time.monotonic() >= deadline:
+                log.warning("Gave up waiting for %s owner of %s; running it here", self.name, key[:12])
+                SINGLEFLIGHT_CALLS.inc(flight=self.name, role='timeout')
+                return fn()
+            time.sleep(self.poll_interval)
+
+        SINGLEFLIGHT_CALLS.inc(flight=self.name, role='leader')
+        try:
+            with self._renewing(key, owner):
+                result = fn()
+        except BaseException:
+            self._release(key, owner)
+            raise
+        if publish_if is None or publish_if(result):
+            self._publish(key, owner, result)
+        else:
+            self._release(key, owner)
+        return result
+
+    def _acquire(self, key, owner):
+        """Returns ('acquired', None), ('done', result) or ('busy', None)."""
+        table = InflightRequest.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.key == key, table.c.expires_at < now))
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(
+                    key=key, owner=owner, status='running', created_at=now,
+                    expires_at=now + timedelta(seconds=self.lock_ttl)))
+            return 'acquired', None
+        except IntegrityError:
+            pass
+        with db.engine.connect() as conn:
+            row = conn.execute(table.select().where(table.c.key == key)).first()
+        if row is not None and row.status == 'done':
+            return 'done', json.loads(row.result)
+        return 'busy', None
+
+    @contextlib.contextmanager
+    def _renewing(self, key, owner):
+        """Extend the lease every third of its TTL until the block exits."""
+        app = current_app._get_current_object()
+        stop = threading.Event()
+
+        def renew():
+            table = InflightRequest.__table__
+            with app.app_context():
+                while not stop.wait(self.lock_ttl / 3):
+                    try:
+                        with db.engine.begin() as conn:
+                            held = conn.execute(table.update().where(
+                                table.c.key == key, table.c.owner == owner, table.c.status == 'running').values(
+                                expires_at=datetime.utcnow() + timedelta(seconds=self.lock_ttl))).rowcount
+                    except Exception as exc:
+                        log.warning("Could not renew %s lock: %s", self.name, exc)
+                        continue
+                    if not held:
+                        log.warning("Lost the %s lock on %s to another worker", self.name, key[:12])
+                        return
+
+        thread = threading.Thread(target=renew, name=f'{self.name}-lease', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _publish(self, key, owner, result):
+        table = InflightRequest.__table__
+        now = datetime.utcnow()
+        try:
+            encoded = json.dumps(result)
+        except (TypeError, ValueError):
+            self._release(key, owner)
+            return
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.update().where(table.c.key == key, table.c.owner == owner).values(
+                    status='done', result=encoded, expires_at=now + timedelta(seconds=self.result_ttl)))
+                conn.execute(table.delete().where(table.c.expires_at < now))
+        except Exception as exc:
+            log.warning("Could not publish %s result: %s", self.name, exc)
+
+    def _release(self, key, owner):
+        table = InflightRequest.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key, table.c.owner == owner))
+        except Exception as exc:
+            log.warning("Could not release %s lock: %s", self.name, exc)
+
+
+class Replay:
+    """Events emitted by one run, each reader iterating them from the first; then `result` or `error`."""
+
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self._events = []
+        self._done = False
+        self._cond = threading.Condition()
+
+    def emit(self, event):
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._cond:
+            self.result, self.error, self._done = result, error, True
+            self._cond.notify_all()
+
+    def __iter__(self):
+        seen = 0
+        while True:
+            with self._cond:
+                while seen == len(self._events) and not self._done:
+                    self._cond.wait()
+                events = self._events[seen:]
+                seen += len(events)
+                done = self._done
+            yield from events
+            if done and seen == len(self._events):
+                return
@@ -0,0 +1,226 @@
+"""
+Spaced-repetition review scheduling (SM-2) from quiz answers.
+
+Each learner has one ReviewState per topic. Every quiz submission is a
+review of the topics it covered, graded 0-5 by the share answered
+correctly (`grade()`), and moves the state one SM-2 step:
+
+- grade >= 3: the interval grows 1 day, 6 days, then interval * ease, up
+  to REVIEW_MAX_INTERVAL_DAYS;
+- grade < 3: a lapse, repetitions restart and the topic is due tomorrow;
+- ease moves by 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02), floor 1.3.
+
+`record_quiz()` applies that step in the submit_quiz transaction, so the
+state is always current and `due()` is a range scan over the
+(user_id, due_at) index instead of a rescan of the learner's history. It
+locks the learner's existing states (FOR UPDATE on PostgreSQL) and works in
+a savepoint: when a concurrent submission creates the same new topic first,
+only the savepoint is rolled back and the step is retried against that
+row, so the quiz score itself is never lost.
+
+`recompute()` rebuilds every state from QuizScore.answers_data, archived
+scores included (after
+changing the parameters, or to repair drift). It works on users in batches
+and is vectorized with numpy: all cards of a batch take their k-th review
+together, so the Python loop runs once per review depth rather than once
+per review. Run it with `flask review-recompute`.
+"""
+import itertools
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, QuizScore, QuizScoreArchive, ReviewState, User
+from lazy_imports import lazy_import
+from unit_of_work import insert_rows, unit_of_work
+
+np = lazy_import('numpy')
+
+log = logging.getLogger(__name__)
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+PASSING_GRADE = 3
+TOPIC_MAX_CHARS = 255
+# Intervals grow geometrically; without a ceiling a well-known topic is never seen again
+MAX_INTERVAL_DAYS = int(os.getenv('REVIEW_MAX_INTERVAL_DAYS', '365'))
+
+
+def grade(correct: int, total: int) -> int:
+    """SM-2 response quality 0-5 from the share of a topic's questions answered correctly."""
+    return round(5 * correct / total) if total else 0
+
+
+def review(ease: float, interval: int, repetitions: int, quality: int):
+    """One SM-2 step: (ease, interval_days, repetitions, lapsed)."""
+    lapsed = quality < PASSING_GRADE
+    if lapsed:
+        repetitions, interval = 0, 1
+    else:
+        interval = 1 if repetitions == 0 else 6 if repetitions == 1 else math.ceil(interval * ease)
+        interval = min(interval, MAX_INTERVAL_DAYS)
+        repetitions += 1
+    miss = 5 - quality
+    ease = max(MIN_EASE, ease + 0.1 - miss * (0.08 + miss * 0.02))
+    return ease, interval, repetitions, lapsed
+
+
+def record_quiz(user_id, per_topic_counts, reviewed_at=None):
+    """Advance the learner's state for each topic of one submission ({topic: {'total', 'correct'}}). Does not commit."""
+    reviewed_at = reviewed_at or datetime.utcnow()
+    counts = {}
+    for topic, c in per_topic_counts.items():
+        key = topic[:TOPIC_MAX_CHARS]
+        merged = counts.setdefault(key, {'total': 0, 'correct': 0})
+        merged['total'] += c['total']
+        merged['correct'] += c['correct']
+    for attempt in range(2):
+        try:
+            with db.session.begin_nested():
+                _advance(user_id, counts, reviewed_at)
+            return
+        except IntegrityError:
+            # Another submission inserted one of these topics after we looked; it is committed by now
+            if attempt:
+                log.warning("Review state for user %s kept conflicting; `flask review-recompute` repairs it",
+                            user_id)
+
+
+def _existing_states(user_id, topics):
+    # Row locks keep concurrent submissions from both advancing a topic from the same old state
+    return {s.topic: s for s in ReviewState.query.filter(
+        ReviewState.user_id == user_id, ReviewState.topic.in_(topics)
+    ).with_for_update().populate_existing()}
+
+
+def _advance(user_id, counts, reviewed_at):
+    existing = _existing_states(user_id, list(counts))
+    for topic, c in counts.items():
+        state = existing.get(topic)
+        if state is None:
+            state = ReviewState(user_id=user_id, topic=topic, ease=INITIAL_EASE, interval_days=0,
+                                repetitions=0, lapses=0, correct=0, total=0)
+            db.session.add(state)
+        quality = grade(c['correct'], c['total'])
+        state.ease, state.interval_days, state.repetitions, lapsed = review(
+            state.ease, state.interval_days, state.repetitions, quality)
+        state.lapses += int(lapsed)
+        state.correct += c['correct']
+        state.total += c['total']
+        state.last_grade = quality
+        state.last_reviewed_at = reviewed_at
+        state.due_at = reviewed_at + timedelta(days=state.interval_days)
+    db.session.flush()
+
+
+def due(user_id, now=None, limit=20):
+    """(states due by `now`, most overdue first, and the next due_at after them or None)."""
+    now = now or datetime.utcnow()
+    states = (ReviewState.query.filter(ReviewState.user_id == user_id, ReviewState.due_at <= now)
+              .order_by(ReviewState.due_at).limit(limit).all())
+    upcoming = (db.session.query(ReviewState.due_at)
+                .filter(ReviewState.user_id == user_id, ReviewState.due_at > now)
+                .order_by(ReviewState.due_at).limit(1).scalar())
+    return states, upcoming
+
+
+def _topic_counts(answers):
+    counts = {}
+    for answer in answers or ():
+        if not isinstance(answer, dict):
+            continue
+        topic = str(answer.get('topic') or 'general')[:TOPIC_MAX_CHARS]
+        c = counts.setdefault(topic, [0, 0])
+        c[0] += 1
+        c[1] += bool(answer.get('isCorrect'))
+    return counts
+
+
+def _replay(card, quality, reviewed_at, n_cards):
+    """Vectorized SM-2 over events sorted by (card, time); returns per-card state arrays."""
+    first = np.searchsorted(card, np.arange(n_cards))
+    depth = np.arange(len(card)) - first[card]
+
+    ease = np.full(n_cards, INITIAL_EASE)
+    interval = np.zeros(n_cards, dtype=np.int64)
+    repetitions = np.zeros(n_cards, dtype=np.int64)
+    lapses = np.zeros(n_cards, dtype=np.int64)
+    for k in range(int(depth.max()) + 1 if len(depth) else 0):
+        at = depth == k
+        c, q = card[at], quality[at]
+        lapsed = q < PASSING_GRADE
+        grown = np.where(repetitions[c] == 0, 1,
+                         np.where(repetitions[c] == 1, 6, np.ceil(interval[c] * ease[c]).astype(np.int64)))
+        interval[c] = np.where(lapsed, 1, np.minimum(grown, MAX_INTERVAL_DAYS))
+        repetitions[c] = np.where(lapsed, 0, repetitions[c] + 1)
+        lapses[c] += lapsed
+        miss = 5 - q
+        ease[c] = np.maximum(MIN_EASE, ease[c] + 0.1 - miss * (0.08 + miss * 0.02))
+
+    last = np.searchsorted(card, np.arange(n_cards), side='right') - 1
+    return ease, interval, repetitions, lapses, quality[last], reviewed_at[last]
+
+
+def recompute(batch_size=500):
+    """Rebuild every learner's ReviewState from quiz history. Returns counts for the CLI."""
+    started = time.perf_counter()
+    user_ids = sorted({uid for model in (QuizScoreArchive, QuizScore)
+                       for uid, in db.session.query(User.id).join(model, model.user_id == User.id).distinct()})
+    totals = {'users': 0, 'topics': 0, 'reviews': 0}
+    for i in range(0, len(user_ids), batch_size):
+        batch = user_ids[i:i + batch_size]
+        # Archived scores are all older than the live ones (retention.py), so each card's reviews stay in order
+        rows = itertools.chain(*(
+            db.session.query(model.user_id, model.created_at, model.answers_data)
+            .filter(model.user_id.in_(batch))
+            .order_by(model.user_id, model.created_at, model.id)
+            for model in (QuizScoreArchive, QuizScore)))
+
+        cards, card, correct, total, reviewed_at = {}, [], [], [], []
+        for user_id, created_at, answers in rows:
+            for topic, (n, ok) in _topic_counts(answers).items():
+                card.append(cards.setdefault((user_id, topic), len(cards)))
+                total.append(n)
+                correct.append(ok)
+                reviewed_at.append(created_at)
+
+        states = []
+        if cards:
+            card = np.asarray(card)
+            # Stable: each card's reviews stay in submission order
+            order = np.argsort(card, kind='stable')
+            card = card[order]
+            correct = np.asarray(correct)[order]
+            total = np.asarray(total)[order]
+            reviewed_at = np.asarray(reviewed_at, dtype='datetime64[us]')[order]
+            quality = np.rint(5 * correct / total).astype(np.int64)
+
+            ease, interval, repetitions, lapses, last_grade, last_at = _replay(card, quality, reviewed_at, len(cards))
+            correct_sum = np.bincount(card, weights=correct, minlength=len(cards)).astype(np.int64)
+            total_sum = np.bincount(card, weights=total, minlength=len(cards)).astype(np.int64)
+            due_at = last_at + interval.astype('timedelta64[D]')
+
+            for (user_id, topic), j in cards.items():
+                states.append({
+                    'user_id': user_id, 'topic': topic, 'ease': float(ease[j]),
+                    'interval_days': int(interval[j]), 'repetitions': int(repetitions[j]),
+                    'lapses': int(lapses[j]), 'correct': int(correct_sum[j]), 'total': int(total_sum[j]),
+                    'last_grade': int(last_grade[j]), 'last_reviewed_at': last_at[j].item(),
+                    'due_at': due_at[j].item(),
+                })
+
+        with unit_of_work():
+            ReviewState.query.filter(ReviewState.user_id.in_(batch)).delete(synchronize_session=False)
+            if states:
+                insert_rows(ReviewState, states)
+        totals['users'] += len(batch)
+        totals['topics'] += len(cards)
+        totals['reviews'] += len(card)
+        log.info("Recomputed review state for %d/%d users", min(i + batch_size, len(user_ids)), len(user_ids))
+
+    totals['seconds'] = round(time.perf_counter() - started, 2)
+    return totals
@@ -0,0 +1,74 @@
+"""
+Import-time profile of the backend (`python -X importtime` breakdown).
+
+Runs `import app` in a fresh interpreter with -X importtime and groups the
+per-module timings by top-level package, so it is easy to see which
+dependency a worker pays for at fork/restart. Exposed as
+`flask --app app startup-profile`.
+"""
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+
+def parse_importtime(stderr: str):
+    """Return [(module, self_us, cumulative_us, depth)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            _, rest = line.split(':', 1)
+            self_us, cumulative_us, name = rest.split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile_startup(module: str = 'app', preload: str = None, cwd: str = None) -> dict:
+    env = dict(os.environ)
+    if preload is not None:
+        env['PRELOAD_SUBSYSTEMS'] = preload
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    rows = parse_importtime(proc.stderr)
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split('.')[0]] += self_us
+
+    return {
+        'module': module,
+        'ok': proc.returncode == 0,
+        'error': proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        'wall_seconds': round(wall, 3),
+        'import_seconds': round(sum(r[1] for r in rows) / 1e6, 3),
+        'modules_imported': len(rows),
+        'packages': sorted(
+            ({'package': pkg, 'self_ms': round(us / 1000, 1)} for pkg, us in by_package.items()),
+            key=lambda p: p['self_ms'], reverse=True
+        ),
+    }
+
+
+def format_report(report: dict, top: int = 25) -> str:
+    lines = [
+        f"import {report['module']}: {report['import_seconds']:.3f}s in imports, "
+        f"{report['wall_seconds']:.3f}s wall, {report['modules_imported']} modules"
+    ]
+    if not report['ok']:
+        lines.append(f"  import failed: {report['error']}")
+    lines.append(f"{'package':<32} {'self ms':>10}")
+    for entry in report['packages'][:top]:
+        lines.append(f"{entry['package']:<32} {entry['self_ms']:>10.1f}")
+    return '\n'.join(lines)
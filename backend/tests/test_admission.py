@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+import admission
+
+
+def test_bucket_created_after_now_is_full():
+    now = time.monotonic()
+    bucket = admission.RateLimiter(1.0, 2, now + 5)
+    assert bucket.take(now) == 0.0
+    assert bucket.take(now) == 0.0
+    assert bucket.take(now) > 0
+
+
+def test_first_request_of_new_user_is_admitted():
+    cost_class = admission.CostClass('whisper', concurrency=2, max_queue=8, max_wait=1.0,
+                                     rate_per_minute=20, user_rate_per_minute=4, user_burst=1)
+    admitted_at = cost_class.admit('10.0.0.1', 1)
+    cost_class.release(admitted_at)
+    with pytest.raises(admission.Rejected) as rejected:
+        cost_class.admit('10.0.0.1', 1)
+    assert rejected.value.reason == 'rate_limited_user'
+
+
+def test_default_burst_allows_a_classroom_behind_one_address():
+    cost_class = admission.CostClass('llm', concurrency=8, max_queue=32, max_wait=1.0,
+                                     rate_per_minute=240, user_rate_per_minute=20)
+    for _ in range(9):
+        cost_class.release(cost_class.admit('203.0.113.7', 1))
+
+
+def test_uncharged_requests_skip_the_buckets():
+    cost_class = admission.CostClass('export', concurrency=2, max_queue=4, max_wait=1.0,
+                                     rate_per_minute=60, user_rate_per_minute=12, user_burst=1)
+    cost_class.release(cost_class.admit('user-1', 0))
+    for _ in range(10):
+        cost_class.release(cost_class.admit('user-1', 0, charge=False))
+    with pytest.raises(admission.Rejected):
+        cost_class.admit('user-1', 0)
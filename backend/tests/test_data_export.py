@@ -0,0 +1,32 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import data_export
+from models import QuizScore
+from pagination import InvalidCursor, encode_cursor
+
+
+def _issued_cursor():
+    return data_export._cursor('quiz_scores', QuizScore, SimpleNamespace(created_at=datetime(2024, 1, 1), id=7))
+
+
+def test_only_signed_cursors_count_as_issued():
+    cursor = _issued_cursor()
+    forged = f"quiz_scores.quiz_scores.{encode_cursor(datetime(1970, 1, 1), 0)}"
+
+    assert data_export.issued(cursor)
+    assert not data_export.issued(forged)
+    assert not data_export.issued(cursor.rsplit('.', 1)[0] + '.' + 'A' * 16)
+    assert not data_export.issued(None)
+
+
+def test_signed_and_unsigned_cursors_resume_at_their_row():
+    cursor = _issued_cursor()
+    types = ['quiz_scores']
+
+    assert data_export._position(types, cursor) == (1, (datetime(2024, 1, 1), 7))
+    assert data_export._position(types, cursor.rsplit('.', 1)[0]) == (1, (datetime(2024, 1, 1), 7))
+    with pytest.raises(InvalidCursor):
+        data_export._position(['chat_history'], cursor)
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+import llm_providers
+import llm_router
+
+
+class FakeProvider(llm_providers.Provider):
+    def __init__(self, name, latency):
+        self.name = self.model = name
+        self.latency = latency
+
+    def chat(self, messages, temperature, max_tokens):
+        time.sleep(self.latency)
+        return f'{self.name} answer', {'prompt_tokens': 1, 'completion_tokens': 1}
+
+    async def chat_async(self, messages, temperature, max_tokens):
+        await asyncio.sleep(self.latency)
+        return f'{self.name} answer', {'prompt_tokens': 1, 'completion_tokens': 1}
+
+
+def _hedging_router(primary, backup):
+    router = llm_router.Router([primary, backup], min_samples=1, explore=0, hedge_callers=['qa'],
+                               hedge_min_delay=0.01)
+    # The primary looks fastest to the router but has since become slow
+    router.record('qa', 0, 0.001, True)
+    router.record('qa', 1, 0.5, True)
+    return router
+
+
+def test_answered_by_names_the_candidate_that_answered():
+    router = llm_router.Router([FakeProvider('nvidia', 0), FakeProvider('llama_cpp', 0)], explore=0)
+    router.record('plan', 0, 1.0, True)
+    router.record('plan', 1, 0.1, True)
+    router.min_samples = 1
+
+    assert router.chat('plan', [], 0.7, 100) == 'llama_cpp answer'
+    assert llm_router.answered_by() == 'llama_cpp'
+
+
+def test_answered_by_follows_the_winning_hedge():
+    router = _hedging_router(FakeProvider('slow', 0.5), FakeProvider('backup', 0))
+    assert router.chat('qa', [], 0.7, 100) == 'backup answer'
+    assert llm_router.answered_by() == 'backup'
+
+
+def test_answered_by_follows_the_winning_async_hedge():
+    router = _hedging_router(FakeProvider('slow', 0.5), FakeProvider('backup', 0))
+
+    async def call():
+        content = await router.chat_async('qa', [], 0.7, 100)
+        return content, llm_router.answered_by()
+
+    assert asyncio.run(call()) == ('backup answer', 'backup')
@@ -0,0 +1,60 @@
+import smtplib
+from email.message import EmailMessage
+
+import pytest
+
+from mailer import EmailDispatcher, SMTPConfig
+
+
+class FakeConnection:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = 0
+        self.closed = False
+
+    def send_message(self, msg):
+        self.sent += 1
+        if self.error is not None:
+            raise self.error
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDispatcher(EmailDispatcher):
+    def __init__(self, connections):
+        super().__init__(None, SMTPConfig(host='localhost', port=25, sender='a@example.com'))
+        self.connections = connections
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = self.connections.pop(0)
+        return self._conn
+
+
+def test_dropped_connection_is_resent_once():
+    stale, fresh = FakeConnection(smtplib.SMTPServerDisconnected('gone')), FakeConnection()
+    dispatcher = FakeDispatcher([stale, fresh])
+    dispatcher._send(EmailMessage())
+    assert (stale.sent, stale.closed, fresh.sent) == (1, True, 1)
+
+
+def test_permanent_rejection_is_not_resent():
+    refused = FakeConnection(smtplib.SMTPRecipientsRefused({'b@example.com': (550, b'no such user')}))
+    second = FakeConnection()
+    dispatcher = FakeDispatcher([refused, second])
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        dispatcher._send(EmailMessage())
+    assert (refused.sent, second.sent) == (1, 0)
+
+
+def test_enqueue_leaves_sending_to_the_email_worker_when_not_inline(database):
+    from models import OutboundEmail
+
+    dispatcher = EmailDispatcher(None, SMTPConfig(host='localhost', port=25, sender='a@example.com'), inline=False)
+    assert dispatcher.enqueue('b@example.com', 'Code', '123456')
+    assert dispatcher._thread is None
+    assert OutboundEmail.query.count() == 1
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+from metrics import Registry
+
+
+def _worker_file(directory, pid, started, requests, in_flight):
+    snapshot = {'pid': pid, 'started': started, 'metrics': {
+        'requests_total': {'kind': 'counter', 'help': 'Requests', 'labelnames': [], 'buckets': [],
+                           'values': [[[], requests]]},
+        'in_flight': {'kind': 'gauge', 'help': 'In flight', 'labelnames': [], 'buckets': [],
+                      'values': [[[], in_flight]]},
+    }}
+    with open(os.path.join(directory, f'{pid}-old.json'), 'w') as fh:
+        json.dump(snapshot, fh)
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _samples(text):
+    return {line.split()[0]: float(line.split()[1]) for line in text.splitlines() if not line.startswith('#')}
+
+
+def test_exited_workers_are_folded_once(tmp_path):
+    registry = Registry(str(tmp_path))
+    registry.counter('requests_total', 'Requests').inc(2)
+    registry.gauge('in_flight', 'In flight').set(1)
+    _worker_file(str(tmp_path), _dead_pid(), 0, requests=3, in_flight=5)
+
+    for _ in range(2):
+        assert _samples(registry.render()) == {'requests_total': 5, 'in_flight': 1}
+    assert set(os.listdir(tmp_path)) == {'.lock', 'exited.json', f'{os.getpid()}-{registry._instance[1]}.json'}
+
+
+def test_reused_pid_does_not_hide_the_previous_worker(tmp_path):
+    registry = Registry(str(tmp_path))
+    registry.counter('requests_total', 'Requests').inc(2)
+    registry.gauge('in_flight', 'In flight').set(1)
+    # An exited worker that had this process's PID
+    _worker_file(str(tmp_path), os.getpid(), 0, requests=3, in_flight=5)
+
+    assert _samples(registry.render()) == {'requests_total': 5, 'in_flight': 1}
@@ -0,0 +1,40 @@
+import http.server
+import subprocess
+import sys
+import threading
+
+import requests
+
+import profiling
+
+
+class _Ok(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_spans_cover_only_the_profiled_thread():
+    server = http.server.HTTPServer(('127.0.0.1', 0), _Ok)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/ping?x=1'
+
+    other = threading.Thread(target=lambda: subprocess.run([sys.executable, '-c', 'pass']))
+    session = profiling.start('test')
+    try:
+        subprocess.run([sys.executable, '-c', 'pass'])
+        requests.get(url, timeout=5)
+        other.start()
+        other.join()
+    finally:
+        profiling.stop(session)
+        server.shutdown()
+
+    assert sys.getprofile() is None
+    kinds = sorted((kind, label) for kind, label, _, _ in session.spans)
+    assert kinds == [('http', f'GET http://127.0.0.1:{server.server_port}/ping'),
+                     ('subprocess', sys.executable.rsplit('/', 1)[-1])]
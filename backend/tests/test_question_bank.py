@@ -0,0 +1,24 @@
+import json
+
+import question_bank
+from bench.near_duplicates import DEFAULT_CORPUS, pairs
+
+
+def _share(pairs_, predicate):
+    return sum(predicate(question_bank.fingerprint(a), question_bank.fingerprint(b)) for a, b in pairs_) / len(pairs_)
+
+
+def test_default_threshold_separates_the_corpus():
+    with open(DEFAULT_CORPUS, encoding='utf-8') as f:
+        same, different = pairs(json.load(f))
+    near = lambda a, b: question_bank.is_near_duplicate(a, [b])
+    assert _share(same, lambda a, b: not near(a, b)) <= 0.05
+    assert _share(different, near) <= 0.05
+
+
+def test_rewording_is_a_repeat():
+    known = [question_bank.fingerprint("Which gas is released as a by-product of photosynthesis?")]
+    assert question_bank.is_near_duplicate(
+        question_bank.fingerprint("What gas do plants release as a by-product of photosynthesis?"), known)
+    assert not question_bank.is_near_duplicate(
+        question_bank.fingerprint("Where in the plant cell do the light-dependent reactions take place?"), known)
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from quiz_stream import QuizCollector, QuizStreamParser, normalize_item
+
+
+def _item(n, question=None):
+    return {'question': question or f'Which planet is number {n} from the sun in our solar system?',
+            'options': [f'Option {n}{letter}' for letter in 'abcd'], 'correctAnswer': n % 4, 'topic': 'Space'}
+
+
+TRICKY = _item(1, 'What does the string "{[\\"}]" print, and is C:\\temp\\ a path?')
+COMPLETION = json.dumps({'title': 'A "quoted" {title}', 'items': [TRICKY, _item(2)]})
+
+
+def _events(chunks):
+    parser = QuizStreamParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_every_chunk_boundary_yields_the_same_events():
+    expected = [('title', 'A "quoted" {title}'), ('item', TRICKY), ('item', _item(2))]
+    assert _events([COMPLETION]) == expected
+    assert _events(list(COMPLETION)) == expected
+    for cut in range(1, len(COMPLETION)):
+        assert _events([COMPLETION[:cut], COMPLETION[cut:]]) == expected, cut
+
+
+def test_prose_and_code_fences_before_the_json_are_skipped():
+    text = 'Sure! Here is your quiz:\n```json\n' + COMPLETION + '\n```\nGood luck {not json}'
+    events = _events([text])
+    assert [kind for kind, _ in events] == ['title', 'item', 'item']
+
+
+def test_truncated_completion_keeps_its_closed_items():
+    truncated = COMPLETION[:COMPLETION.index('Option 2c')]
+    assert _events([truncated]) == [('title', 'A "quoted" {title}'), ('item', TRICKY)]
+
+
+def test_bare_array_root():
+    events = _events([json.dumps([_item(1), _item(2)])])
+    assert events == [('item', _item(1)), ('item', _item(2))]
+
+
+def test_malformed_item_is_reported_and_parsing_continues():
+    text = '{"items": [{"question": "x", oops}, ' + json.dumps(_item(2)) + ']}'
+    assert _events([text]) == [('item', None), ('item', _item(2))]
+
+
+@pytest.mark.parametrize('correct', [True, False, -1, 4, '1', 1.0])
+def test_normalize_item_rejects_bad_correct_answers(correct):
+    assert normalize_item({**_item(1), 'correctAnswer': correct}) is None
+
+
+def test_normalize_item_requires_four_distinct_options():
+    assert normalize_item({**_item(1), 'options': ['a', 'b', 'c']}) is None
+    assert normalize_item({**_item(1), 'options': ['a', 'b', 'c', 'a']}) is None
+    assert normalize_item({**_item(1), 'options': ['a', 'b', 'c', ' ']}) is None
+    assert normalize_item(_item(3))['correctAnswer'] == 3
+
+
+def test_collector_counts_missing_and_finishes_unstreamed_text():
+    collector = QuizCollector(wanted=3)
+    collector.start()
+    half = len(COMPLETION) // 2
+    streamed = collector.feed(COMPLETION[:half])
+    rest = collector.finish(COMPLETION)
+    events = streamed + rest
+    assert [kind for kind, _ in events] == ['title', 'item', 'item']
+    assert collector.title == 'A "quoted" {title}'
+    assert collector.missing == 1
+    assert len({item['id'] for item in collector.items}) == 2
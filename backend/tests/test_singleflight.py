@@ -0,0 +1,107 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from singleflight import SingleFlight, make_key
+
+
+def test_stream_replays_leader_events_to_late_readers():
+    flight = SingleFlight('test', cross_worker=False)
+    release = threading.Event()
+    runs = []
+
+    def work(emit):
+        runs.append(1)
+        emit(('item', 1))
+        release.wait(5)
+        emit(('item', 2))
+        return 'done'
+
+    first = flight.stream('key', work)
+    second = flight.stream('key', work)
+    release.set()
+    assert list(first) == [('item', 1), ('item', 2)]
+    assert list(second) == [('item', 1), ('item', 2)]
+    assert first.result == second.result == 'done'
+    assert runs == [1]
+
+
+def test_stream_follower_of_do_gets_only_the_result():
+    flight = SingleFlight('test', cross_worker=False)
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'shared'
+
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+    leader.start()
+    started.wait(5)
+    replay = flight.stream('key', lambda emit: emit(('item', 'unexpected')))
+    release.set()
+    assert list(replay) == []
+    assert replay.result == 'shared'
+    leader.join()
+
+
+def _worker_flight(**kwargs):
+    # A second instance with the same name stands in for the flight in another worker
+    options = dict(cross_worker=True, lock_ttl=1, result_ttl=30, wait_timeout=10, poll_interval=0.05)
+    options.update(kwargs)
+    return SingleFlight('test', **options)
+
+
+def test_cross_worker_lease_is_renewed_while_the_leader_runs(database):
+    from flask import current_app
+
+    app = current_app._get_current_object()
+    started = threading.Event()
+    runs, results = [], []
+
+    def slow():
+        runs.append('leader')
+        started.set()
+        time.sleep(2.5)  # well past the 1s lease
+        return 'shared'
+
+    def lead():
+        with app.app_context():
+            results.append(_worker_flight().do('key', slow))
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(5)
+    follower = _worker_flight().do('key', lambda: runs.append('follower') or 'duplicate')
+    leader.join()
+    assert follower == 'shared'
+    assert results == ['shared']
+    assert runs == ['leader']
+
+
+def test_cross_worker_lock_of_a_dead_leader_is_taken_over(database):
+    from models import InflightRequest
+
+    now = datetime.utcnow()
+    database.session.add(InflightRequest(key=make_key('test', 'key'), owner='killed-worker', status='running',
+                                         created_at=now, expires_at=now + timedelta(seconds=1)))
+    database.session.commit()
+
+    started = time.monotonic()
+    assert _worker_flight().do('key', lambda: 'recomputed') == 'recomputed'
+    assert time.monotonic() - started < 5
+
+
+def test_follower_stops_waiting_at_its_budget(database):
+    from models import InflightRequest
+
+    now = datetime.utcnow()
+    # A live leader that keeps renewing (expires far ahead) but never finishes
+    database.session.add(InflightRequest(key=make_key('test', 'key'), owner='slow-worker', status='running',
+                                         created_at=now, expires_at=now + timedelta(hours=1)))
+    database.session.commit()
+
+    started = time.monotonic()
+    assert _worker_flight(wait_timeout=0.5).do('key', lambda: 'ran here') == 'ran here'
+    assert time.monotonic() - started < 3
@@ -0,0 +1,80 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import spaced_repetition
+from models import QuizScore, ReviewState, User
+from spaced_repetition import MAX_INTERVAL_DAYS, MIN_EASE, review
+from unit_of_work import unit_of_work
+
+
+def test_review_grows_the_interval_and_restarts_on_a_lapse():
+    ease, interval, repetitions = 2.5, 0, 0
+    intervals = []
+    for _ in range(3):
+        ease, interval, repetitions, lapsed = review(ease, interval, repetitions, 5)
+        intervals.append(interval)
+        assert not lapsed
+    assert intervals == [1, 6, 17]
+
+    ease, interval, repetitions, lapsed = review(ease, interval, repetitions, 1)
+    assert lapsed and (interval, repetitions) == (1, 0)
+
+
+def test_review_clamps_ease_and_interval():
+    assert review(MIN_EASE, 1, 0, 0)[0] == MIN_EASE
+    assert review(2.5, MAX_INTERVAL_DAYS, 5, 5)[1] == MAX_INTERVAL_DAYS
+
+
+def test_vectorized_replay_matches_the_scalar_review():
+    rng = random.Random(7)
+    histories = [[rng.randint(0, 5) for _ in range(rng.randint(1, 30))] for _ in range(50)]
+
+    card = np.repeat(np.arange(len(histories)), [len(h) for h in histories])
+    quality = np.asarray([q for h in histories for q in h], dtype=np.int64)
+    start = np.datetime64('2024-01-01T00:00:00', 'us')
+    reviewed_at = start + np.arange(len(card)).astype('timedelta64[D]')
+    ease, interval, repetitions, lapses, last_grade, _ = spaced_repetition._replay(
+        card, quality, reviewed_at, len(histories))
+
+    for j, history in enumerate(histories):
+        expected = (2.5, 0, 0)
+        expected_lapses = 0
+        for q in history:
+            *expected, lapsed = review(*expected, q)
+            expected_lapses += lapsed
+        assert ease[j] == expected[0]
+        assert (interval[j], repetitions[j], lapses[j], last_grade[j]) == (
+            expected[1], expected[2], expected_lapses, history[-1])
+
+
+def test_record_quiz_survives_a_concurrent_new_topic(database, monkeypatch):
+    user = User(name='learner', email='learner@example.com', password_hash='x')
+    database.session.add(user)
+    database.session.commit()
+    reviewed_at = datetime(2024, 1, 1)
+    # Committed by a concurrent submission after this one looked for existing states
+    database.session.add(ReviewState(user_id=user.id, topic='sql', ease=2.5, interval_days=1, repetitions=1,
+                                     lapses=0, correct=1, total=1, due_at=reviewed_at))
+    database.session.commit()
+
+    lookups = []
+    existing_states = spaced_repetition._existing_states
+
+    def stale_first_lookup(user_id, topics):
+        lookups.append(topics)
+        return {} if len(lookups) == 1 else existing_states(user_id, topics)
+
+    monkeypatch.setattr(spaced_repetition, '_existing_states', stale_first_lookup)
+    score = QuizScore(user_id=user.id, quiz_title='SQL', total_questions=2, correct_answers=2,
+                      score_percentage=100.0, answers_data=[])
+    with unit_of_work():
+        database.session.add(score)
+        spaced_repetition.record_quiz(user.id, {'sql': {'total': 2, 'correct': 2}}, reviewed_at)
+
+    assert len(lookups) == 2
+    assert database.session.get(QuizScore, score.id) is not None
+    state = database.session.get(ReviewState, (user.id, 'sql'))
+    assert (state.repetitions, state.interval_days, state.total) == (2, 6, 3)
+    assert state.due_at == reviewed_at + timedelta(days=6)
@@ -0,0 +1,44 @@
+from models import LearningPath, LearningPathStep, User
+from unit_of_work import increment, unit_of_work, update_if
+
+
+def _path_with_step(db):
+    user = User(name='learner', email='learner@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    path = LearningPath(user_id=user.id, topic='SQL', level='Beginner', total_steps=1, completed_steps=0)
+    db.session.add(path)
+    db.session.flush()
+    step = LearningPathStep(learning_path_id=path.id, step_number=1, title='Joins', is_completed=False)
+    db.session.add(step)
+    db.session.commit()
+    return path.id, step.id
+
+
+def _toggle(db, path_id, step_id, read):
+    with unit_of_work():
+        if update_if(LearningPathStep, step_id, {'is_completed': read}, {'is_completed': not read}):
+            increment(LearningPath, path_id, completed_steps=-1 if read else 1)
+
+
+def test_update_if_applies_a_stale_toggle_once(database):
+    path_id, step_id = _path_with_step(database)
+    # A double click: both requests read is_completed=False before either wrote
+    _toggle(database, path_id, step_id, False)
+    _toggle(database, path_id, step_id, False)
+
+    assert database.session.get(LearningPathStep, step_id).is_completed is True
+    assert database.session.get(LearningPath, path_id).completed_steps == 1
+
+    _toggle(database, path_id, step_id, True)
+    assert database.session.get(LearningPath, path_id).completed_steps == 0
+
+
+def test_update_if_compares_null_columns(database):
+    path_id, step_id = _path_with_step(database)
+    database.session.get(LearningPathStep, step_id).video_watched = None
+    database.session.commit()
+
+    with unit_of_work():
+        assert update_if(LearningPathStep, step_id, {'video_watched': None}, {'video_watched': True})
+    assert database.session.get(LearningPathStep, step_id).video_watched is True
@@ -0,0 +1,106 @@
+"""
+Write path helpers: one transaction per request, set-based writes.
+
+    with unit_of_work():
+        path = LearningPath(...)
+        db.session.add(path)
+        db.session.flush()
+        insert_rows(LearningPathStep, [{'learning_path_id': path.id, ...}, ...])
+        touch_streak(user)
+
+- `unit_of_work()` commits once when the block exits and rolls back if it
+  raises. Nested blocks join the outer one, so helpers can open their own
+  without committing halfway through a request.
+- `insert_rows(model, rows)` is one Core executemany INSERT (psycopg2 sends
+  it as multi-row `INSERT ... VALUES (...), (...)` pages) instead of one
+  round trip per object. It goes through the table rather than the ORM
+  entity: ORM bulk inserts split the rows by which keys are None, which for
+  learning path steps meant one statement per step again.
+- `increment(model, row_id, column=delta)` and `touch_streak(user)` update
+  counters with SQL expressions (`col = col + 1`, CASE) in one UPDATE, so
+  they need no reload of child rows and stay correct under concurrent
+  requests. Neither commits.
+- `update_if(model, row_id, expected, values)` is a compare-and-set: the
+  UPDATE only matches while the row still holds the values the request
+  read, so two concurrent toggles cannot both apply (and both count) the
+  same flip.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, func, insert, or_, update
+
+from models import db, User
+
+_DEPTH = 'unit_of_work_depth'
+
+
+@contextmanager
+def unit_of_work():
+    """Commit the session once at the end of the outermost block; roll back on any error."""
+    session = db.session
+    depth = session.info.get(_DEPTH, 0)
+    session.info[_DEPTH] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except BaseException:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info[_DEPTH] = depth
+
+
+def insert_rows(model, rows):
+    """INSERT all `rows` (dicts of column values) in one executemany; returns how many were sent."""
+    rows = list(rows)
+    if rows:
+        db.session.execute(insert(model.__table__), rows)
+    return len(rows)
+
+
+def increment(model, row_id, values=None, **deltas):
+    """UPDATE model SET col = col + delta, <values> WHERE id = row_id; loaded instances are updated in place."""
+    values = dict(values or {})
+    values.update({name: func.coalesce(getattr(model, name), 0) + delta for name, delta in deltas.items() if delta})
+    if values:
+        db.session.execute(update(model).where(model.id == row_id).values(values),
+                           execution_options={'synchronize_session': 'fetch'})
+
+
+def update_if(model, row_id, expected, values) -> bool:
+    """UPDATE model SET <values> WHERE id = row_id AND <col = expected value...>; True if the row matched."""
+    conditions = [getattr(model, name) == value for name, value in expected.items()]
+    result = db.session.execute(update(model).where(model.id == row_id, *conditions).values(values),
+                                execution_options={'synchronize_session': 'fetch'})
+    return result.rowcount == 1
+
+
+def _streak_update():
+    users = User.__table__
+    streak = case((users.c.last_activity_date == bindparam('yesterday'), func.coalesce(users.c.current_streak, 0) + 1),
+                  else_=1)
+    return (
+        update(users)
+        # The date guard keeps two concurrent requests from both extending the streak
+        .where(users.c.id == bindparam('user_id'),
+               or_(users.c.last_activity_date.is_(None), users.c.last_activity_date != bindparam('today')))
+        .values(current_streak=streak,
+                max_streak=case((streak > func.coalesce(users.c.max_streak, 0), streak), else_=users.c.max_streak),
+                last_activity_date=bindparam('today'), updated_at=bindparam('now')))
+
+
+# Built once: constructing the CASE expression per call cost more than executing it
+_STREAK_UPDATE = _streak_update()
+
+
+def touch_streak(user, today=None):
+    """Count today's activity towards the user's streak (at most once per day)."""
+    today = today or datetime.utcnow().date()
+    if user.last_activity_date == today:
+        return
+    db.session.execute(_STREAK_UPDATE, {'user_id': user.id, 'today': today,
+                                        'yesterday': today - timedelta(days=1), 'now': datetime.utcnow()})
+    db.session.expire(user, ['current_streak', 'max_streak', 'last_activity_date', 'updated_at'])
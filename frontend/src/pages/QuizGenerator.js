@@ -97,6 +97,20 @@ function QuizGenerator() {
 
   const fileInputRef = useRef(null);
 
+  // Signed-in learners get bank questions they have not been served yet
+  const getAuthHeaders = () => {
+    try {
+      const userStr = localStorage.getItem('authUser');
+      const user = userStr ? JSON.parse(userStr) : null;
+      if (user && user.id) {
+        return { 'X-User-Id': user.id };
+      }
+    } catch (e) {
+      console.error("Error parsing auth user", e);
+    }
+    return {};
+  };
+
   const safeText = (val) => {
     if (val == null) return '';
     if (typeof val === 'string' || typeof val === 'number' || typeof val === 'boolean') return String(val);
@@ -109,32 +123,75 @@ function QuizGenerator() {
     setItems([]);
     try {
       const count = Math.max(1, Math.min(20, parseInt(numQuestions || '5', 10) || 5));
-      let res;
+      let init;
       if (pdfFile) {
         const form = new FormData();
         form.append('pdf', pdfFile);
         form.append('numQuestions', String(count));
-        res = await axios.post('http://localhost:5000/api/generate-quiz', form, {
-          headers: { 'Content-Type': 'multipart/form-data' },
-          timeout: 60000 // 60 seconds timeout
-        });
+        init = { method: 'POST', headers: getAuthHeaders(), body: form };
       } else {
-        res = await axios.post('http://localhost:5000/api/generate-quiz', {
-          text,
-          numQuestions: count
-        }, { timeout: 60000 });
+        init = {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', ...getAuthHeaders() },
+          body: JSON.stringify({ text, numQuestions: count })
+        };
       }
 
-      const rawItems = Array.isArray(res.data.items) ? res.data.items.map(ensureId) : [];
-      const received = sanitizeItems(rawItems, safeText);
-      setItems(received);
+      // Server-sent events: each question is shown as soon as the model has written it
+      const controller = new AbortController();
+      const timer = setTimeout(() => controller.abort(), 60000); // 60 seconds timeout
+      let received = 0;
+      let done = null;
+      try {
+        const res = await fetch('http://localhost:5000/api/generate-quiz-stream', { ...init, signal: controller.signal });
+        if (!res.ok) {
+          const body = await res.json().catch(() => ({}));
+          throw new Error(body.error || `Request failed with status ${res.status}`);
+        }
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        const handleEvent = (event, data) => {
+          if (event === 'title' && data) {
+            setGeneratedTitle(data);
+          } else if (event === 'item') {
+            const [item] = sanitizeItems([ensureId(data)], safeText);
+            if (item) {
+              received += 1;
+              setItems(prev => [...prev, item]);
+            }
+          } else if (event === 'error') {
+            throw new Error((data && data.error) || 'Failed to generate quiz.');
+          } else if (event === 'done') {
+            done = data;
+          }
+        };
+        while (!done) {
+          const { value, done: finished } = await reader.read();
+          if (finished) break;
+          buffer += decoder.decode(value, { stream: true });
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+              if (line.startsWith('event:')) event = line.slice(6).trim();
+              else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            handleEvent(event, data ? JSON.parse(data) : null);
+          }
+        }
+      } finally {
+        clearTimeout(timer);
+      }
 
-      // Store the AI-generated title if available
-      if (res.data.title) {
-        setGeneratedTitle(res.data.title);
+      if (done && done.title) {
+        setGeneratedTitle(done.title);
       }
 
-      if (!received.length) setError('No items were returned.');
+      if (!received) setError('No items were returned.');
     } catch (e) {
       const message = extractErrorMessage(e, 'Failed to generate quiz.');
       setError(message);
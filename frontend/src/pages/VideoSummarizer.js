@@ -128,6 +128,7 @@ const VideoSummarizer = () => {
   const [playingId, setPlayingId] = useState(null); // Changed from boolean to ID (null = nothing playing)
   const [loadingId, setLoadingId] = useState(null); // Tracks which ID is currently loading audio
   const audioRef = useRef(new Audio());
+  const summaryTexts = useRef({});
 
 
   useEffect(() => {
@@ -192,13 +193,42 @@ const VideoSummarizer = () => {
     }
   };
 
-  const handleViewSummary = (summary) => {
-    setResult({
-      summary: summary.summary_text,
-      video_id: null,
-      url: summary.video_url
+  // The saved list carries titles only; a summary's text is loaded when it is opened
+  const fetchSummaryText = async (summary) => {
+    if (summaryTexts.current[summary.id] !== undefined) return summaryTexts.current[summary.id];
+    const userStr = localStorage.getItem('authUser');
+    const user = userStr ? JSON.parse(userStr) : null;
+    const res = await axios.get(`http://localhost:5000/api/video/saved/${summary.id}`, {
+      headers: { 'X-User-Id': user?.id }
     });
-    window.scrollTo({ top: 0, behavior: 'smooth' });
+    summaryTexts.current[summary.id] = res.data.summary_text;
+    return res.data.summary_text;
+  };
+
+  const handleViewSummary = async (summary) => {
+    try {
+      const text = await fetchSummaryText(summary);
+      setResult({
+        summary: text,
+        video_id: null,
+        url: summary.video_url
+      });
+      window.scrollTo({ top: 0, behavior: 'smooth' });
+    } catch (e) {
+      setError("Failed to load summary.");
+    }
+  };
+
+  const handlePlaySavedSummary = async (summary) => {
+    if (playingId === summary.id) {
+      handlePlayAudio(null, summary.id);
+      return;
+    }
+    try {
+      handlePlayAudio(await fetchSummaryText(summary), summary.id);
+    } catch (e) {
+      console.error("Failed to load summary", e);
+    }
   };
 
   const StopIcon = () => (
@@ -418,7 +448,7 @@ const VideoSummarizer = () => {
                         </Button>
                         <Button
                           size="small"
-                          onClick={() => handlePlayAudio(summary.summary_text, summary.id)}
+                          onClick={() => handlePlaySavedSummary(summary)}
                           startIcon={playingId !== summary.id && loadingId !== summary.id && <span>🔊</span>}
                           variant={playingId === summary.id ? "contained" : "soft"}
                           color={playingId === summary.id ? "error" : "primary"}
@@ -69,6 +69,7 @@ const VoiceQA = () => {
 
   // History State
   const [sessions, setSessions] = useState([]);
+  const [sessionsCursor, setSessionsCursor] = useState(null);
   const [currentSessionId, setCurrentSessionId] = useState(null);
   const [drawerOpen, setDrawerOpen] = useState(!isMobile);
 
@@ -122,11 +123,27 @@ const VoiceQA = () => {
         headers: getAuthHeaders()
       });
       setSessions(res.data.sessions || []);
+      setSessionsCursor(res.data.next_cursor || null);
     } catch (err) {
       console.error("Failed to fetch sessions", err);
     }
   };
 
+  const loadMoreSessions = async () => {
+    if (!sessionsCursor) return;
+    try {
+      const res = await axios.get(withBase("/api/chat/sessions"), {
+        headers: getAuthHeaders(),
+        params: { cursor: sessionsCursor }
+      });
+      const older = res.data.sessions || [];
+      setSessions(prev => [...prev, ...older.filter(s => !prev.some(p => p.id === s.id))]);
+      setSessionsCursor(res.data.next_cursor || null);
+    } catch (err) {
+      console.error("Failed to fetch more sessions", err);
+    }
+  };
+
   const fetchDocuments = async () => {
     try {
       const res = await axios.get(withBase("/api/documents"), {
@@ -787,10 +804,17 @@ const VoiceQA = () => {
                     fontSize: '0.9rem',
                     fontWeight: currentSessionId === session.id ? 'bold' : 'normal'
                   }}
+                  secondary={session.last_preview || null}
+                  secondaryTypographyProps={{ noWrap: true, fontSize: '0.75rem', color: 'inherit', sx: { opacity: 0.7 } }}
                 />
               </ListItemButton>
             </ListItem>
           ))}
+          {sessionsCursor && (
+            <Box sx={{ px: 2, py: 1, textAlign: 'center' }}>
+              <Button size="small" onClick={loadMoreSessions}>Load older chats</Button>
+            </Box>
+          )}
           {sessions.length === 0 && (
             <Box sx={{ p: 2, textAlign: 'center', color: 'text.secondary' }}>
               <Typography variant="body2">No history yet</Typography>